@@ -1,9 +1,24 @@
 import os
 import logging
-from celery import Celery
-from src.youtube_downloader import YouTubeDownloader
-from diarization import Diarization
-import json
+from celery import Celery, chord
+from kombu import Queue
+import time
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from src.artifact_cache import ArtifactCache, write_json_atomic
+from src.artifact_lifecycle import ArtifactLifecycle, enforce_budget
+from src.protocol_journal import ProtocolJournal, segment_key
+from src.progress import ProgressPublisher
+from src.metrics import metrics
+from src.compute_profiles import configure_threads
+from diarization import DEFAULT_BATCH_SIZE, Diarization, preload_models
 
 # Configure Celery
 app = Celery('celery_task', broker='redis://localhost:6379/0', backend='redis://localhost:6379/0')
@@ -14,49 +29,390 @@ app.conf.update(
     worker_send_task_events=True
 )
 
+# Network-bound and CPU-bound stages are consumed by separate workers
+IO_QUEUE = os.getenv("DIARIZATION_IO_QUEUE", "io")
+CPU_QUEUE = os.getenv("DIARIZATION_CPU_QUEUE", "cpu")
+# Number of diarization turns transcribed by one chunk task
+CHUNK_SIZE = int(os.getenv("DIARIZATION_CHUNK_SIZE", "100"))
+
+# A worker started without -Q consumes every declared queue, so one worker
+# runs whole jobs and splitting the stages across workers stays opt-in
+app.conf.task_queues = [Queue(name) for name in dict.fromkeys([IO_QUEUE, CPU_QUEUE])]
+app.conf.task_default_queue = CPU_QUEUE
+
+app.conf.task_routes = {
+    "*.download_diarize_transcribe": {"queue": IO_QUEUE},
+    "*.diarize_audio": {"queue": CPU_QUEUE},
+    "*.transcribe_turns": {"queue": CPU_QUEUE},
+    "*.transcribe_chunk": {"queue": CPU_QUEUE},
+    "*.merge_protocol": {"queue": CPU_QUEUE},
+}
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+# Set DIARIZATION_PRELOAD_MODELS=1 to load the models before the first task
+PRELOAD_MODELS = os.getenv("DIARIZATION_PRELOAD_MODELS", "0") == "1"
+# Prometheus export of the stage metrics: a textfile collector directory,
+# one file per worker process, and/or an HTTP port for thread and solo pools
+METRICS_DIR = os.getenv("DIARIZATION_METRICS_DIR")
+METRICS_PORT = int(os.getenv("DIARIZATION_METRICS_PORT", "0"))
+
+
+# Concurrency of this worker, set when it starts and inherited by prefork children
+WORKER_CONCURRENCY = 1
+
+
+@worker_process_init.connect
+def preload_models_in_child(**kwargs):
+    """
+    Sizes the torch thread pools and warms the model registry in each prefork
+    child process.
+    """
+    configure_threads(workers=WORKER_CONCURRENCY)
+    if PRELOAD_MODELS:
+        preload_models()
+
+
+@worker_init.connect
+def preload_models_in_worker(sender=None, **kwargs):
+    """
+    Sizes the torch thread pools and warms the model registry for thread and
+    solo pools, which do not fork.
+
+    Concurrent tasks split the CPUs between them, so each gets
+    cpu_count // concurrency intra-op threads.
+    """
+    global WORKER_CONCURRENCY
+    WORKER_CONCURRENCY = getattr(sender, "concurrency", None) or 1
+    if "prefork" in str(getattr(sender, "pool_cls", "")):
+        return
+    configure_threads(workers=WORKER_CONCURRENCY)
+    if PRELOAD_MODELS:
+        preload_models()
+
+
+@worker_init.connect
+def serve_metrics(sender=None, **kwargs):
+    """
+    Serves the stage metrics over HTTP; prefork children use METRICS_DIR instead.
+    """
+    if METRICS_PORT and "prefork" not in str(getattr(sender, "pool_cls", "")):
+        metrics.serve_prometheus(METRICS_PORT)
+
+
+@before_task_publish.connect
+def stamp_published(headers=None, **kwargs):
+    """
+    Stamps outgoing tasks with their publish time to measure queue waits.
+    """
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    published_at = getattr(task.request, "published_at", None)
+    if published_at:
+        metrics.record(
+            "queue_wait",
+            max(0.0, time.time() - published_at),
+            {"task": task.name.rsplit(".", 1)[-1]},
+        )
+
+
+def _metrics_file():
+    return os.path.join(METRICS_DIR, f"diarization_{os.getpid()}.prom")
+
+
+@task_postrun.connect
+def export_metrics(**kwargs):
+    """
+    Rewrites this process's metrics file for the node exporter after every task.
+    """
+    if METRICS_DIR:
+        metrics.write_prometheus(_metrics_file(), {"pid": os.getpid()})
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def remove_metrics_file(**kwargs):
+    """
+    Removes this process's metrics file when it exits, so the node exporter
+    does not keep serving the counters of replaced prefork children.
+    """
+    if METRICS_DIR:
+        try:
+            os.remove(_metrics_file())
+        except FileNotFoundError:
+            pass
+
+
+def _failure(task, stage, error, ref=None):
+    """
+    Records a failed stage and returns the failure result of the job.
+    """
+    logging.error(f"Error in {stage}: {str(error)}")
+    task.update_state(state="FAILURE", meta={"exc_message": str(error)})
+    result = {"status": "failure", "error": str(error)}
+    if ref is not None:
+        _finish(ref, result)
+    return result
+
+
+def _release(ref):
+    """
+    Unpins the directory of a job that has finished or failed.
+    """
+    if ref.get("pin"):
+        ArtifactLifecycle.for_output(ref["output_folder"]).unpin(ref["pin"])
+
+
+def _progress(ref, part=None):
+    """
+    Returns the progress publisher of a job, or None for refs without a job ID.
+    """
+    if ref.get("job_id"):
+        return ProgressPublisher(ref["job_id"], part=part)
+    return None
+
+
+def _finish(ref, result):
+    """
+    Releases a finished or failed job and publishes its final progress event.
+    """
+    _release(ref)
+    progress = _progress(ref)
+    if progress:
+        progress.finish(result)
+    return result
+
+
+def _open_diarization(ref, part=None):
+    """
+    Opens the Diarization of a job from its artifact reference.
+
+    Chunk tasks publish their progress as the part that starts at their first turn.
+    """
+    cache = ArtifactCache.for_output(ref["output_folder"]) if ref["use_cache"] else None
+    return Diarization(
+        ref["pcm_file"],
+        cache=cache,
+        video_id=ref["video_id"],
+        shard_workers=ref.get("shard_workers", 0),
+        profile=ref.get("profile"),
+        progress=_progress(ref, part),
+    )
+
+
+def chunk_journal_path(protocol_json_file, start):
+    """
+    Returns the journal path of the chunk that starts at the given turn.
+    """
+    base, _ = os.path.splitext(protocol_json_file)
+    return f"{base}.part{start:06d}.journal.jsonl"
+
+
 @app.task(bind=True)
-def download_diarize_transcribe(self, url, output_folder):
+def download_diarize_transcribe(
+    self,
+    url,
+    output_folder,
+    mode="segment",
+    batch_size=DEFAULT_BATCH_SIZE,
+    keep_wav=False,
+    use_cache=True,
+    chunk_size=CHUNK_SIZE,
+    shard_workers=0,
+    profile=None,
+    global_speakers=False,
+):
     """
     Celery task to handle downloading, diarizing, and transcribing YouTube audio.
+
+    Downloads on the I/O queue, then replaces itself with the diarization,
+    chunked transcription and merge tasks on the CPU queue. The stages pass
+    a small artifact reference and the merge result becomes this task's result.
+    The compute profile picks the Whisper model and precision; the worker's
+    thread pools follow DIARIZATION_PROFILE. Every stage publishes progress
+    events under this task's ID, see src/progress.py.
     """
+    from src.youtube_downloader import YouTubeDownloader
+
+    pin = None
     try:
         logging.info("Starting YouTube download process.")
+        ProgressPublisher(self.request.id).stage("download")
         
         # Initialize YouTube downloader
-        downloader = YouTubeDownloader(url, output_folder)
-        _, wav_audio_file = downloader.download()
+        downloader = YouTubeDownloader(
+            url, output_folder, keep_wav=keep_wav, use_cache=use_cache
+        )
+        # The job moves between workers, so its pin is released explicitly
+        # when it finishes or fails, and expires otherwise
+        pin = ArtifactLifecycle.for_output(output_folder).pin(
+            downloader.base_dir, job_id=self.request.id, process_bound=False
+        )
+        enforce_budget(output_folder)
+        _, pcm_audio_file = downloader.download()
         
-        if not wav_audio_file:
+        if not pcm_audio_file:
             raise ValueError("Failed to download the audio file.")
 
-        logging.info("Download completed. Starting diarization process.")
-        
-        # Initialize diarization process
-        diarization = Diarization(wav_audio_file)
-        diarization_result = diarization.diarize()
-
-        protocol_json_file = os.path.join(downloader.base_dir, "protocol.json")
-        if not os.path.exists(protocol_json_file):
-            protocol = diarization.create_protocol(diarization_result)
-            
-            # Save the protocol as JSON
-            with open(protocol_json_file, "w") as json_file:
-                json.dump(protocol, json_file, indent=4)
-            
-            logging.info(f"Protocol saved to {protocol_json_file}.")
-        else:
-            logging.info("Protocol file already exists.")
-
-        return {"status": "success", "protocol_file": protocol_json_file}
-    
+        logging.info("Download completed. Scheduling diarization.")
+        ref = {
+            "output_folder": output_folder,
+            "pcm_file": pcm_audio_file,
+            "protocol_file": os.path.join(downloader.base_dir, "protocol.json"),
+            "video_id": downloader.video_id,
+            "use_cache": use_cache,
+            "mode": mode,
+            "batch_size": batch_size,
+            "chunk_size": chunk_size,
+            "shard_workers": shard_workers,
+            "profile": profile,
+            "global_speakers": global_speakers,
+            "pin": pin,
+            "job_id": self.request.id,
+        }
+    except Exception as e:
+        ref = {"output_folder": output_folder, "pin": pin, "job_id": self.request.id}
+        return _failure(self, "download_diarize_transcribe", e, ref)
+
+    raise self.replace(diarize_audio.s(ref) | transcribe_turns.s())
+
+
+@app.task(bind=True)
+def diarize_audio(self, ref):
+    """
+    Celery task that diarizes the downloaded audio of a job.
+    """
+    try:
+        _open_diarization(ref).diarize()
+        return ref
+    except Exception as e:
+        return _failure(self, "diarize_audio", e, ref)
+
+
+@app.task(bind=True)
+def transcribe_turns(self, ref):
+    """
+    Celery task that fans the diarization turns out to chunk tasks.
+
+    Reuses a cached protocol when there is one; single-pass protocols are one
+    Whisper call and are transcribed here without fan-out.
+    """
+    if ref.get("status") == "failure":
+        return ref
+    try:
+        diarization = _open_diarization(ref)
+        annotation = diarization.diarize()
+        protocol_json_file = ref["protocol_file"]
+        success = {"status": "success", "protocol_file": protocol_json_file}
+        if diarization.fetch_protocol(
+            protocol_json_file, ref["mode"], ref["batch_size"]
+        ):
+            diarization.finish_protocol(
+                ref["output_folder"], protocol_json_file, ref.get("global_speakers", False)
+            )
+            return _finish(ref, success)
+
+        turns = len(list(annotation.itertracks()))
+        if ref["mode"] == "single_pass" or turns <= ref["chunk_size"]:
+            diarization.save_protocol(
+                annotation,
+                protocol_json_file,
+                mode=ref["mode"],
+                batch_size=ref["batch_size"],
+            )
+            diarization.finish_protocol(
+                ref["output_folder"], protocol_json_file, ref.get("global_speakers", False)
+            )
+            return _finish(ref, success)
+    except Exception as e:
+        return _failure(self, "transcribe_turns", e, ref)
+
+    chunks = [
+        transcribe_chunk.s(ref, start, min(start + ref["chunk_size"], turns))
+        for start in range(0, turns, ref["chunk_size"])
+    ]
+    logging.info(f"Transcribing {turns} turns in {len(chunks)} chunks.")
+    # The chunks report their own counts; this event carries the job's total
+    if diarization.progress:
+        diarization.progress.stage("transcribe", total=turns)
+    raise self.replace(chord(chunks, merge_protocol.s(ref)))
+
+
+@app.task(bind=True)
+def transcribe_chunk(self, ref, start, stop):
+    """
+    Celery task that transcribes the turns start..stop into a chunk journal.
+    """
+    try:
+        diarization = _open_diarization(ref, part=start)
+        tracks = list(diarization.diarize().itertracks(yield_label=True))
+        from src.annotation import Annotation
+
+        chunk = Annotation()
+        for turn, track, speaker in tracks[start:stop]:
+            chunk[turn, track] = speaker
+
+        journal = ProtocolJournal(
+            chunk_journal_path(ref["protocol_file"], start),
+            diarization.journal_params(ref["mode"], ref["batch_size"]),
+        )
+        try:
+            diarization.create_protocol(
+                chunk, mode=ref["mode"], batch_size=ref["batch_size"], journal=journal
+            )
+        finally:
+            journal.close()
+            if diarization.progress:
+                diarization.progress.flush()
+        return {"status": "success", "journal": journal.path}
+    except Exception as e:
+        return _failure(self, "transcribe_chunk", e)
+
+
+@app.task(bind=True)
+def merge_protocol(self, results, ref):
+    """
+    Celery task that compacts the chunk journals into protocol.json.
+    """
+    failures = [result for result in results if result.get("status") != "success"]
+    if failures:
+        return _finish(ref, failures[0])
+    try:
+        diarization = _open_diarization(ref)
+        if diarization.progress:
+            diarization.progress.stage("merge")
+        params = diarization.journal_params(ref["mode"], ref["batch_size"])
+        journals = [ProtocolJournal(result["journal"], params) for result in results]
+        finished = {}
+        for journal in journals:
+            finished.update(journal.load())
+
+        tracks = diarization.diarize().itertracks(yield_label=True)
+        protocol = [
+            finished[
+                segment_key({"start": turn.start, "end": turn.end, "speaker": speaker})
+            ]
+            for turn, _, speaker in tracks
+        ]
+        protocol_json_file = ref["protocol_file"]
+        write_json_atomic(protocol_json_file, protocol, indent=4)
+        for journal in journals:
+            journal.remove()
+        diarization.store_protocol(protocol_json_file, ref["mode"], ref["batch_size"])
+        logging.info(f"Protocol saved to {protocol_json_file}.")
+        diarization.finish_protocol(
+            ref["output_folder"], protocol_json_file, ref.get("global_speakers", False)
+        )
+        return _finish(
+            ref, {"status": "success", "protocol_file": protocol_json_file}
+        )
     except Exception as e:
-        # Handle exceptions and update task state
-        logging.error(f"Error in download_diarize_transcribe: {str(e)}")
-        self.update_state(state="FAILURE", meta={"exc_message": str(e)})
-        return {"status": "failure", "error": str(e)}
+        return _failure(self, "merge_protocol", e, ref)
@@ -1,133 +1,615 @@
 import os
 import logging
-from src.youtube_downloader import YouTubeDownloader
-from src.transcription import Transcriber
-import torch
-from pyannote.core import Segment
-from pyannote.audio import Pipeline
-from pydub import AudioSegment
+from src.audio import SAMPLE_RATE, load_audio, pipeline_input, slice_segment
+from src.alignment import assign_words_to_turns, words_to_text
+from src.model_registry import load_pipeline, pipeline_key, registry
+from src.batch_pipeline import run_batch
+from src.artifact_cache import write_json_atomic
+from src.metrics import metrics
+from src.protocol_journal import ProtocolJournal, journal_path_for, segment_key
+from src.protocol_index import index_protocol
+from src.sharded_diarization import LONG_AUDIO_SECONDS, diarize_sharded
+from src.turn_packing import packing_stats, plan_windows
+from src.segment_archive import SegmentArchiveWriter, archive_dir_for
+from src.artifact_lifecycle import ArtifactLifecycle, enforce_budget
+from src.compute_profiles import PROFILES, configure_threads, get_profile
+from src.speaker_index import (
+    SpeakerIndex,
+    apply_global_speakers,
+    embeddings_path_for,
+    load_speaker_embeddings,
+    save_speaker_embeddings,
+)
 import json
 from tqdm import tqdm
-from pyannote.core import Annotation
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-HUGGING_FACE_TOKEN = os.getenv("HUGGING_FACE_TOKEN")
-if not HUGGING_FACE_TOKEN:
-    raise ValueError("HUGGING_FACE_TOKEN environment variable not set")
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+
+# Protocol modes: one Whisper call per turn, one call per ~30 s window of
+# packed turns, or one call per file, with words aligned back to the turns
+PROTOCOL_MODES = ("segment", "packed", "single_pass")
+# Number of turns decoded together in segment mode. 1 keeps transcribe(),
+# whose temperature fallback retries a turn that decodes into repetitions;
+# batches decode greedily once, so their text can differ on such turns
+DEFAULT_BATCH_SIZE = 1
+
+# torch, pyannote.audio and whisper take seconds to import and are only
+# imported where a model is used, so submitting tasks and the UI start fast
+
+
+def hugging_face_token():
+    """
+    Returns the Hugging Face token, checked only when the diarization model loads.
+    """
+    token = os.getenv("HUGGING_FACE_TOKEN")
+    if not token:
+        raise ValueError("HUGGING_FACE_TOKEN environment variable not set")
+    return token
+
+
+def pipeline_device():
+    """
+    Returns the device the diarization pipeline runs on.
+    """
+    try:
+        import torch
+    except ImportError:
+        # Only the benchmark's stand-in models run without torch
+        return "cpu"
+    return "mps" if torch.backends.mps.is_available() else "cpu"
+
+
+def preload_models(profile=None):
+    """
+    Loads the diarization pipeline and the profile's Whisper model into the registry.
+    """
+    from src.transcription import Transcriber
+
+    profile = get_profile(profile)
+    load_pipeline(DIARIZATION_MODEL, pipeline_device(), hugging_face_token())
+    Transcriber(modelname=profile["whisper_model"], dtype=profile["whisper_dtype"])
+    log_model_memory()
+
+
+def whisper_model_id(profile):
+    """
+    Returns the Whisper model and precision a profile's protocols are made with.
+    """
+    model_id = profile["whisper_model"]
+    if profile["whisper_dtype"] != "float32":
+        model_id += f"/{profile['whisper_dtype']}"
+    return model_id
+
+
+def log_model_memory():
+    """
+    Logs the memory held by the models loaded in this process.
+    """
+    for stats in registry.stats():
+        logging.info(
+            f"Model {stats['model']} on {stats['device']} ({stats['dtype']}): "
+            f"{stats['bytes'] / 2**20:.0f} MiB, used {stats['hits']} times."
+        )
+
 
 class Diarization:
-    def __init__(self, audio_file):
+    def __init__(
+        self,
+        audio_file,
+        save_segments=False,
+        cache=None,
+        video_id="",
+        shard_workers=0,
+        profile=None,
+        progress=None,
+    ):
         self.audio_file = audio_file
-        logging.info(f"Initializing diarization pipeline for audio file: {audio_file}")
-        self.pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1", use_auth_token=HUGGING_FACE_TOKEN
-        )
-        self.pipeline.to(
-            torch.device("mps" if torch.backends.mps.is_available() else "cpu")
+        # The compute profile picks the Whisper model size and precision
+        self.profile = get_profile(profile)
+        # Segment audio and transcripts are appended to a per-speaker archive
+        self.save_segments = save_segments
+        self._segment_archive = None
+        # Recordings over LONG_AUDIO_SECONDS are diarized in parallel shards
+        # when shard_workers is above one
+        self.shard_workers = shard_workers
+        # Diarization and protocol results are reused from the artifact cache
+        # when the audio and model settings match
+        self.cache = cache
+        self.video_id = video_id
+        # Optional ProgressPublisher that receives stages and finished segments
+        self.progress = progress
+        self.diarization_file = os.path.join(
+            os.path.dirname(audio_file), "diarization.json"
         )
-        self.transcriber = Transcriber(modelname="turbo")
+        # One centroid embedding per speaker, used to match speakers across videos
+        self.embeddings_file = embeddings_path_for(self.diarization_file)
+        logging.info(f"Initializing diarization pipeline for audio file: {audio_file}")
+        # Decode once per job; segments are sliced from this buffer
+        self.sample_rate = SAMPLE_RATE
+        self.audio = load_audio(audio_file)
+        # Models come from the process-wide registry and are loaded on first use,
+        # so a process that only diarizes never holds Whisper and vice versa
+        self.device = pipeline_device()
+        self._pipeline = None
+        self._transcriber = None
+        self.last_packing_stats = None
+
+    @property
+    def pipeline(self):
+        if self._pipeline is None:
+            self._pipeline = load_pipeline(
+                DIARIZATION_MODEL, self.device, hugging_face_token()
+            )
+        return self._pipeline
+
+    @property
+    def pipeline_lock(self):
+        return registry.lock(pipeline_key(DIARIZATION_MODEL, self.device))
+
+    @property
+    def transcriber(self):
+        if self._transcriber is None:
+            from src.transcription import Transcriber
+
+            self._transcriber = Transcriber(
+                modelname=self.profile["whisper_model"],
+                dtype=self.profile["whisper_dtype"],
+            )
+        return self._transcriber
 
     def diarize(self):
         logging.info("Starting speaker diarization.")
-        diarization_file = os.path.join(
-            os.path.dirname(self.audio_file), "diarization.json"
-        )
+        diarization_file = self.diarization_file
+
+        if self.cache is not None:
+            self.cache.ensure(
+                diarization_file,
+                self._run_pipeline,
+                *self._diarization_cache_args("diarization"),
+            )
+            if not os.path.exists(self.embeddings_file):
+                args = self._diarization_cache_args("speaker_embeddings")
+                self.cache.fetch(self.cache.make_key(*args), self.embeddings_file)
+            return self.load_diarization()
 
         if os.path.exists(diarization_file):
-            logging.info(f"Loading diarization from {diarization_file}.")
-            with open(diarization_file, "r") as file:
-                diarization = json.load(file)
-                annotation = Annotation()
-                for segment in diarization:
-                    annotation[Segment(segment["start"], segment["end"])] = segment[
-                        "speaker"
-                    ]
-                return annotation
+            return self.load_diarization()
+        return self._run_pipeline()
 
-        else:
-            diarization = self.pipeline(self.audio_file)
-            logging.info("Diarization completed.")
-            diarization_data = [
-                {"start": turn.start, "end": turn.end, "speaker": speaker}
-                for turn, _, speaker in diarization.itertracks(yield_label=True)
-            ]
-            with open(diarization_file, "w") as file:
-                json.dump(diarization_data, file)
-            logging.info(f"Diarization saved to {diarization_file}.")
+    def _diarization_cache_args(self, stage):
+        return (
+            self.video_id,
+            self.cache.file_hash(self.audio_file),
+            stage,
+            DIARIZATION_MODEL,
+            {"sharded": self.use_shards()},
+        )
+
+    def load_diarization(self):
+        """
+        Loads the diarization turns saved by a previous run.
+        """
+        from src.annotation import Annotation, Segment
+
+        logging.info(f"Loading diarization from {self.diarization_file}.")
+        with open(self.diarization_file, "r") as file:
+            diarization = json.load(file)
+            annotation = Annotation()
+            for segment in diarization:
+                annotation[Segment(segment["start"], segment["end"])] = segment[
+                    "speaker"
+                ]
+            return annotation
 
+    def use_shards(self):
+        """
+        Checks whether this recording is long enough to be diarized in shards.
+        """
+        return (
+            self.shard_workers > 1
+            and len(self.audio) > LONG_AUDIO_SECONDS * self.sample_rate
+        )
+
+    def _run_pipeline(self):
+        """
+        Runs the pyannote pipeline on the decoded audio and saves the turns
+        and the speaker centroid embeddings.
+        """
+        if self.progress:
+            self.progress.stage("diarize")
+        with metrics.span(
+            "diarization",
+            video_id=self.video_id,
+            audio_seconds=len(self.audio) / self.sample_rate,
+            sharded=self.use_shards(),
+        ):
+            if self.use_shards():
+                diarization, embeddings = diarize_sharded(
+                    self.audio,
+                    self.audio_file,
+                    DIARIZATION_MODEL,
+                    hugging_face_token(),
+                    workers=self.shard_workers,
+                    return_embeddings=True,
+                )
+            else:
+                pipeline = self.pipeline
+                # Only jobs that publish progress hook into the pipeline steps
+                options = {"hook": self.progress.pyannote_hook} if self.progress else {}
+                with self.pipeline_lock:
+                    diarization, embeddings = pipeline(
+                        pipeline_input(self.audio, self.sample_rate),
+                        return_embeddings=True,
+                        **options,
+                    )
+        logging.info("Diarization completed.")
+        diarization_data = [
+            {"start": turn.start, "end": turn.end, "speaker": speaker}
+            for turn, _, speaker in diarization.itertracks(yield_label=True)
+        ]
+        write_json_atomic(self.diarization_file, diarization_data)
+        logging.info(f"Diarization saved to {self.diarization_file}.")
+        # pyannote returns the embeddings in the order of the labels
+        save_speaker_embeddings(
+            self.embeddings_file, diarization.labels(), embeddings
+        )
+        if self.cache is not None:
+            args = self._diarization_cache_args("speaker_embeddings")
+            self.cache.put(self.cache.make_key(*args), self.embeddings_file, *args)
         return diarization
 
-    def create_protocol(self, diarization):
+    def register_speakers(self, output_folder):
+        """
+        Adds the speakers of this video to the cross-video speaker index.
+
+        Returns {label: global_id}, empty if no embeddings were saved.
+        """
+        if not os.path.exists(self.embeddings_file):
+            return {}
+        mapping = SpeakerIndex.for_output(output_folder).add_video(
+            self.video_id or os.path.basename(os.path.dirname(self.audio_file)),
+            load_speaker_embeddings(self.embeddings_file),
+            os.path.dirname(self.audio_file),
+        )
+        return mapping
+
+    def finish_protocol(self, output_folder, protocol_json_file, global_speakers=False):
+        """
+        Registers the speakers, indexes a finished protocol and applies the
+        disk budget of the output folder.
+
+        With global_speakers set, the global speaker IDs are also written into
+        the protocol.
+        """
+        try:
+            mapping = self.register_speakers(output_folder)
+            if global_speakers and mapping:
+                apply_global_speakers(protocol_json_file, mapping)
+        except Exception as e:
+            logging.error(f"Failed to register speakers of {protocol_json_file}: {e}")
+        index_protocol(output_folder, protocol_json_file, self.video_id)
+        enforce_budget(output_folder, os.path.dirname(protocol_json_file))
+
+    def save_protocol(
+        self,
+        diarization,
+        protocol_json_file,
+        mode="segment",
+        batch_size=DEFAULT_BATCH_SIZE,
+    ):
+        """
+        Creates and saves the protocol unless an up-to-date one can be reused.
+
+        Finished segments are journaled next to protocol.json while the
+        protocol is created, so an interrupted run resumes where it stopped.
+        """
+        if self.fetch_protocol(protocol_json_file, mode, batch_size):
+            return protocol_json_file
+
+        journal = ProtocolJournal(
+            journal_path_for(protocol_json_file), self.journal_params(mode, batch_size)
+        )
+        try:
+            protocol = self.create_protocol(
+                diarization, mode=mode, batch_size=batch_size, journal=journal
+            )
+        finally:
+            journal.close()
+            self.close_segment_archive()
+            if self.progress:
+                self.progress.flush()
+        with metrics.span(
+            "protocol_write", video_id=self.video_id, segments=len(protocol)
+        ):
+            journal.compact(protocol_json_file, protocol)
+        logging.info(f"Protocol saved to {protocol_json_file}.")
+        self.store_protocol(protocol_json_file, mode, batch_size)
+        return protocol_json_file
+
+    def journal_params(self, mode, batch_size):
+        """
+        Returns the settings a protocol journal must match to be resumed.
+        """
+        return {
+            "mode": mode,
+            "batch_size": batch_size,
+            "model": whisper_model_id(self.profile),
+        }
+
+    def _protocol_cache_args(self, mode, batch_size):
+        return (
+            self.video_id,
+            self.cache.file_hash(self.audio_file),
+            "protocol",
+            f"whisper/{whisper_model_id(self.profile)}",
+            {
+                "mode": mode,
+                "batch_size": batch_size,
+                "diarization": self.cache.file_hash(self.diarization_file),
+            },
+        )
+
+    def fetch_protocol(self, protocol_json_file, mode, batch_size):
+        """
+        Places a reusable protocol at protocol_json_file; returns False if there is none.
+
+        Without a cache any existing protocol file is reused.
+        """
+        if self.cache is None:
+            if os.path.exists(protocol_json_file):
+                logging.info("Protocol file already exists.")
+                return True
+            return False
+        key = self.cache.make_key(*self._protocol_cache_args(mode, batch_size))
+        return self.cache.fetch(key, protocol_json_file)
+
+    def store_protocol(self, protocol_json_file, mode, batch_size):
+        """
+        Records a finished protocol in the artifact cache.
+        """
+        if self.cache is None:
+            return
+        args = self._protocol_cache_args(mode, batch_size)
+        self.cache.put(self.cache.make_key(*args), protocol_json_file, *args)
+
+    def create_protocol(
+        self, diarization, mode="segment", batch_size=DEFAULT_BATCH_SIZE, journal=None
+    ):
+        if mode == "single_pass":
+            return self.create_protocol_single_pass(diarization, journal)
+        if mode == "packed":
+            return self.create_protocol_packed(diarization, journal)
+        if mode not in PROTOCOL_MODES:
+            raise ValueError(f"Unknown protocol mode: {mode}")
+        if batch_size > 1:
+            return self.create_protocol_batched(diarization, batch_size, journal)
+
         logging.info("Creating detailed protocol.")
+        finished = journal.load() if journal else {}
+        tracks = list(diarization.itertracks(yield_label=True))
+        if self.progress:
+            self.progress.stage(
+                "transcribe",
+                total=len(tracks),
+                done=sum(
+                    (turn.start, turn.end, speaker) in finished
+                    for turn, _, speaker in tracks
+                ),
+            )
         protocol = []
-        for turn, _, speaker in tqdm(
-            diarization.itertracks(yield_label=True), desc="Processing segments"
-        ):
+        for turn, _, speaker in tqdm(tracks, desc="Processing segments"):
+            segment = {"start": turn.start, "end": turn.end, "speaker": speaker}
+            if segment_key(segment) in finished:
+                protocol.append(finished[segment_key(segment)])
+                continue
+
             logging.info(
                 f"Processing segment from {turn.start} to {turn.end} for speaker {speaker}."
             )
-            segment_text = self.extract_segment_text(turn, speaker)
-            protocol.append(
-                {
-                    "start": turn.start,
-                    "end": turn.end,
-                    "speaker": speaker,
-                    "text": segment_text,
-                }
+            segment["text"] = self.extract_segment_text(turn, speaker)
+            if journal:
+                journal.append(segment)
+            if self.progress:
+                self.progress.advance([segment])
+            protocol.append(segment)
+
+        logging.info(f"Protocol creation completed with {len(protocol)} segments.")
+        return protocol
+
+    def create_protocol_batched(self, diarization, batch_size, journal=None):
+        """
+        Transcribes the turns in length-grouped batches of Whisper windows.
+        """
+        from src.annotation import Segment
+
+        logging.info(f"Creating detailed protocol with batch size {batch_size}.")
+        finished = journal.load() if journal else {}
+        protocol = [
+            {"start": turn.start, "end": turn.end, "speaker": speaker}
+            for turn, _, speaker in diarization.itertracks(yield_label=True)
+        ]
+        pending = []
+        segments = []
+        for index, segment in enumerate(protocol):
+            if segment_key(segment) in finished:
+                segment["text"] = finished[segment_key(segment)]["text"]
+                continue
+            with metrics.span("segment_extract", detail=False):
+                audio_segment = slice_segment(
+                    self.audio, segment["start"], segment["end"], self.sample_rate
+                )
+            if self.save_segments:
+                turn = Segment(segment["start"], segment["end"])
+                self.save_segment_audio(turn, segment["speaker"], audio_segment)
+            pending.append(index)
+            segments.append(audio_segment)
+        if self.progress:
+            self.progress.stage(
+                "transcribe", total=len(protocol), done=len(protocol) - len(pending)
             )
 
+        def on_result(position, segment_text):
+            segment = protocol[pending[position]]
+            segment["text"] = segment_text
+            if journal:
+                journal.append(segment)
+            if self.progress:
+                self.progress.advance([segment])
+            if self.save_segments:
+                turn = Segment(segment["start"], segment["end"])
+                self.save_transcript(turn, segment["speaker"], segment_text)
+
+        self.transcriber.transcribe_batch(
+            segments, batch_size=batch_size, on_result=on_result
+        )
+
         logging.info("Protocol creation completed.")
-        logging.info(f"Protocol: {protocol}")
         return protocol
 
-    def extract_segment_text(self, segment, speaker):
+    def create_protocol_packed(self, diarization, journal=None):
+        """
+        Transcribes turns packed into Whisper windows and splits the words back.
+
+        Adjacent turns of a speaker are kept together and short turns share a
+        window of up to 30 s, so sub-second turns no longer cost one Whisper
+        call each. Windows whose turns are all journaled are skipped.
+        """
+        from src.annotation import Segment
+
+        protocol = [
+            {"start": turn.start, "end": turn.end, "speaker": speaker}
+            for turn, _, speaker in diarization.itertracks(yield_label=True)
+        ]
+        turns = [(s["start"], s["end"], s["speaker"]) for s in protocol]
+        windows = plan_windows(turns)
+        self.last_packing_stats = packing_stats(turns, windows)
         logging.info(
-            f"Extracting text for segment from {segment.start} to {segment.end}."
+            f"Creating detailed protocol from {len(turns)} turns packed into "
+            f"{len(windows)} windows ({self.last_packing_stats['invocations_saved']} "
+            f"Whisper calls saved)."
         )
-        # Load the audio file
-        audio = AudioSegment.from_file(self.audio_file)
-        # Extract the segment
-        start_ms = (
-            segment.start * 1000
-        )  # pyannote uses seconds, pydub uses milliseconds
-        end_ms = segment.end * 1000
-        audio_segment = audio[start_ms:end_ms]
-        # Use the segment start and end time as an identifier for the file names
-        segment_identifier = f"{segment.start:.2f}_{segment.end:.2f}".replace(".", "_")
+        finished = journal.load() if journal else {}
+        if self.progress:
+            self.progress.stage(
+                "transcribe",
+                total=len(protocol),
+                done=sum(segment_key(segment) in finished for segment in protocol),
+            )
+
+        with metrics.span(
+            "packed_transcription", video_id=self.video_id, **self.last_packing_stats
+        ):
+            for window in tqdm(windows, desc="Processing windows"):
+                segments = [protocol[index] for index in window["turns"]]
+                if all(segment_key(segment) in finished for segment in segments):
+                    for segment in segments:
+                        segment["text"] = finished[segment_key(segment)]["text"]
+                    continue
 
-        # Create a directory for the speaker if it doesn't exist
-        speaker_dir = os.path.join(
-            os.path.dirname(self.audio_file), "speakers", f"{speaker}"
+                audio_window = slice_segment(
+                    self.audio, window["start"], window["end"], self.sample_rate
+                )
+                with metrics.span(
+                    "window_transcribe",
+                    detail=False,
+                    audio_seconds=window["end"] - window["start"],
+                ):
+                    words = self.transcriber.transcribe_words(audio_window)
+                # Word times are relative to the window
+                words = [
+                    dict(
+                        word,
+                        start=word["start"] + window["start"],
+                        end=word["end"] + window["start"],
+                    )
+                    for word in words
+                ]
+                turn_words = assign_words_to_turns(
+                    words, [(segment["start"], segment["end"]) for segment in segments]
+                )
+                for segment, segment_words in zip(segments, turn_words):
+                    segment["text"] = words_to_text(segment_words)
+                    if journal:
+                        journal.append(segment)
+                    if self.progress:
+                        self.progress.advance([segment])
+                    if self.save_segments:
+                        turn = Segment(segment["start"], segment["end"])
+                        self.save_segment_audio(
+                            turn,
+                            segment["speaker"],
+                            slice_segment(
+                                self.audio, turn.start, turn.end, self.sample_rate
+                            ),
+                        )
+                        self.save_transcript(turn, segment["speaker"], segment["text"])
+
+        logging.info("Protocol creation completed.")
+        return protocol
+
+    def create_protocol_single_pass(self, diarization, journal=None):
+        """
+        Transcribes the whole recording once and aligns the words to the turns.
+        """
+        logging.info("Creating detailed protocol in single-pass mode.")
+        tracks = list(diarization.itertracks(yield_label=True))
+        if self.progress:
+            self.progress.stage("transcribe", total=len(tracks))
+        with metrics.span(
+            "transcribe_words",
+            video_id=self.video_id,
+            audio_seconds=len(self.audio) / self.sample_rate,
+        ):
+            words = self.transcriber.transcribe_words(self.audio)
+        turn_words = assign_words_to_turns(
+            words, [(turn.start, turn.end) for turn, _, _ in tracks]
         )
-        os.makedirs(speaker_dir, exist_ok=True)
+        protocol = [
+            {
+                "start": turn.start,
+                "end": turn.end,
+                "speaker": speaker,
+                "text": words_to_text(segment_words),
+            }
+            for (turn, _, speaker), segment_words in zip(tracks, turn_words)
+        ]
+        # A single Whisper call has nothing to resume; journal for completeness
+        if journal:
+            for segment in protocol:
+                journal.append(segment)
+        if self.progress:
+            self.progress.advance(protocol)
+        logging.info("Protocol creation completed.")
+        return protocol
 
-        try:
-            # Save the audio segment
-            audio_filename = os.path.join(
-                speaker_dir, f"segment_{segment_identifier}.wav"
+    def extract_segment_text(self, segment, speaker):
+        logging.info(
+            f"Extracting text for segment from {segment.start} to {segment.end}."
+        )
+        # Per-segment spans only update the aggregates to stay cheap
+        with metrics.span("segment_extract", detail=False):
+            audio_segment = slice_segment(
+                self.audio, segment.start, segment.end, self.sample_rate
             )
-            audio_segment.export(audio_filename, format="wav")
-            logging.info(f"Audio segment saved to {audio_filename  }.")
-        except Exception as e:
-            logging.error(f"Failed to save audio segment: {e}")
-            raise e
+        if self.save_segments:
+            self.save_segment_audio(segment, speaker, audio_segment)
 
         # Transcribe the segment
         try:
-            transcription_text = self.transcriber.transcribe(audio_filename)
+            with metrics.span(
+                "segment_transcribe",
+                detail=False,
+                audio_seconds=segment.end - segment.start,
+            ):
+                transcription_text = self.transcriber.transcribe(audio_segment)
             logging.info("Transcription for segment completed.")
-
-            # Save the transcription
-            transcript_filename = os.path.join(
-                speaker_dir, f"transcript_{segment_identifier}.txt"
-            )
-            with open(transcript_filename, "w") as transcript_file:
-                transcript_file.write(transcription_text)
-            logging.info(f"Transcript saved to {transcript_filename}.")
+            if self.save_segments:
+                self.save_transcript(segment, speaker, transcription_text)
         except Exception as e:
             logging.error(f"Failed to transcribe segment: {e}")
             transcription_text = ""
@@ -135,30 +617,82 @@ class Diarization:
 
         return transcription_text
 
+    @property
+    def segment_archive(self):
+        """
+        Returns the writer of this job's per-speaker segment archive.
+        """
+        if self._segment_archive is None:
+            directory = archive_dir_for(self.audio_file)
+            self._segment_archive = SegmentArchiveWriter(directory)
+        return self._segment_archive
+
+    def close_segment_archive(self):
+        if self._segment_archive is not None:
+            self._segment_archive.close()
+            self._segment_archive = None
+
+    def save_segment_audio(self, segment, speaker, audio_segment):
+        """
+        Appends the audio of a segment to the archive; transcription does not need it.
+        """
+        self.segment_archive.add_audio(
+            speaker, segment.start, segment.end, audio_segment
+        )
+
+    def save_transcript(self, segment, speaker, transcription_text):
+        """
+        Appends the transcription of a segment to the archive for inspection.
+        """
+        self.segment_archive.add_transcript(
+            speaker, segment.start, segment.end, transcription_text
+        )
 
-def main(url, output_folder):
+
+def main(
+    url,
+    output_folder,
+    mode="segment",
+    batch_size=DEFAULT_BATCH_SIZE,
+    keep_wav=False,
+    use_cache=True,
+    shard_workers=0,
+    profile=None,
+    global_speakers=False,
+    save_segments=False,
+):
     """
     Main function to handle downloading, diarizing, and transcribing YouTube audio.
     """
+    from src.youtube_downloader import YouTubeDownloader
+
     logging.info("Starting YouTube download process.")
-    downloader = YouTubeDownloader(url, output_folder)
-    _, wav_audio_file = downloader.download()
-    
-    if wav_audio_file:
+    downloader = YouTubeDownloader(
+        url, output_folder, keep_wav=keep_wav, use_cache=use_cache
+    )
+    # The job's files are not evicted while it runs
+    with ArtifactLifecycle.for_output(output_folder).pinned(downloader.base_dir):
+        enforce_budget(output_folder)
+        _, pcm_audio_file = downloader.download()
+
+        if not pcm_audio_file:
+            logging.error("Failed to download the audio file.")
+            return
         logging.info("Download completed. Starting diarization process.")
-        diarization = Diarization(wav_audio_file)
+        diarization = Diarization(
+            pcm_audio_file,
+            cache=downloader.cache,
+            video_id=downloader.video_id,
+            shard_workers=shard_workers,
+            profile=profile,
+            save_segments=save_segments,
+        )
         diarization_result = diarization.diarize()
         protocol_json_file = os.path.join(downloader.base_dir, "protocol.json")
-
-        if not os.path.exists(protocol_json_file):
-            protocol = diarization.create_protocol(diarization_result)
-            # Save the protocol as JSON
-            with open(protocol_json_file, "w") as json_file:
-                json.dump(protocol, json_file, indent=4)
-        else:
-            logging.info("Protocol file already exists.")
-    else:
-        logging.error("Failed to download the audio file.")
+        diarization.save_protocol(
+            diarization_result, protocol_json_file, mode=mode, batch_size=batch_size
+        )
+        diarization.finish_protocol(output_folder, protocol_json_file, global_speakers)
 
 # Example usage
 if __name__ == "__main__":
@@ -176,22 +710,140 @@ if __name__ == "__main__":
     parser.add_argument(
         "--file", type=str, help="A text file containing multiple YouTube URLs"
     )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=PROTOCOL_MODES,
+        default="segment",
+        help="Transcribe each turn separately, turns packed into 30 s windows, "
+        "or the whole file in a single pass",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Number of turns transcribed together in segment mode",
+    )
+    parser.add_argument(
+        "--keep-wav",
+        action="store_true",
+        help="Also keep a full-rate WAV copy of the downloaded audio",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not reuse or store results in the output folder's artifact cache",
+    )
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        default=0,
+        help="Diarize recordings longer than an hour in parallel shards on this many processes",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        choices=list(PROFILES),
+        help="Compute profile: Whisper model size, int8 quantization and threads",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Overlap download, decoding, diarization and transcription across URLs",
+    )
+    parser.add_argument(
+        "--download-workers", type=int, default=4, help="Concurrent downloads"
+    )
+    parser.add_argument(
+        "--decode-workers", type=int, default=2, help="Concurrent ffmpeg decodes"
+    )
+    parser.add_argument(
+        "--diarize-workers", type=int, default=1, help="Diarization processes"
+    )
+    parser.add_argument(
+        "--transcribe-workers", type=int, default=1, help="Transcription processes"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=4,
+        help="Maximum number of jobs waiting between two pipeline stages",
+    )
+    parser.add_argument(
+        "--save-segments",
+        action="store_true",
+        help="Keep the audio and transcript of every turn in a per-speaker segment archive",
+    )
+    parser.add_argument(
+        "--global-speakers",
+        action="store_true",
+        help="Write speaker IDs matched across all videos of the output folder into the protocol",
+    )
+    parser.add_argument(
+        "--metrics-report",
+        type=str,
+        help="Write per-stage timings of the run to this JSON file",
+    )
     args = parser.parse_args()
 
     if args.file:
         logging.info(f"Processing URLs from file: {args.file}")
         with open(args.file, 'r') as file:
-            urls = file.readlines()
-        for url in urls:
-            url = url.strip()
-            if url:
+            urls = [url.strip() for url in file.readlines() if url.strip()]
+        if args.pipeline:
+            run_batch(
+                urls,
+                args.output_folder,
+                mode=args.mode,
+                batch_size=args.batch_size,
+                download_workers=args.download_workers,
+                decode_workers=args.decode_workers,
+                diarize_workers=args.diarize_workers,
+                transcribe_workers=args.transcribe_workers,
+                queue_size=args.queue_size,
+                use_cache=not args.no_cache,
+                profile=args.profile,
+                global_speakers=args.global_speakers,
+                keep_wav=args.keep_wav,
+                shard_workers=args.shard_workers,
+                save_segments=args.save_segments,
+            )
+        else:
+            configure_threads(args.profile)
+            for url in urls:
                 logging.info(f"Processing URL: {url} output_folder: {args.output_folder}")
-                main(url, args.output_folder)
+                main(
+                    url,
+                    args.output_folder,
+                    mode=args.mode,
+                    batch_size=args.batch_size,
+                    keep_wav=args.keep_wav,
+                    use_cache=not args.no_cache,
+                    shard_workers=args.shard_workers,
+                    profile=args.profile,
+                    global_speakers=args.global_speakers,
+                    save_segments=args.save_segments,
+                )
+            log_model_memory()
     elif args.url:
         logging.info(f"Processing single URL: {args.url}")
-        main(args.url, args.output_folder)
+        configure_threads(args.profile)
+        main(
+            args.url,
+            args.output_folder,
+            mode=args.mode,
+            batch_size=args.batch_size,
+            keep_wav=args.keep_wav,
+            use_cache=not args.no_cache,
+            shard_workers=args.shard_workers,
+            profile=args.profile,
+            global_speakers=args.global_speakers,
+            save_segments=args.save_segments,
+        )
     else:
         logging.error(
             "You must provide either a YouTube URL or a file containing URLs."
         )
+    if args.metrics_report:
+        metrics.write_report(args.metrics_report)
     
@@ -0,0 +1,67 @@
+import heapq
+
+
+def assign_words_to_turns(words, turns):
+    """
+    Assigns timed words to the diarization turns they overlap most.
+
+    `words` are dicts with "start", "end" and "word" keys, `turns` are
+    (start, end) tuples. Both are swept in time order against a heap of the
+    currently open turns, so matching costs O((n + m) log n). Words that fall
+    into a gap between turns go to the nearest turn. Returns one list of
+    words per turn, in the order the turns were given.
+    """
+    assigned = [[] for _ in turns]
+    if not turns:
+        return assigned
+
+    order = sorted(range(len(turns)), key=lambda i: turns[i][0])
+    active = []  # heap of (end, turn index) for turns that started already
+    next_turn = 0
+    last_closed = None
+
+    for word in sorted(words, key=lambda w: (w["start"], w["end"])):
+        word_start, word_end = word["start"], word["end"]
+
+        # Open every turn starting before the word ends
+        while next_turn < len(order) and turns[order[next_turn]][0] < word_end:
+            index = order[next_turn]
+            heapq.heappush(active, (turns[index][1], index))
+            next_turn += 1
+
+        # Close turns that ended before the word starts
+        while active and active[0][0] <= word_start:
+            _, last_closed = heapq.heappop(active)
+
+        best, best_overlap = None, 0.0
+        for turn_end, index in active:
+            overlap = min(turn_end, word_end) - max(turns[index][0], word_start)
+            if overlap > best_overlap or (overlap == best_overlap and best is None):
+                best, best_overlap = index, overlap
+
+        if best is None:
+            best = _nearest_turn(turns, word_start, word_end, last_closed,
+                                 order[next_turn] if next_turn < len(order) else None)
+        assigned[best].append(word)
+
+    return assigned
+
+
+def _nearest_turn(turns, word_start, word_end, previous, following):
+    """
+    Picks whichever of the neighbouring turns is closest to a word in a gap.
+    """
+    if previous is None:
+        return following
+    if following is None:
+        return previous
+    gap_before = word_start - turns[previous][1]
+    gap_after = turns[following][0] - word_end
+    return previous if gap_before <= gap_after else following
+
+
+def words_to_text(words):
+    """
+    Joins Whisper word tokens, which carry their own leading whitespace.
+    """
+    return "".join(word["word"] for word in words).strip()
@@ -0,0 +1,54 @@
+from collections import namedtuple
+
+# pyannote.core is installed with pyannote.audio. Without it, only the
+# stand-in models of the benchmark can run, and they get these minimal
+# equivalents of its Segment and Annotation
+try:
+    from pyannote.core import Annotation, Segment
+except ImportError:
+
+    class Segment(namedtuple("Segment", ["start", "end"])):
+        """
+        A time span in seconds, like pyannote.core.Segment.
+        """
+
+        @property
+        def duration(self):
+            return max(0.0, self.end - self.start)
+
+    class Annotation:
+        """
+        Labeled turns with the part of the pyannote.core.Annotation API the pipeline uses.
+
+        Turns are stored per (segment, track), and an annotation indexed with
+        a segment alone uses the track "_", as pyannote does.
+        """
+
+        def __init__(self):
+            self._tracks = {}
+
+        def __setitem__(self, key, label):
+            if isinstance(key, Segment):
+                key = (key, "_")
+            segment, track = key
+            self._tracks[(Segment(*segment), track)] = label
+
+        def __len__(self):
+            return len(self._tracks)
+
+        def itertracks(self, yield_label=False):
+            for segment, track in sorted(self._tracks):
+                if yield_label:
+                    yield segment, track, self._tracks[(segment, track)]
+                else:
+                    yield segment, track
+
+        def labels(self):
+            return sorted(set(self._tracks.values()))
+
+        def label_duration(self, label):
+            return sum(
+                segment.duration
+                for (segment, _), other in self._tracks.items()
+                if other == label
+            )
@@ -0,0 +1,210 @@
+import os
+import json
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+CACHE_DIR_NAME = ".cache"
+HASH_CHUNK_BYTES = 1 << 20
+
+
+class ArtifactCache:
+    """
+    A content-addressed store for the artifacts of each pipeline stage.
+
+    Artifacts are keyed on (video id, input hash, stage, model id, parameters),
+    stored under `objects/` and tracked in a small SQLite index, so any run that
+    shares the output folder (CLI, Celery or Streamlit) reuses a stage result
+    whose inputs did not change. The cache only holds paths and is safe to
+    pass to worker processes; each call opens its own connection.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.db_path = os.path.join(root, "index.sqlite")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    key TEXT PRIMARY KEY,
+                    video_id TEXT,
+                    input_hash TEXT,
+                    stage TEXT,
+                    model_id TEXT,
+                    params TEXT,
+                    path TEXT,
+                    size INTEGER,
+                    created REAL
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime REAL,
+                    sha256 TEXT
+                )
+                """
+            )
+
+    @classmethod
+    def for_output(cls, output_folder):
+        """
+        Returns the cache shared by everything written below an output folder.
+        """
+        return cls(os.path.join(output_folder, CACHE_DIR_NAME))
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def make_key(self, video_id, input_hash, stage, model_id="", params=None):
+        """
+        Returns the content address of a stage artifact.
+        """
+        description = json.dumps(
+            [video_id, input_hash, stage, model_id, params or {}], sort_keys=True
+        )
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def file_hash(self, path):
+        """
+        Returns the SHA-256 of a file, memoized on its path, size and mtime.
+        """
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT sha256 FROM file_hashes WHERE path = ? AND size = ? AND mtime = ?",
+                (path, stat.st_size, stat.st_mtime),
+            ).fetchone()
+        if row:
+            return row[0]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_BYTES), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime, sha256),
+            )
+        return sha256
+
+    def get(self, key):
+        """
+        Returns the stored path of an artifact, or None if it is missing or damaged.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT path, size FROM artifacts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            path, size = row
+            if os.path.exists(path) and os.path.getsize(path) == size:
+                return path
+            logging.warning(f"Dropping stale cache entry for {path}.")
+            connection.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+        return None
+
+    def put(self, key, source, video_id, input_hash, stage, model_id="", params=None):
+        """
+        Stores a copy of a finished artifact under its key and returns its path.
+        """
+        _, extension = os.path.splitext(source)
+        target_dir = os.path.join(self.objects_dir, key[:2])
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, f"{key}{extension}")
+        _link_or_copy(source, target)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    video_id,
+                    input_hash,
+                    stage,
+                    model_id,
+                    json.dumps(params or {}, sort_keys=True),
+                    target,
+                    os.path.getsize(target),
+                    time.time(),
+                ),
+            )
+        logging.info(f"Cached {stage} artifact {source} as {key[:12]}.")
+        return target
+
+    def fetch(self, key, destination):
+        """
+        Places a cached artifact at destination; returns False on a cache miss.
+        """
+        path = self.get(key)
+        if path is None:
+            return False
+        if os.path.abspath(path) != os.path.abspath(destination):
+            _link_or_copy(path, destination)
+        logging.info(f"Reused cached artifact {key[:12]} for {destination}.")
+        return True
+
+    def ensure(self, path, produce, video_id, input_hash, stage, model_id="", params=None):
+        """
+        Places a stage artifact at path from the cache, or calls produce() to
+        write it there and stores the result.
+        """
+        key = self.make_key(video_id, input_hash, stage, model_id, params)
+        if self.fetch(key, path):
+            return path
+        produce()
+        self.put(key, path, video_id, input_hash, stage, model_id, params)
+        return path
+
+
+def _temporary_path(path):
+    """
+    Returns a sibling path unique to the calling process and thread.
+    """
+    return f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+
+
+def _link_or_copy(source, target):
+    """
+    Hard-links source to target, copying when linking is not possible.
+
+    The file is first placed next to the target and then renamed over it, so
+    readers never see a partially written artifact.
+    """
+    temporary = _temporary_path(target)
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    try:
+        os.link(source, temporary)
+    except OSError:
+        shutil.copy2(source, temporary)
+    os.replace(temporary, target)
+
+
+def write_json_atomic(path, data, **kwargs):
+    """
+    Writes JSON through a temporary file and a rename.
+
+    Cached artifacts are hard-linked into output folders, so rewriting one in
+    place would also change the cached copy; a rename replaces the link instead.
+    """
+    temporary = _temporary_path(path)
+    with open(temporary, "w") as file:
+        json.dump(data, file, **kwargs)
+    os.replace(temporary, path)
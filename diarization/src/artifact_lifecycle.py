@@ -0,0 +1,564 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import logging
+import argparse
+from contextlib import contextmanager
+from src.artifact_cache import CACHE_DIR_NAME
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+LIFECYCLE_FILE_NAME = "lifecycle.sqlite"
+# Overrides the budget stored for an output folder, e.g. "500G"
+BUDGET_ENV = "DIARIZATION_DISK_BUDGET"
+# Eviction frees space down to this share of the budget, so it does not run
+# again for every job
+LOW_WATERMARK = 0.9
+# Pins of jobs that outlive one process expire after this long
+PIN_TTL_SECONDS = 12 * 60 * 60
+# Jobs add their own files to the running size total; files written by
+# anything else are only counted by a full scan, which runs when the total
+# is older than this
+RESCAN_SECONDS = 24 * 60 * 60
+# Intermediates that can be downloaded or decoded again. Everything else,
+# notably protocol.json, diarization.json and meta_info.json, is kept.
+EVICTABLE_SUFFIXES = {
+    "_audio.m4a": "audio",
+    ".m4a.part": "audio",
+    ".m4a.part.json": "audio",
+    "_audio.wav": "wav",
+    ".f32": "pcm",
+    ".f32.part": "pcm",
+}
+# Cached stage outputs that are regenerable, by stage
+EVICTABLE_STAGES = {"download": "audio", "decode": "pcm"}
+# Saved segments are evicted as a whole directory
+SEGMENTS_DIR_NAME = "speakers"
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(text):
+    """
+    Parses a size such as "800M", "1.5T" or a plain byte count.
+    """
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)i?B?\s*", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def format_size(size):
+    for unit in ("T", "G", "M", "K"):
+        if abs(size) >= SIZE_UNITS[unit]:
+            return f"{size / SIZE_UNITS[unit]:.1f} {unit}B"
+    return f"{size} B"
+
+
+def _disk_bytes(stat):
+    # Blocks count what the file occupies; preallocated .part files are sparse
+    return getattr(stat, "st_blocks", 0) * 512 or stat.st_size
+
+
+class ArtifactLifecycle:
+    """
+    Keeps the files below an output folder within a disk budget.
+
+    Regenerable intermediates (downloaded audio, WAV copies, decoded PCM and
+    saved segments) are evicted least recently used first once the folder
+    exceeds its budget. Jobs pin their video directory while they run, and
+    pinned directories are never touched. Last access is recorded by the
+    pipeline when it reuses a file, and otherwise taken from the file times.
+    Hard links between output folders and the artifact cache count once and
+    are removed together. A running size total is kept per file, so checking
+    the budget only walks the folder when eviction is due or the total is
+    stale.
+    """
+
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.cache_dir = os.path.abspath(os.path.join(output_folder, CACHE_DIR_NAME))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.db_path = os.path.join(self.cache_dir, LIFECYCLE_FILE_NAME)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS accesses (
+                    path TEXT PRIMARY KEY,
+                    last_access REAL
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pins (
+                    id TEXT PRIMARY KEY,
+                    directory TEXT,
+                    job_id TEXT,
+                    host TEXT,
+                    pid INTEGER,
+                    created REAL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)"
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sizes (
+                    path TEXT PRIMARY KEY,
+                    device INTEGER,
+                    inode INTEGER,
+                    bytes INTEGER
+                )
+                """
+            )
+
+    @classmethod
+    def for_output(cls, output_folder):
+        """
+        Returns the lifecycle manager of an output folder.
+        """
+        return cls(output_folder)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def budget(self):
+        """
+        Returns the disk budget in bytes, or None if the folder has none.
+        """
+        if os.getenv(BUDGET_ENV):
+            return parse_size(os.getenv(BUDGET_ENV))
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM settings WHERE name = 'budget'"
+            ).fetchone()
+        return int(row[0]) if row else None
+
+    def set_budget(self, budget):
+        """
+        Stores the disk budget in bytes; None removes it.
+        """
+        with self._connect() as connection:
+            if budget is None:
+                connection.execute("DELETE FROM settings WHERE name = 'budget'")
+            else:
+                connection.execute(
+                    "INSERT OR REPLACE INTO settings VALUES ('budget', ?)",
+                    (str(budget),),
+                )
+
+    def record_access(self, *paths):
+        """
+        Marks files as used now, so they are evicted last.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO accesses VALUES (?, ?)",
+                [(os.path.abspath(path), now) for path in paths if path],
+            )
+        self.track(*paths)
+
+    def track(self, *paths):
+        """
+        Adds files, or every file below directories, to the running size total.
+
+        Files that disappeared from a tracked directory are dropped from it.
+        """
+        rows, directories = [], []
+        for path in paths:
+            if not path:
+                continue
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                directories.append(os.path.join(path, ""))
+                for directory, _, files in os.walk(path):
+                    rows += _size_rows(os.path.join(directory, name) for name in files)
+            else:
+                rows += _size_rows([path])
+        with self._connect() as connection:
+            connection.executemany(
+                "DELETE FROM sizes WHERE substr(path, 1, ?) = ?",
+                [(len(directory), directory) for directory in directories],
+            )
+            connection.executemany("INSERT OR REPLACE INTO sizes VALUES (?, ?, ?, ?)", rows)
+
+    def usage(self):
+        """
+        Returns the running size total in bytes, or None when it needs a full scan.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM settings WHERE name = 'scanned_at'"
+            ).fetchone()
+            if row is None or time.time() - float(row[0]) > RESCAN_SECONDS:
+                return None
+            # Hard links share an inode and count once
+            return connection.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM "
+                "(SELECT MAX(bytes) AS bytes FROM sizes GROUP BY device, inode)"
+            ).fetchone()[0]
+
+    def pin(self, directory, job_id=None, process_bound=True):
+        """
+        Protects a video directory from eviction and returns the pin id.
+
+        A process-bound pin ends with its process. Pins of jobs that move
+        between processes, like Celery chains, expire after PIN_TTL_SECONDS
+        unless they are removed before.
+        """
+        pin_id = uuid.uuid4().hex
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO pins VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    pin_id,
+                    os.path.abspath(directory),
+                    job_id,
+                    socket.gethostname(),
+                    os.getpid() if process_bound else None,
+                    time.time(),
+                ),
+            )
+        return pin_id
+
+    def unpin(self, pin_id):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM pins WHERE id = ?", (pin_id,))
+
+    def unpin_job(self, job_id):
+        """
+        Removes every pin a job holds.
+        """
+        with self._connect() as connection:
+            connection.execute("DELETE FROM pins WHERE job_id = ?", (job_id,))
+
+    @contextmanager
+    def pinned(self, directory, job_id=None):
+        pin_id = self.pin(directory, job_id)
+        try:
+            yield pin_id
+        finally:
+            self.unpin(pin_id)
+
+    def pinned_directories(self):
+        """
+        Returns the directories of live pins and drops the expired ones.
+        """
+        host = socket.gethostname()
+        now = time.time()
+        with self._connect() as connection:
+            pins = connection.execute(
+                "SELECT id, directory, host, pid, created FROM pins"
+            ).fetchall()
+            live, expired = set(), []
+            for pin_id, directory, pin_host, pid, created in pins:
+                if pid is not None and pin_host == host:
+                    alive = _process_alive(pid)
+                else:
+                    alive = now - created < PIN_TTL_SECONDS
+                if alive:
+                    live.add(directory)
+                else:
+                    expired.append((pin_id,))
+            if expired:
+                connection.executemany("DELETE FROM pins WHERE id = ?", expired)
+        return live
+
+    def scan(self):
+        """
+        Returns the disk usage below the output folder and its evictable units.
+
+        A unit is a file with all its hard links, or a saved segments
+        directory. Each unit has its "paths", "kind", "size", "last_access"
+        and whether it is "pinned". The running size total is rebuilt from
+        the scan.
+        """
+        scanned_at = time.time()
+        cache_stages = self._cache_stages()
+        with self._connect() as connection:
+            accesses = dict(
+                connection.execute("SELECT path, last_access FROM accesses")
+            )
+        pinned = self.pinned_directories()
+
+        seen = set()
+        sizes = []
+        usage = {"total": 0, "kept": 0}
+        units = {}
+        root = os.path.abspath(self.output_folder)
+        for directory, subdirectories, files in os.walk(root):
+            # The artifact cache is the only dot directory that is tracked
+            subdirectories[:] = [
+                name
+                for name in subdirectories
+                if not name.startswith(".")
+                or os.path.join(directory, name) == self.cache_dir
+            ]
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.lstat(path)
+                except FileNotFoundError:
+                    continue
+                size = _disk_bytes(stat)
+                inode = (stat.st_dev, stat.st_ino)
+                sizes.append((path, stat.st_dev, stat.st_ino, size))
+                first_link = inode not in seen
+                seen.add(inode)
+                if first_link:
+                    usage["total"] += size
+
+                kind, key = self._classify(path, cache_stages, inode)
+                if kind is None:
+                    if first_link:
+                        usage["kept"] += size
+                    continue
+                unit = units.setdefault(
+                    key,
+                    {
+                        "paths": [],
+                        "kind": kind,
+                        "size": 0,
+                        "last_access": 0.0,
+                        "pinned": False,
+                    },
+                )
+                unit["paths"].append(path)
+                if first_link:
+                    unit["size"] += size
+                unit["last_access"] = max(
+                    unit["last_access"],
+                    stat.st_mtime,
+                    stat.st_atime,
+                    accesses.get(path, 0.0),
+                )
+                # A file also linked from a pinned directory stays
+                unit["pinned"] = unit["pinned"] or any(
+                    path.startswith(os.path.join(pin, "")) for pin in pinned
+                )
+        with self._connect() as connection:
+            connection.execute("DELETE FROM sizes")
+            connection.executemany("INSERT INTO sizes VALUES (?, ?, ?, ?)", sizes)
+            connection.execute(
+                "INSERT OR REPLACE INTO settings VALUES ('scanned_at', ?)",
+                (str(scanned_at),),
+            )
+        return usage, list(units.values())
+
+    def _classify(self, path, cache_stages, inode):
+        """
+        Returns the kind of an evictable file and the key of its unit.
+        """
+        segments_dir = _segments_dir(path)
+        if segments_dir:
+            return "segments", segments_dir
+        if path in cache_stages:
+            kind = EVICTABLE_STAGES.get(cache_stages[path])
+            return kind, inode
+        for suffix, kind in EVICTABLE_SUFFIXES.items():
+            if path.endswith(suffix):
+                return kind, inode
+        return None, None
+
+    def _cache_stages(self):
+        """
+        Returns {object path: stage} of the artifact cache.
+        """
+        cache_db = os.path.join(self.cache_dir, "index.sqlite")
+        if not os.path.exists(cache_db):
+            return {}
+        with sqlite3.connect(cache_db, timeout=30) as connection:
+            return {
+                os.path.abspath(path): stage
+                for path, stage in connection.execute("SELECT path, stage FROM artifacts")
+            }
+
+    def report(self):
+        """
+        Summarizes the disk usage of the output folder by kind of artifact.
+        """
+        usage, units = self.scan()
+        kinds = {}
+        for unit in units:
+            summary = kinds.setdefault(
+                unit["kind"], {"units": 0, "bytes": 0, "pinned_bytes": 0}
+            )
+            summary["units"] += 1
+            summary["bytes"] += unit["size"]
+            if unit["pinned"]:
+                summary["pinned_bytes"] += unit["size"]
+        disk = shutil.disk_usage(self.output_folder)
+        return {
+            "budget": self.budget(),
+            "total_bytes": usage["total"],
+            "kept_bytes": usage["kept"],
+            "evictable_bytes": sum(
+                unit["size"] for unit in units if not unit["pinned"]
+            ),
+            "kinds": kinds,
+            "disk_free_bytes": disk.free,
+            "pinned_directories": len(self.pinned_directories()),
+        }
+
+    def enforce(self, budget=None):
+        """
+        Evicts unpinned intermediates in LRU order until the folder fits its budget.
+
+        The folder is only scanned when the running total is over the budget
+        or stale. Returns the number of bytes freed.
+        """
+        budget = budget if budget is not None else self.budget()
+        if budget is None:
+            return 0
+        total = self.usage()
+        if total is not None and total <= budget:
+            return 0
+        usage, units = self.scan()
+        if usage["total"] <= budget:
+            return 0
+        target = budget * LOW_WATERMARK
+        freed = 0
+        evicted = 0
+        for unit in sorted(units, key=lambda unit: unit["last_access"]):
+            if usage["total"] - freed <= target:
+                break
+            if unit["pinned"]:
+                continue
+            self._evict(unit)
+            freed += unit["size"]
+            evicted += 1
+        logging.info(
+            f"Evicted {evicted} artifacts ({format_size(freed)}) from "
+            f"{self.output_folder}; {format_size(usage['total'] - freed)} of "
+            f"{format_size(budget)} used."
+        )
+        if usage["total"] - freed > budget:
+            logging.warning(
+                f"{self.output_folder} stays over its budget; the rest is kept or pinned."
+            )
+        return freed
+
+    def _evict(self, unit):
+        if unit["kind"] == "segments":
+            shutil.rmtree(_segments_dir(unit["paths"][0]), ignore_errors=True)
+        for path in unit["paths"]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._connect() as connection:
+            connection.executemany(
+                "DELETE FROM accesses WHERE path = ?",
+                [(path,) for path in unit["paths"]],
+            )
+            connection.executemany(
+                "DELETE FROM sizes WHERE path = ?",
+                [(path,) for path in unit["paths"]],
+            )
+        # Cache entries of removed objects are dropped on their next lookup
+        logging.info(
+            f"Evicted {unit['kind']} {unit['paths'][0]} ({format_size(unit['size'])})."
+        )
+
+
+def _size_rows(paths):
+    """
+    Returns (path, device, inode, bytes) rows of the files that exist.
+    """
+    rows = []
+    for path in paths:
+        try:
+            stat = os.lstat(path)
+        except FileNotFoundError:
+            continue
+        rows.append((path, stat.st_dev, stat.st_ino, _disk_bytes(stat)))
+    return rows
+
+
+def _segments_dir(path):
+    """
+    Returns the saved segments directory a file belongs to, or None.
+    """
+    parent = os.path.dirname(path)
+    # The old layout kept one subdirectory per speaker
+    for directory in (parent, os.path.dirname(parent)):
+        if os.path.basename(directory) == SEGMENTS_DIR_NAME:
+            return directory
+    return None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def enforce_budget(output_folder, directory=None):
+    """
+    Applies the disk budget of an output folder, if it has one.
+
+    The files of a job's directory are added to the running total first.
+    Eviction is housekeeping; a failure is logged and does not fail the job.
+    """
+    try:
+        lifecycle = ArtifactLifecycle.for_output(output_folder)
+        if lifecycle.budget() is not None:
+            if directory:
+                lifecycle.track(directory)
+            lifecycle.enforce()
+    except Exception as e:
+        logging.error(f"Failed to enforce the disk budget of {output_folder}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report the disk usage of an output folder and keep it within a budget"
+    )
+    parser.add_argument("output_folder", type=str, help="The output folder to manage")
+    parser.add_argument(
+        "--budget",
+        type=str,
+        help="Store a disk budget such as 500G, or 'none' to remove it",
+    )
+    parser.add_argument(
+        "--evict",
+        action="store_true",
+        help="Evict intermediates until the budget is met",
+    )
+    args = parser.parse_args()
+
+    lifecycle = ArtifactLifecycle.for_output(args.output_folder)
+    if args.budget:
+        budget = None if args.budget.lower() == "none" else parse_size(args.budget)
+        lifecycle.set_budget(budget)
+    if args.evict:
+        lifecycle.enforce()
+
+    report = lifecycle.report()
+    budget = report["budget"]
+    print(
+        f"{format_size(report['total_bytes'])} used of "
+        f"{format_size(budget) if budget is not None else 'no budget'}, "
+        f"{format_size(report['disk_free_bytes'])} free on disk."
+    )
+    print(f"Kept: {format_size(report['kept_bytes'])}")
+    for kind, summary in sorted(report["kinds"].items()):
+        print(
+            f"{kind}: {format_size(summary['bytes'])} in {summary['units']} artifacts "
+            f"({format_size(summary['pinned_bytes'])} pinned)"
+        )
+    print(f"Evictable now: {format_size(report['evictable_bytes'])}")
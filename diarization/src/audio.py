@@ -0,0 +1,173 @@
+import os
+import logging
+import subprocess
+import tempfile
+import wave
+import numpy as np
+from src.metrics import metrics
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Whisper and pyannote both consume 16 kHz mono audio
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = np.dtype(np.float32).itemsize
+# Recordings longer than this are kept in a memory-mapped cache file
+MMAP_THRESHOLD_SECONDS = 20 * 60
+# Size of the reads from the ffmpeg pipe
+CHUNK_BYTES = 1 << 20
+
+
+def cache_path_for(audio_file):
+    """
+    Returns the path of the raw 16 kHz mono float32 cache for an audio file.
+    """
+    base, _ = os.path.splitext(audio_file)
+    return f"{base}_16k.f32"
+
+
+def is_cache_fresh(audio_file, cache_file):
+    """
+    Checks whether a decoded cache exists and is not older than its source.
+    """
+    return os.path.exists(cache_file) and (
+        not os.path.exists(audio_file)
+        or os.path.getmtime(cache_file) >= os.path.getmtime(audio_file)
+    )
+
+
+def open_cache(cache_file):
+    """
+    Memory-maps a raw float32 cache copy-on-write, so callers may modify slices.
+    """
+    if os.path.getsize(cache_file) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(cache_file, dtype=np.float32, mode="c")
+
+
+def decode_audio(
+    audio_file,
+    cache_file=None,
+    sample_rate=SAMPLE_RATE,
+    mmap_threshold=MMAP_THRESHOLD_SECONDS,
+):
+    """
+    Streams an audio file through ffmpeg as 16 kHz mono float32 PCM.
+
+    The PCM is read from the ffmpeg pipe in chunks. Short recordings stay in
+    memory; once the output grows past `mmap_threshold` seconds it is spilled
+    to `cache_file` and the result is memory-mapped from there. Pass
+    `mmap_threshold=0` to always produce the cache file.
+    """
+    with metrics.span("ffmpeg", audio_file=audio_file) as span:
+        audio = _decode_audio(audio_file, cache_file, sample_rate, mmap_threshold)
+        span.attributes["audio_seconds"] = len(audio) / sample_rate
+    return audio
+
+
+def _decode_audio(audio_file, cache_file, sample_rate, mmap_threshold):
+    cache_file = cache_file or cache_path_for(audio_file)
+    threshold_bytes = mmap_threshold * sample_rate * BYTES_PER_SAMPLE
+    command = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", audio_file,
+        "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-",
+    ]
+    logging.info(f"Decoding {audio_file} to {sample_rate} Hz mono.")
+
+    buffer = bytearray()
+    part_file = f"{cache_file}.part"
+    spill = None
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+        try:
+            while True:
+                chunk = process.stdout.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                if spill is not None:
+                    spill.write(chunk)
+                    continue
+                buffer += chunk
+                if len(buffer) >= threshold_bytes:
+                    spill = open(part_file, "wb")
+                    spill.write(buffer)
+                    buffer = bytearray()
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+            if spill is not None:
+                spill.close()
+        if returncode != 0:
+            errors.seek(0)
+            message = errors.read().decode(errors="replace").strip()
+            if os.path.exists(part_file):
+                os.remove(part_file)
+            raise RuntimeError(f"ffmpeg failed to decode {audio_file}: {message}")
+
+    if spill is None:
+        if mmap_threshold > 0:
+            return np.frombuffer(buffer, dtype=np.float32)
+        # Empty output never reached the threshold, write it anyway
+        with open(part_file, "wb") as file:
+            file.write(buffer)
+    os.replace(part_file, cache_file)
+    logging.info(f"Decoded audio cached to {cache_file}.")
+    return open_cache(cache_file)
+
+
+def load_audio(audio_file, mmap_threshold=MMAP_THRESHOLD_SECONDS):
+    """
+    Returns an audio file as a 16 kHz mono float32 array, decoding it once.
+
+    Raw `.f32` caches are memory-mapped directly. Other files reuse a fresh
+    cache next to them or are streamed through ffmpeg by decode_audio().
+    """
+    if audio_file.endswith(".f32"):
+        logging.info(f"Memory-mapping decoded audio from {audio_file}.")
+        return open_cache(audio_file)
+
+    cache_file = cache_path_for(audio_file)
+    if is_cache_fresh(audio_file, cache_file):
+        logging.info(f"Memory-mapping decoded audio from {cache_file}.")
+        return open_cache(cache_file)
+    return decode_audio(audio_file, cache_file, mmap_threshold=mmap_threshold)
+
+
+def pipeline_input(audio, sample_rate=SAMPLE_RATE):
+    """
+    Returns samples as the in-memory file a diarization pipeline takes.
+
+    pyannote expects a (channel, time) torch tensor. Without torch only the
+    benchmark's stand-in pipeline can run, and it gets a numpy array of the
+    same shape.
+    """
+    samples = np.ascontiguousarray(audio)
+    try:
+        import torch
+    except ImportError:
+        return {"waveform": samples[np.newaxis], "sample_rate": sample_rate}
+    return {"waveform": torch.from_numpy(samples).unsqueeze(0), "sample_rate": sample_rate}
+
+
+def slice_segment(audio, start, end, sample_rate=SAMPLE_RATE):
+    """
+    Returns a zero-copy view of the samples between start and end seconds.
+    """
+    start_sample = max(int(start * sample_rate), 0)
+    end_sample = min(int(end * sample_rate), len(audio))
+    return audio[start_sample:max(start_sample, end_sample)]
+
+
+def save_wav(filename, samples, sample_rate=SAMPLE_RATE):
+    """
+    Writes float32 samples to a 16-bit mono WAV file.
+    """
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    with wave.open(filename, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
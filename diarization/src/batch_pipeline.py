@@ -0,0 +1,315 @@
+import os
+import logging
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from src.metrics import metrics
+from src.artifact_lifecycle import ArtifactLifecycle, enforce_budget
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Marks the end of the input for a stage
+_DONE = object()
+
+
+class Stage:
+    """
+    A pipeline stage that applies a function to jobs with bounded concurrency.
+
+    I/O stages run the function directly on their worker threads. Inference
+    stages pass an executor; each worker thread then submits one job at a
+    time to it, so at most `concurrency` jobs of the stage are in flight.
+    """
+
+    def __init__(self, name, func, concurrency=1, executor=None):
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.executor = executor
+
+    def process(self, job):
+        if self.executor is None:
+            return self.func(job)
+        job, snapshot = self.executor.submit(_run_traced, self.func, job).result()
+        metrics.merge(snapshot)
+        return job
+
+
+def _run_traced(func, job):
+    """
+    Runs a job in a worker process and returns it with the spans it recorded.
+    """
+    return func(job), metrics.drain()
+
+
+class BatchPipeline:
+    """
+    Runs jobs through a sequence of stages connected by bounded queues.
+
+    Every stage works on a different job at the same time, so downloads keep
+    the network busy while earlier jobs are being diarized and transcribed.
+    The queue size caps how many finished-but-unconsumed jobs pile up
+    between two stages.
+    """
+
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.results = []
+        self._results_lock = threading.Lock()
+
+    def run(self, jobs):
+        """
+        Pushes the jobs through all stages and returns one result per job.
+        """
+        threads = []
+        for index, stage in enumerate(self.stages):
+            remaining = [stage.concurrency]
+            for worker in range(stage.concurrency):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(index, remaining),
+                    name=f"{stage.name}-{worker}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        for job in jobs:
+            job["queued_at"] = time.perf_counter()
+            self.queues[0].put(job)
+        self.queues[0].put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        return self.results
+
+    def _work(self, index, remaining):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            job = inbox.get()
+            if job is _DONE:
+                # Let the sibling workers see the marker, the last one forwards it
+                inbox.put(_DONE)
+                with self._results_lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last and outbox is not None:
+                    outbox.put(_DONE)
+                return
+
+            metrics.record(
+                f"{stage.name}_queue_wait",
+                time.perf_counter() - job.pop("queued_at"),
+                detail=False,
+            )
+            try:
+                job = stage.process(job)
+            except Exception as e:
+                logging.error(f"Stage {stage.name} failed for {job.get('url')}: {e}")
+                self._record(job, "failure", error=f"{stage.name}: {e}")
+                continue
+
+            if outbox is not None:
+                job["queued_at"] = time.perf_counter()
+                outbox.put(job)
+            else:
+                self._record(job, "success")
+
+    def _record(self, job, status, error=None):
+        result = {"url": job.get("url"), "status": status}
+        if "protocol_file" in job:
+            result["protocol_file"] = job["protocol_file"]
+        if error:
+            result["error"] = error
+        with self._results_lock:
+            self.results.append(result)
+
+
+def download_job(job):
+    """
+    Downloads the audio for a job and records its output paths.
+    """
+    from src.youtube_downloader import YouTubeDownloader
+
+    downloader = YouTubeDownloader(
+        job["url"],
+        job["output_folder"],
+        keep_wav=job["keep_wav"],
+        use_cache=job["use_cache"],
+    )
+    # Pinned until the job is transcribed or the batch ends
+    job["pin"] = ArtifactLifecycle.for_output(job["output_folder"]).pin(
+        downloader.base_dir, job_id=job["batch_id"]
+    )
+    enforce_budget(job["output_folder"])
+    job["base_dir"] = downloader.base_dir
+    job["video_id"] = downloader.video_id
+    job["audio_file"] = downloader.download_audio()
+    _, job["pcm_file"], job["wav_file"] = downloader.audio_paths()
+    return job
+
+
+def decode_job(job):
+    """
+    Streams the downloaded audio of a job through ffmpeg into its PCM cache,
+    and into a full-rate WAV copy when the job keeps one.
+    """
+    from src.audio import is_cache_fresh
+    from src.youtube_downloader import convert_to_wav, decode_to_cache
+
+    if not is_cache_fresh(job["audio_file"], job["pcm_file"]):
+        decode_to_cache(
+            job["audio_file"], job["pcm_file"], _job_cache(job), job["video_id"]
+        )
+    if job["keep_wav"] and not os.path.exists(job["wav_file"]):
+        convert_to_wav(job["audio_file"], job["wav_file"])
+    return job
+
+
+def diarize_job(job):
+    """
+    Runs speaker diarization for a job in an inference worker process.
+    """
+    from diarization import Diarization
+
+    Diarization(
+        job["pcm_file"],
+        cache=_job_cache(job),
+        video_id=job["video_id"],
+        shard_workers=job["shard_workers"],
+        profile=job["profile"],
+    ).diarize()
+    return job
+
+
+def transcribe_job(job):
+    """
+    Transcribes the diarized turns of a job and writes protocol.json.
+    """
+    from diarization import Diarization
+
+    protocol_json_file = os.path.join(job["base_dir"], "protocol.json")
+    # The same shard setting as diarize_job, which is part of the cache key
+    diarization = Diarization(
+        job["pcm_file"],
+        cache=_job_cache(job),
+        video_id=job["video_id"],
+        shard_workers=job["shard_workers"],
+        profile=job["profile"],
+        save_segments=job["save_segments"],
+    )
+    diarization.save_protocol(
+        diarization.diarize(),
+        protocol_json_file,
+        mode=job["mode"],
+        batch_size=job["batch_size"],
+    )
+    diarization.finish_protocol(
+        job["output_folder"], protocol_json_file, job["global_speakers"]
+    )
+    ArtifactLifecycle.for_output(job["output_folder"]).unpin(job["pin"])
+    job["protocol_file"] = protocol_json_file
+    return job
+
+
+def _job_cache(job):
+    """
+    Opens the artifact cache of a job's output folder, if caching is enabled.
+    """
+    from src.artifact_cache import ArtifactCache
+
+    if not job["use_cache"]:
+        return None
+    return ArtifactCache.for_output(job["output_folder"])
+
+
+def _init_inference_worker(profile, workers):
+    """
+    Sizes the torch thread pools so inference processes do not oversubscribe.
+    """
+    from src.compute_profiles import configure_threads
+
+    configure_threads(profile, workers)
+
+
+def run_batch(
+    urls,
+    output_folder,
+    mode="segment",
+    batch_size=1,
+    download_workers=4,
+    decode_workers=2,
+    diarize_workers=1,
+    transcribe_workers=1,
+    queue_size=4,
+    use_cache=True,
+    profile=None,
+    global_speakers=False,
+    keep_wav=False,
+    shard_workers=0,
+    save_segments=False,
+):
+    """
+    Processes many YouTube URLs with overlapping download, decoding,
+    diarization and transcription stages.
+
+    keep_wav, shard_workers and save_segments act as in diarization.main.
+    """
+    inference_workers = diarize_workers + transcribe_workers
+    # Spawned workers do not inherit the pipeline threads or loaded models
+    context = multiprocessing.get_context("spawn")
+    diarize_pool = ProcessPoolExecutor(
+        diarize_workers,
+        mp_context=context,
+        initializer=_init_inference_worker,
+        initargs=(profile, inference_workers),
+    )
+    transcribe_pool = ProcessPoolExecutor(
+        transcribe_workers,
+        mp_context=context,
+        initializer=_init_inference_worker,
+        initargs=(profile, inference_workers),
+    )
+
+    stages = [
+        Stage("download", download_job, download_workers),
+        Stage("decode", decode_job, decode_workers),
+        Stage("diarize", diarize_job, diarize_workers, diarize_pool),
+        Stage("transcribe", transcribe_job, transcribe_workers, transcribe_pool),
+    ]
+    # Pins of jobs that failed before transcription are removed with the batch
+    batch_id = f"batch-{os.getpid()}-{time.time():.0f}"
+    jobs = (
+        {
+            "url": url,
+            "output_folder": output_folder,
+            "mode": mode,
+            "batch_size": batch_size,
+            "use_cache": use_cache,
+            "profile": profile,
+            "global_speakers": global_speakers,
+            "keep_wav": keep_wav,
+            "shard_workers": shard_workers,
+            "save_segments": save_segments,
+            "batch_id": batch_id,
+        }
+        for url in urls
+    )
+    try:
+        results = BatchPipeline(stages, queue_size=queue_size).run(jobs)
+    finally:
+        diarize_pool.shutdown()
+        transcribe_pool.shutdown()
+        ArtifactLifecycle.for_output(output_folder).unpin_job(batch_id)
+
+    succeeded = sum(result["status"] == "success" for result in results)
+    logging.info(f"Batch finished: {succeeded} of {len(results)} URLs succeeded.")
+    return results
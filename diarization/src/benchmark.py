@@ -0,0 +1,411 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import numpy as np
+
+from src.audio import SAMPLE_RATE, load_audio, save_wav, slice_segment
+from src.create_protocol import prepare_protocol, save_protocol_as_text
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# A stage is reported as a regression when it is this much slower than baseline
+REGRESSION_TOLERANCE = 0.10
+
+
+def synthesize_conversation(duration=300.0, turns=100, speakers=3, seed=0):
+    """
+    Creates synthetic multi-speaker audio with known speaker turns.
+
+    Every speaker is a harmonic voice with its own pitch and syllable rate;
+    turns have random lengths and are separated by short pauses. Returns the
+    16 kHz mono float32 samples and the ground-truth turns.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(duration * SAMPLE_RATE)
+    audio = (rng.standard_normal(total) * 0.003).astype(np.float32)
+
+    weights = rng.uniform(0.5, 1.5, turns)
+    pauses = rng.uniform(0.1, 0.8, turns)
+    scale = (duration - pauses.sum()) / weights.sum()
+    pitches = rng.uniform(90.0, 260.0, speakers)
+
+    ground_truth = []
+    position = 0.0
+    speaker = 0
+    for weight, pause in zip(weights, pauses):
+        position += pause
+        start, end = float(position), float(min(position + weight * scale, duration))
+        position = end
+        # Mostly alternate speakers, sometimes keep the same one
+        if rng.random() > 0.2:
+            speaker = (speaker + int(rng.integers(1, max(speakers, 2)))) % speakers
+
+        first, last = int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        t = np.arange(last - first) / SAMPLE_RATE
+        voice = sum(
+            np.sin(2 * np.pi * pitches[speaker] * harmonic * t) / harmonic
+            for harmonic in range(1, 5)
+        )
+        syllables = 0.5 + 0.5 * np.sin(2 * np.pi * (3.0 + speaker) * t)
+        audio[first:last] += (0.2 * voice * syllables).astype(np.float32)
+        ground_truth.append(
+            {"start": start, "end": end, "speaker": f"SPEAKER_{speaker:02d}"}
+        )
+    return audio, ground_truth
+
+
+class FakeDownloader:
+    """
+    Stands in for YouTubeDownloader by writing synthetic audio to disk.
+    """
+
+    def __init__(self, output_folder, audio, video_id="synthetic"):
+        self.output_folder = output_folder
+        self.video_id = video_id
+        self.cache = None
+        self.base_dir = os.path.join(output_folder, video_id)
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.audio = audio
+
+    def download(self):
+        """
+        Writes the synthetic audio as a WAV file, as a finished download would be.
+        """
+        audio_path = os.path.join(self.base_dir, f"{self.video_id}_audio.wav")
+        save_wav(audio_path, self.audio)
+        return audio_path, audio_path
+
+
+class StubPipeline:
+    """
+    A stand-in for the pyannote pipeline that returns known turns.
+
+    It computes frame energies over the whole waveform so its cost still grows
+    with the audio length.
+    """
+
+    def __init__(self, turns):
+        self.turns = turns
+
+    def __call__(self, file, return_embeddings=False, hook=None):
+        from src.annotation import Annotation, Segment
+
+        # A torch tensor with pyannote installed, a numpy array without
+        waveform = np.asarray(file["waveform"])[0]
+        frames = len(waveform) // 160
+        np.square(waveform[: frames * 160].reshape(frames, 160)).mean(axis=1)
+        if hook is not None:
+            # Reports one finished step, like the hooks of the real pipeline
+            hook("segmentation", None, file=file, total=frames, completed=frames)
+
+        annotation = Annotation()
+        for turn in self.turns:
+            annotation[Segment(turn["start"], turn["end"])] = turn["speaker"]
+        if not return_embeddings:
+            return annotation
+        labels = annotation.labels()
+        return annotation, np.eye(len(labels), 16, dtype=np.float32)
+
+
+class StubWhisper:
+    """
+    A stand-in for a Whisper model that emits one word per half second.
+
+    Batched decoding receives real log-mel features, so the feature
+    extraction cost of the real pipeline is still measured.
+    """
+
+    class _Dims:
+        n_mels = 128
+
+    class _Result:
+        def __init__(self, text):
+            self.text = text
+
+    dims = _Dims()
+    device = "cpu"
+
+    def _words(self, seconds, offset=0.0):
+        return [
+            {
+                "start": offset + index * 0.5,
+                "end": offset + index * 0.5 + 0.4,
+                "word": " word",
+            }
+            for index in range(max(1, int(seconds / 0.5)))
+        ]
+
+    def transcribe(self, audio, word_timestamps=False, **kwargs):
+        words = self._words(len(audio) / SAMPLE_RATE)
+        return {
+            "text": "".join(word["word"] for word in words),
+            "segments": [{"words": words}] if word_timestamps else [],
+        }
+
+    def decode(self, mel, options):
+        return [self._Result("word " * max(1, int(mel.shape[-1] / 300))) for _ in mel]
+
+
+def install_stub_models(turns, profile=None):
+    """
+    Registers the stand-in models under the keys Diarization and Transcriber use.
+
+    Stand-in models never reach Hugging Face, so a missing token is set to
+    a placeholder here rather than for every process importing this module.
+    """
+    os.environ.setdefault("HUGGING_FACE_TOKEN", "offline-benchmark")
+    from diarization import DIARIZATION_MODEL, pipeline_device
+    from src.compute_profiles import get_profile
+    from src.model_registry import pipeline_key, registry, whisper_key
+
+    profile = get_profile(profile)
+    registry.register(
+        pipeline_key(DIARIZATION_MODEL, pipeline_device()), StubPipeline(turns)
+    )
+    registry.register(
+        whisper_key(profile["whisper_model"], dtype=profile["whisper_dtype"]),
+        StubWhisper(),
+    )
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_benchmark(
+    duration=300.0,
+    turns=100,
+    speakers=3,
+    mode="segment",
+    batch_size=1,
+    real_models=False,
+    seed=0,
+    profile=None,
+):
+    """
+    Runs every pipeline stage on synthetic audio and returns timing metrics.
+
+    The report keeps the texts of the protocol under "transcript" so runs of
+    different compute profiles can be compared.
+    """
+    from diarization import Diarization
+    from src.compute_profiles import configure_threads, get_profile
+
+    profile = get_profile(profile)
+    configure_threads(profile)
+    audio, ground_truth = synthesize_conversation(duration, turns, speakers, seed)
+    if not real_models:
+        install_stub_models(ground_truth, profile["name"])
+
+    work_dir = tempfile.mkdtemp(prefix="diarization_benchmark_")
+    stages = {}
+
+    def timed(stage, func):
+        started = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - started
+        stages[stage] = {
+            "seconds": seconds,
+            "real_time_factor": seconds / duration,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        return result
+
+    try:
+        downloader = FakeDownloader(work_dir, audio)
+        _, audio_file = downloader.download()
+        decoded = timed("decode", lambda: load_audio(audio_file, mmap_threshold=0))
+
+        # Reuses the cache written by the decode stage
+        diarization = Diarization(audio_file, profile=profile["name"])
+        annotation = timed("diarize", diarization.diarize)
+        tracks = list(annotation.itertracks(yield_label=True))
+
+        timed(
+            "segment_extraction",
+            lambda: [
+                slice_segment(decoded, turn.start, turn.end) for turn, _, _ in tracks
+            ],
+        )
+        protocol = timed(
+            "transcription",
+            lambda: diarization.create_protocol(
+                annotation, mode=mode, batch_size=batch_size
+            ),
+        )
+
+        def postprocess():
+            prepared = prepare_protocol(protocol)
+            save_protocol_as_text(
+                prepared, os.path.join(downloader.base_dir, "prepared_protocol.txt")
+            )
+
+        timed("postprocess", postprocess)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    transcription_seconds = stages["transcription"]["seconds"]
+    segments_per_second = (
+        len(tracks) / transcription_seconds if transcription_seconds > 0 else 0.0
+    )
+    return {
+        "config": {
+            "duration": duration,
+            "turns": turns,
+            "speakers": speakers,
+            "mode": mode,
+            "batch_size": batch_size,
+            "real_models": real_models,
+            "seed": seed,
+            "profile": profile["name"],
+        },
+        "stages": stages,
+        "total_seconds": sum(stage["seconds"] for stage in stages.values()),
+        "segments": len(tracks),
+        "segments_per_second": segments_per_second,
+        "peak_rss_mb": peak_rss_mb(),
+        "transcript": [segment.get("text", "") for segment in protocol],
+    }
+
+
+def word_error_rate(reference, hypothesis):
+    """
+    Returns the word-level edit distance between two texts over the reference length.
+    """
+    reference, hypothesis = reference.split(), hypothesis.split()
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ref_word != hyp_word),
+                )
+            )
+        previous = current
+    return previous[-1] / max(1, len(reference))
+
+
+def compare_profiles(profiles, **kwargs):
+    """
+    Benchmarks several compute profiles on the same audio.
+
+    The synthetic audio has no spoken words, so accuracy is measured as the
+    word error rate of each profile's transcript against the first profile's.
+    Meaningful with --real-models; stand-in models give the same text.
+    """
+    reports = {name: run_benchmark(profile=name, **kwargs) for name in profiles}
+    reference = " ".join(reports[profiles[0]]["transcript"])
+    return {
+        name: {
+            "transcription_seconds": report["stages"]["transcription"]["seconds"],
+            "real_time_factor": report["stages"]["transcription"]["real_time_factor"],
+            "segments_per_second": report["segments_per_second"],
+            "peak_rss_mb": report["peak_rss_mb"],
+            f"wer_vs_{profiles[0]}": word_error_rate(
+                reference, " ".join(report["transcript"])
+            ),
+        }
+        for name, report in reports.items()
+    }
+
+
+def compare_with_baseline(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compares stage timings with a saved report and lists the regressions.
+    """
+    comparison = {}
+    for stage, metrics in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or previous["seconds"] <= 0:
+            continue
+        ratio = metrics["seconds"] / previous["seconds"]
+        comparison[stage] = {
+            "baseline_seconds": previous["seconds"],
+            "seconds": metrics["seconds"],
+            "ratio": ratio,
+            "regression": ratio > 1 + tolerance,
+        }
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline stages on synthetic audio"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=300.0, help="Audio length in seconds"
+    )
+    parser.add_argument("--turns", type=int, default=100, help="Number of speaker turns")
+    parser.add_argument("--speakers", type=int, default=3, help="Number of speakers")
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=["segment", "packed", "single_pass"],
+        default="segment",
+        help="Protocol mode",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1, help="Transcription batch size"
+    )
+    parser.add_argument(
+        "--real-models",
+        action="store_true",
+        help="Use the real pyannote and Whisper models instead of stand-ins",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the audio")
+    parser.add_argument("--profile", type=str, help="Compute profile to benchmark")
+    parser.add_argument(
+        "--compare-profiles",
+        type=str,
+        help="Comma-separated compute profiles to compare, the first is the reference",
+    )
+    parser.add_argument("--output", type=str, help="Write the JSON report to this file")
+    parser.add_argument(
+        "--baseline", type=str, help="A saved report to compare against"
+    )
+    args = parser.parse_args()
+
+    options = {
+        "duration": args.duration,
+        "turns": args.turns,
+        "speakers": args.speakers,
+        "mode": args.mode,
+        "batch_size": args.batch_size,
+        "real_models": args.real_models,
+        "seed": args.seed,
+    }
+    if args.compare_profiles:
+        comparison = compare_profiles(args.compare_profiles.split(","), **options)
+        print(json.dumps(comparison, indent=4))
+        sys.exit(0)
+
+    report = run_benchmark(profile=args.profile, **options)
+    report.pop("transcript")
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            report["comparison"] = compare_with_baseline(report, json.load(file))
+
+    output = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+    if any(stage["regression"] for stage in report.get("comparison", {}).values()):
+        sys.exit(1)
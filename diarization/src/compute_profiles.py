@@ -0,0 +1,102 @@
+import os
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Named trade-offs between transcription accuracy and CPU throughput.
+# int8 applies dynamic quantization to the Whisper linear layers and runs on
+# the CPU; thread counts of None are derived from the CPUs per worker.
+PROFILES = {
+    "accurate": {
+        "whisper_model": "turbo",
+        "whisper_dtype": "float32",
+        "intra_op_threads": None,
+        "inter_op_threads": 1,
+    },
+    "balanced": {
+        "whisper_model": "turbo",
+        "whisper_dtype": "int8",
+        "intra_op_threads": None,
+        "inter_op_threads": 1,
+    },
+    "fast": {
+        "whisper_model": "base",
+        "whisper_dtype": "int8",
+        "intra_op_threads": None,
+        "inter_op_threads": 1,
+    },
+}
+DEFAULT_PROFILE = os.getenv("DIARIZATION_PROFILE", "accurate")
+
+
+def get_profile(name=None):
+    """
+    Returns the settings of a compute profile, the default one if name is None.
+    """
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(
+            f"Unknown compute profile: {name} (choose from {', '.join(PROFILES)})"
+        )
+    return dict(PROFILES[name], name=name)
+
+
+def configure_threads(profile=None, workers=1):
+    """
+    Sets the torch thread pools of this process for a profile.
+
+    Inference that runs on `workers` concurrent threads or processes of one
+    machine shares its CPUs, so each gets cpu_count // workers intra-op
+    threads unless the profile or DIARIZATION_TORCH_THREADS fixes a count.
+    Returns the (intra-op, inter-op) thread counts.
+    """
+    profile = get_profile(profile) if not isinstance(profile, dict) else profile
+    intra_op = (
+        int(os.getenv("DIARIZATION_TORCH_THREADS", "0"))
+        or profile["intra_op_threads"]
+        or max(1, (os.cpu_count() or 1) // max(1, workers))
+    )
+    inter_op = (
+        int(os.getenv("DIARIZATION_TORCH_INTEROP_THREADS", "0"))
+        or profile["inter_op_threads"]
+    )
+    try:
+        import torch
+    except ImportError:
+        # Only the benchmark's stand-in models run without torch
+        logging.info(f"Compute profile {profile['name']}: torch is not installed.")
+        return intra_op, inter_op
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_num_interop_threads(inter_op)
+    except RuntimeError:
+        # The inter-op pool can only be sized before it is first used
+        logging.warning(
+            f"Inter-op threads already fixed at {torch.get_num_interop_threads()}."
+        )
+    logging.info(
+        f"Compute profile {profile['name']}: {intra_op} intra-op and "
+        f"{torch.get_num_interop_threads()} inter-op threads."
+    )
+    return intra_op, torch.get_num_interop_threads()
+
+
+def quantize_whisper(model):
+    """
+    Dynamically quantizes the linear layers of a Whisper model to int8.
+
+    Whisper uses its own Linear subclass, which the quantization mappings do
+    not recognize; its only difference is casting weights to the input dtype,
+    a no-op in float32, so the layers are turned into plain nn.Linear first.
+    """
+    import torch
+
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
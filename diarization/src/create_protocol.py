@@ -2,6 +2,13 @@ import json
 import os
 import re
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Segments shorter than this are dropped from prepared protocols
+MIN_SEGMENT_SECONDS = 1.0
+WHITESPACE = re.compile(r'\s+')
+PROTOCOL_FILE = 'protocol.json'
 
 def load_protocol(file_path):
     """
@@ -15,7 +22,7 @@ def clean_protocol(protocol):
     Cleans the protocol by removing multiple spaces from the text.
     """
     for segment in protocol:
-        segment['text'] = re.sub(r'\s+', ' ', segment['text']).strip()
+        segment['text'] = WHITESPACE.sub(' ', segment['text']).strip()
     return protocol
 
 def filter_protocol(protocol):
@@ -24,7 +31,7 @@ def filter_protocol(protocol):
     """
     return [
         segment for segment in protocol
-        if (segment['end'] - segment['start']) >= 1.0
+        if (segment['end'] - segment['start']) >= MIN_SEGMENT_SECONDS
     ]
 
 def squash_consecutive_segments(protocol):
@@ -45,6 +52,43 @@ def squash_consecutive_segments(protocol):
     return squashed_protocol
 
 
+def prepare_segments(segments):
+    """
+    Cleans, filters and squashes segments in a single streaming pass.
+
+    Yields the same segments as running clean_protocol, filter_protocol and
+    squash_consecutive_segments one after another, without building the
+    intermediate lists or modifying the input. Like the squash, a merged
+    segment keeps the other fields of its first segment, e.g. global_speaker.
+    """
+    current = None
+    for segment in segments:
+        if (segment['end'] - segment['start']) < MIN_SEGMENT_SECONDS:
+            continue
+        text = WHITESPACE.sub(' ', segment['text']).strip()
+        if current is not None and segment['speaker'] == current['speaker']:
+            current['end'] = segment['end']
+            current['texts'].append(text)
+            continue
+        if current is not None:
+            yield _finish_segment(current)
+        current = {**segment, 'texts': [text]}
+    if current is not None:
+        yield _finish_segment(current)
+
+
+def _finish_segment(current):
+    current['text'] = " ".join(current.pop('texts'))
+    return current
+
+
+def prepare_protocol(protocol):
+    """
+    Returns the prepared protocol as a list.
+    """
+    return list(prepare_segments(protocol))
+
+
 def save_protocol_as_text(protocol, output_file):
     """
     Saves the protocol to a text file in a readable format.
@@ -53,26 +97,163 @@ def save_protocol_as_text(protocol, output_file):
         for entry in protocol:
             text_file.write(f"{entry['start']:.0f};{entry['text']}\n")
 
-def main(input_file):
+def save_protocol_as_jsonl(protocol, output_file):
+    """
+    Saves the protocol as one JSON object per segment.
+    """
+    with open(output_file, 'w') as jsonl_file:
+        for entry in protocol:
+            jsonl_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def save_protocol_as_parquet(protocol, output_file):
+    """
+    Saves the protocol as a Parquet table with start, end, speaker and text
+    columns, followed by any other segment fields.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Parquet output requires pyarrow. Install the parquet extra: "
+            "uv sync --extra parquet, or pip install 'diarization[parquet]'."
+        ) from e
+
+    columns = ['start', 'end', 'speaker', 'text']
+    for entry in protocol:
+        columns += [column for column in entry if column not in columns]
+    table = pa.table({
+        column: [entry.get(column) for entry in protocol]
+        for column in columns
+    })
+    pq.write_table(table, output_file)
+
+# Output formats by file extension
+FORMATS = {
+    'txt': save_protocol_as_text,
+    'jsonl': save_protocol_as_jsonl,
+    'parquet': save_protocol_as_parquet,
+}
+
+def prepared_path(input_file, output_format='txt'):
+    """
+    Returns the path of the prepared output of a protocol file.
+    """
+    name, _ = os.path.splitext(os.path.basename(input_file))
+    return os.path.join(os.path.dirname(input_file), f"prepared_{name}.{output_format}")
+
+def is_up_to_date(input_file, output_file):
+    """
+    Checks whether a prepared output exists and is not older than its protocol.
+    """
+    return (
+        os.path.exists(output_file)
+        and os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+    )
+
+def process_protocol(input_file, formats=('txt',), force=False):
+    """
+    Prepares one protocol file in the given formats.
+
+    Outputs that are newer than the protocol are kept unless force is set.
+    Outputs are written to a temporary file first, so an interrupted run
+    never leaves a partial file that looks up to date. Returns the list of
+    written output files.
+    """
+    outputs = {
+        output_format: prepared_path(input_file, output_format)
+        for output_format in formats
+        if force or not is_up_to_date(input_file, prepared_path(input_file, output_format))
+    }
+    if not outputs:
+        return []
+
+    protocol = prepare_protocol(load_protocol(input_file))
+    for output_format, output_file in outputs.items():
+        temporary = f"{output_file}.tmp"
+        FORMATS[output_format](protocol, temporary)
+        os.replace(temporary, output_file)
+    return list(outputs.values())
+
+def find_protocols(root):
+    """
+    Yields every protocol.json below an output root, skipping the artifact cache.
+    """
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+        if PROTOCOL_FILE in files:
+            yield os.path.join(directory, PROTOCOL_FILE)
+
+def _process_safely(input_file, formats, force):
+    try:
+        return input_file, process_protocol(input_file, formats, force), None
+    except Exception as e:
+        return input_file, [], str(e)
+
+def process_tree(root, formats=('txt',), workers=None, force=False):
+    """
+    Prepares every protocol below an output root on a pool of processes.
+
+    Returns counts of the prepared, skipped and failed protocols.
+    """
+    protocols = list(find_protocols(root))
+    workers = workers or os.cpu_count() or 1
+    counts = {'prepared': 0, 'skipped': 0, 'failed': 0}
+    with ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context('spawn')
+    ) as executor:
+        results = executor.map(
+            _process_safely,
+            protocols,
+            [formats] * len(protocols),
+            [force] * len(protocols),
+            chunksize=max(1, len(protocols) // (workers * 8)),
+        )
+        for input_file, written, error in results:
+            if error:
+                print(f"Failed to prepare {input_file}: {error}")
+                counts['failed'] += 1
+            elif written:
+                counts['prepared'] += 1
+            else:
+                counts['skipped'] += 1
+    print(
+        f"Prepared {counts['prepared']} protocols, skipped {counts['skipped']} "
+        f"up-to-date and {counts['failed']} failed under {root}."
+    )
+    return counts
+
+def main(input_file, formats=('txt',), force=False):
     if not os.path.exists(input_file):
         print(f"File {input_file} does not exist.")
         return
 
-    protocol = load_protocol(input_file)
-    protocol = clean_protocol(protocol)
-    protocol = filter_protocol(protocol)
-    protocol = squash_consecutive_segments(protocol)
-
-    base_dir = os.path.dirname(input_file)
-    base_name = os.path.basename(input_file)
-    name, ext = os.path.splitext(base_name)
-    output_text = os.path.join(base_dir, f"prepared_{name}.txt")
-
-    save_protocol_as_text(protocol, output_text)
+    process_protocol(input_file, formats, force=force)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process and filter a protocol.")
-    parser.add_argument("input_file", type=str, help="Path to the input protocol file")
+    parser.add_argument(
+        "input_file",
+        type=str,
+        help="Path to the input protocol file, or an output folder to process in bulk",
+    )
+    parser.add_argument(
+        "--format",
+        dest="formats",
+        action="append",
+        choices=sorted(FORMATS),
+        help="Output format, can be repeated (default: txt)",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Processes for bulk mode (default: all CPUs)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Rewrite outputs that are up to date"
+    )
 
     args = parser.parse_args()
-    main(args.input_file)
\ No newline at end of file
+    formats = tuple(args.formats or ['txt'])
+    if os.path.isdir(args.input_file):
+        process_tree(args.input_file, formats, workers=args.workers, force=args.force)
+    else:
+        main(args.input_file, formats, force=args.force)
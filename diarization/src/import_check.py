@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+# Modules imported to submit tasks, render the UI or start the CLI
+ENTRY_POINTS = (
+    "diarization",
+    "celery_task",
+    "streamlit_app",
+    "src.job_index",
+    "src.protocol_index",
+    "src.create_protocol",
+)
+# Dependencies that must only be imported once a model or download is needed
+HEAVY_MODULES = ("torch", "whisper", "pyannote", "pytubefix", "pydub")
+IMPORT_BUDGET_SECONDS = 1.0
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": seconds,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure_import(module, show_slowest=0):
+    """
+    Imports a module in a fresh interpreter without HUGGING_FACE_TOKEN.
+
+    The interpreter runs in an empty working directory, so the Streamlit
+    script renders into a throwaway default output folder. Returns the import time, the heavy modules it pulled in and, on request,
+    the slowest imports reported by `python -X importtime`.
+    """
+    env = {key: value for key, value in os.environ.items() if key != "HUGGING_FACE_TOKEN"}
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [PROJECT_DIR, os.environ.get("PYTHONPATH")])
+    )
+    command = [sys.executable]
+    if show_slowest:
+        command += ["-X", "importtime"]
+    command += ["-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)]
+    with tempfile.TemporaryDirectory() as work_dir:
+        process = subprocess.run(
+            command, cwd=work_dir, env=env, capture_output=True, text=True
+        )
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()
+        return {"module": module, "error": error[-1] if error else "import failed"}
+
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["module"] = module
+    if show_slowest:
+        result["slowest"] = _slowest_imports(process.stderr, show_slowest)
+    return result
+
+
+def _slowest_imports(importtime_output, count):
+    """
+    Returns the imports with the largest cumulative time from -X importtime output.
+    """
+    timings = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        timings.append((int(cumulative), name.strip()))
+    return [
+        {"module": name, "seconds": microseconds / 1e6}
+        for microseconds, name in sorted(timings, reverse=True)[:count]
+    ]
+
+
+def check_imports(modules=ENTRY_POINTS, budget=IMPORT_BUDGET_SECONDS, show_slowest=0):
+    """
+    Measures the entry points and returns their results and the list of problems.
+    """
+    results = [measure_import(module, show_slowest) for module in modules]
+    problems = []
+    for result in results:
+        if "error" in result:
+            problems.append(f"{result['module']} failed to import: {result['error']}")
+            continue
+        if result["heavy"]:
+            problems.append(
+                f"{result['module']} imports {', '.join(result['heavy'])} at import time"
+            )
+        if result["seconds"] > budget:
+            problems.append(
+                f"{result['module']} took {result['seconds']:.2f}s to import "
+                f"(budget {budget:.2f}s)"
+            )
+    return results, problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that the entry points import fast and without the models"
+    )
+    parser.add_argument(
+        "modules", nargs="*", default=list(ENTRY_POINTS), help="Modules to check"
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=IMPORT_BUDGET_SECONDS,
+        help="Maximum import time in seconds",
+    )
+    parser.add_argument(
+        "--slowest", type=int, default=0, help="Also list the N slowest imports"
+    )
+    args = parser.parse_args()
+
+    results, problems = check_imports(args.modules, args.budget, args.slowest)
+    for result in results:
+        if "error" in result:
+            continue
+        print(f"{result['module']}: {result['seconds']:.3f}s")
+        for slow in result.get("slowest", []):
+            print(f"    {slow['seconds']:.3f}s {slow['module']}")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,114 @@
+import os
+import json
+import sqlite3
+import time
+
+JOB_INDEX_FILE_NAME = "jobs.sqlite"
+# Celery states after which a task never changes again
+FINISHED_STATES = ("SUCCESS", "FAILURE", "REVOKED")
+
+
+def task_result(result):
+    """
+    Returns a task result as a dict, or None.
+
+    Revoked and lost tasks report an exception instead of a result dict;
+    its text is kept as {"status": "error", "message": ...}.
+    """
+    if result is None or isinstance(result, dict):
+        return result
+    return {"status": "error", "message": str(result)}
+
+
+class JobIndex:
+    """
+    A SQLite record of the diarization tasks started for an output folder.
+
+    The Celery result backend cannot list tasks and forgets results after a
+    while, so the dashboard records every task it starts here and copies the
+    final state and result once the task is finished. Every call opens its
+    own connection, like ProtocolIndex.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    task_id TEXT PRIMARY KEY,
+                    url TEXT,
+                    output_folder TEXT,
+                    state TEXT,
+                    result TEXT,
+                    submitted REAL,
+                    updated REAL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_submitted ON jobs (submitted)"
+            )
+
+    @classmethod
+    def for_output(cls, output_folder):
+        """
+        Returns the job index kept in an output folder.
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        return cls(os.path.join(output_folder, JOB_INDEX_FILE_NAME))
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def add(self, task_id, url, output_folder):
+        """
+        Records a newly started task.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task_id, url, output_folder, "PENDING", None, now, now),
+            )
+
+    def update(self, task_id, state, result=None):
+        """
+        Stores the latest state and result of a task.
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = ?, result = ?, updated = ? WHERE task_id = ?",
+                (state, json.dumps(task_result(result), default=str), time.time(), task_id),
+            )
+
+    def count(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def jobs(self, offset=0, limit=50, unfinished_only=False):
+        """
+        Returns a page of the recorded tasks, newest first.
+        """
+        sql = "SELECT task_id, url, output_folder, state, result, submitted, updated FROM jobs"
+        params = []
+        if unfinished_only:
+            sql += f" WHERE state NOT IN ({', '.join('?' * len(FINISHED_STATES))})"
+            params += FINISHED_STATES
+        sql += " ORDER BY submitted DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._connect() as connection:
+            rows = connection.execute(sql, params).fetchall()
+        return [
+            {
+                "task_id": task_id,
+                "url": url,
+                "output_folder": output_folder,
+                "state": state,
+                # Older rows may hold the plain text of an exception
+                "result": task_result(json.loads(result)) if result else None,
+                "submitted": submitted,
+                "updated": updated,
+            }
+            for task_id, url, output_folder, state, result, submitted, updated in rows
+        ]
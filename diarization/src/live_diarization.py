@@ -0,0 +1,536 @@
+import os
+import time
+import queue
+import bisect
+import logging
+import argparse
+import threading
+import subprocess
+import numpy as np
+from src.audio import (
+    BYTES_PER_SAMPLE,
+    SAMPLE_RATE,
+    load_audio,
+    pipeline_input,
+    slice_segment,
+)
+from src.metrics import metrics
+from src.protocol_journal import ProtocolJournal, journal_path_for
+from src.sharded_diarization import SIMILARITY_THRESHOLD
+from src.turn_packing import MERGE_GAP_SECONDS, WINDOW_SECONDS
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Audio handed over by the sources at a time
+CHUNK_SECONDS = 1.0
+# Each diarization call sees this much audio, ending at the newest samples
+LIVE_WINDOW_SECONDS = 30.0
+# The window is diarized again once this much new audio has arrived
+STEP_SECONDS = 5.0
+# Turns this close to the newest audio may still change and are not final yet
+LOOKAHEAD_SECONDS = 2.0
+# Longer turns are emitted in parts, so a monologue does not hold back the protocol
+MAX_TURN_SECONDS = WINDOW_SECONDS
+# A growing file that has not grown for this long is treated as finished
+IDLE_TIMEOUT_SECONDS = 30.0
+
+
+def ffmpeg_chunks(source, chunk_seconds=CHUNK_SECONDS, follow=False):
+    """
+    Streams any input ffmpeg can read as 16 kHz mono float32 chunks.
+
+    `source` is a file, URL or "-" for stdin. With follow set, a local file
+    that is still being written is read on as it grows.
+    """
+    command = ["ffmpeg", "-loglevel", "error"]
+    if source != "-":
+        command.append("-nostdin")
+    if follow:
+        command += ["-follow", "1"]
+    command += [
+        "-i", "pipe:0" if source == "-" else source,
+        "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    chunk_bytes = int(chunk_seconds * SAMPLE_RATE) * BYTES_PER_SAMPLE
+    stdin = None if source == "-" else subprocess.DEVNULL
+    process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE)
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_bytes)
+            if not chunk:
+                break
+            # Only a final read at the end of the stream can be short
+            usable = len(chunk) - len(chunk) % BYTES_PER_SAMPLE
+            yield np.frombuffer(chunk[:usable], dtype=np.float32)
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
+
+
+def tail_raw_file(
+    path, chunk_seconds=CHUNK_SECONDS, idle_timeout=IDLE_TIMEOUT_SECONDS
+):
+    """
+    Streams a raw float32 file such as a `*_16k.f32.part` cache while it grows.
+    """
+    chunk_bytes = int(chunk_seconds * SAMPLE_RATE) * BYTES_PER_SAMPLE
+    pending = b""
+    idle_since = time.monotonic()
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(chunk_bytes - len(pending))
+            if data:
+                pending += data
+                idle_since = time.monotonic()
+                if len(pending) == chunk_bytes:
+                    yield np.frombuffer(pending, dtype=np.float32)
+                    pending = b""
+                continue
+            if time.monotonic() - idle_since > idle_timeout:
+                break
+            time.sleep(min(0.2, chunk_seconds))
+    usable = len(pending) - len(pending) % BYTES_PER_SAMPLE
+    if usable:
+        yield np.frombuffer(pending[:usable], dtype=np.float32)
+
+
+def replay_chunks(audio_file, chunk_seconds=CHUNK_SECONDS, speed=1.0):
+    """
+    Replays a local recording as a live stream at `speed` times real time.
+
+    A speed of 0 hands the chunks over as fast as they are consumed.
+    """
+    audio = load_audio(audio_file)
+    step = int(chunk_seconds * SAMPLE_RATE)
+    chunks = (audio[start : start + step] for start in range(0, len(audio), step))
+    return paced(chunks, speed)
+
+
+def paced(chunks, speed=1.0):
+    """
+    Holds back each chunk until its audio would have arrived in real time.
+    """
+    started = time.monotonic()
+    seconds = 0.0
+    for chunk in chunks:
+        seconds += len(chunk) / SAMPLE_RATE
+        if speed > 0:
+            delay = started + seconds / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield chunk
+
+
+class OnlineSpeakerClusters:
+    """
+    Global speakers of a stream as running centroids of window embeddings.
+
+    Each diarization window names its speakers independently; their
+    embeddings are matched against the centroids seen so far, so a person
+    keeps one label for the whole stream.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.centroids = None
+        self.weights = []
+
+    def assign(self, embeddings, weights):
+        """
+        Maps the speakers of one window to global labels.
+
+        `embeddings` has one row per local speaker and `weights` their speech
+        seconds. Two speakers of a window never get the same label; speakers
+        without a usable embedding map to None.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        usable = [
+            index
+            for index in range(len(embeddings))
+            if np.all(np.isfinite(embeddings[index])) and np.any(embeddings[index])
+        ]
+        assignment = [None] * len(embeddings)
+        if not usable:
+            return assignment
+        vectors = embeddings[usable]
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        if self.centroids is None:
+            self.centroids = np.zeros((0, vectors.shape[1]))
+
+        if len(self.centroids):
+            centroids = self.centroids / np.linalg.norm(
+                self.centroids, axis=1, keepdims=True
+            )
+            similarity = vectors @ centroids.T
+            taken = set()
+            # Best pairs first, so the clearest matches claim their speakers
+            for flat in np.argsort(-similarity, axis=None):
+                local, cluster = divmod(int(flat), similarity.shape[1])
+                if similarity[local, cluster] < self.threshold:
+                    break
+                if assignment[usable[local]] is not None or cluster in taken:
+                    continue
+                assignment[usable[local]] = cluster
+                taken.add(cluster)
+
+        for local, index in enumerate(usable):
+            weight = max(float(weights[index]), 1e-3)
+            cluster = assignment[index]
+            if cluster is None:
+                cluster = len(self.weights)
+                self.centroids = np.vstack(
+                    [self.centroids, np.zeros(vectors.shape[1])]
+                )
+                self.weights.append(0.0)
+                assignment[index] = cluster
+            total = self.weights[cluster] + weight
+            self.centroids[cluster] += (vectors[local] - self.centroids[cluster]) * (
+                weight / total
+            )
+            self.weights[cluster] = total
+        return [
+            None if cluster is None else f"SPEAKER_{cluster:02d}"
+            for cluster in assignment
+        ]
+
+
+class LiveDiarization:
+    """
+    Incremental diarization and transcription of a stream of audio chunks.
+
+    Every STEP_SECONDS of new audio, the last LIVE_WINDOW_SECONDS are
+    diarized and the turns up to LOOKAHEAD_SECONDS before the newest audio
+    become final. A turn is transcribed as soon as its speaker stops or it
+    reaches MAX_TURN_SECONDS, so segments lag the stream by at most about
+    MAX_TURN_SECONDS + STEP_SECONDS + LOOKAHEAD_SECONDS plus processing time.
+    When processing falls behind, the finalized region advances in steps of
+    up to a whole window, so the lag does not keep growing.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        transcriber,
+        window_seconds=LIVE_WINDOW_SECONDS,
+        step_seconds=STEP_SECONDS,
+        lookahead_seconds=LOOKAHEAD_SECONDS,
+        max_turn_seconds=MAX_TURN_SECONDS,
+        merge_gap=MERGE_GAP_SECONDS,
+        on_segment=None,
+        journal=None,
+    ):
+        if window_seconds <= lookahead_seconds + step_seconds:
+            raise ValueError("The window must be longer than the step and lookahead")
+        self.pipeline = pipeline
+        self.transcriber = transcriber
+        self.window_seconds = window_seconds
+        self.step_seconds = step_seconds
+        self.lookahead_seconds = lookahead_seconds
+        self.max_turn_seconds = max_turn_seconds
+        self.merge_gap = merge_gap
+        self.on_segment = on_segment
+        self.journal = journal
+        self.clusters = OnlineSpeakerClusters()
+        self.protocol = []
+        # Audio from buffer_start on; older samples are no longer needed
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_start = 0.0
+        self.received = 0.0
+        self.finalized = 0.0
+        self.open_turn = None
+        # (stream seconds, monotonic time) of every chunk arrival
+        self._arrivals = []
+
+    def feed(self, chunk):
+        """
+        Adds audio to the stream and returns the segments it completed.
+        """
+        chunk = np.asarray(chunk, dtype=np.float32)
+        self.buffer = np.concatenate([self.buffer, chunk])
+        self.received += len(chunk) / SAMPLE_RATE
+        self._arrivals.append((self.received, time.monotonic()))
+        emitted = []
+        target = self.received - self.lookahead_seconds
+        while target - self.finalized >= self.step_seconds:
+            emitted += self._advance(target)
+        return emitted
+
+    def finish(self):
+        """
+        Finalizes the rest of the stream after its last chunk.
+        """
+        emitted = []
+        while self.finalized < self.received:
+            emitted += self._advance(self.received, lookahead=0.0)
+        if self.open_turn is not None:
+            emitted.append(self._emit(self.open_turn))
+            self.open_turn = None
+        return emitted
+
+    def _advance(self, target, lookahead=None):
+        lookahead = self.lookahead_seconds if lookahead is None else lookahead
+        edge = min(target, self.finalized + self.window_seconds - lookahead)
+        window_end = min(edge + lookahead, self.received)
+        window_start = max(self.buffer_start, window_end - self.window_seconds)
+        audio = slice_segment(
+            self.buffer,
+            window_start - self.buffer_start,
+            window_end - self.buffer_start,
+        )
+        with metrics.span(
+            "live_window", detail=False, audio_seconds=len(audio) / SAMPLE_RATE
+        ):
+            annotation, embeddings = self.diarize_window(audio)
+
+        labels = annotation.labels()
+        speakers = dict(
+            zip(
+                labels,
+                self.clusters.assign(
+                    embeddings[: len(labels)],
+                    [annotation.label_duration(label) for label in labels],
+                ),
+            )
+        )
+        turns = sorted(
+            (
+                max(turn.start + window_start, self.finalized),
+                min(turn.end + window_start, edge),
+                speakers[label],
+            )
+            for turn, _, label in annotation.itertracks(yield_label=True)
+            if speakers[label] is not None
+        )
+        emitted = []
+        for start, end, speaker in turns:
+            if end <= start:
+                continue
+            turn = self.open_turn
+            if (
+                turn
+                and turn["speaker"] == speaker
+                and start - turn["end"] <= self.merge_gap
+            ):
+                turn["end"] = max(turn["end"], end)
+            else:
+                if turn:
+                    emitted.append(self._emit(turn))
+                self.open_turn = {"start": start, "end": end, "speaker": speaker}
+            if self.open_turn["end"] - self.open_turn["start"] >= self.max_turn_seconds:
+                emitted.append(self._emit(self.open_turn))
+                self.open_turn = None
+        # A speaker who has been silent past the merge gap has finished the turn
+        if self.open_turn and edge - self.open_turn["end"] > self.merge_gap:
+            emitted.append(self._emit(self.open_turn))
+            self.open_turn = None
+
+        self.finalized = edge
+        self._trim(edge + self.lookahead_seconds - self.window_seconds)
+        return emitted
+
+    def diarize_window(self, audio):
+        """
+        Runs the diarization pipeline on a window of samples.
+
+        Returns the annotation in window time and one embedding per label.
+        """
+        return self.pipeline(pipeline_input(audio), return_embeddings=True)
+
+    def _emit(self, turn):
+        audio = slice_segment(
+            self.buffer,
+            turn["start"] - self.buffer_start,
+            turn["end"] - self.buffer_start,
+        )
+        with metrics.span(
+            "live_transcribe", detail=False, audio_seconds=turn["end"] - turn["start"]
+        ):
+            text = self.transcriber.transcribe(audio)
+        segment = dict(turn, text=text)
+        # Time from the arrival of the turn's last samples to its emission
+        arrival = bisect.bisect_left(self._arrivals, (turn["end"], 0.0))
+        arrived = self._arrivals[min(arrival, len(self._arrivals) - 1)][1]
+        metrics.record("live_latency", time.monotonic() - arrived)
+        self.protocol.append(segment)
+        if self.journal:
+            self.journal.append(segment)
+        if self.on_segment:
+            self.on_segment(segment)
+        return segment
+
+    def _trim(self, window_start):
+        keep_from = window_start
+        if self.open_turn is not None:
+            keep_from = min(keep_from, self.open_turn["start"])
+        drop = int((keep_from - self.buffer_start) * SAMPLE_RATE)
+        if drop > 0:
+            self.buffer = self.buffer[drop:]
+            self.buffer_start += drop / SAMPLE_RATE
+        arrival = bisect.bisect_left(self._arrivals, (self.buffer_start, 0.0))
+        del self._arrivals[:max(0, arrival - 1)]
+
+    def run(self, chunks):
+        """
+        Consumes a chunk iterator until it ends and returns the protocol.
+
+        The chunks are read on a separate thread, so the source keeps its
+        pace while a window is diarized; audio that arrived meanwhile is
+        processed together.
+        """
+        arrived = queue.Queue()
+
+        def read():
+            try:
+                for chunk in chunks:
+                    arrived.put(chunk)
+            except Exception as e:
+                logging.error(f"Audio stream ended with an error: {e}")
+            finally:
+                arrived.put(None)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        finished = False
+        while not finished:
+            pending = [arrived.get()]
+            while True:
+                try:
+                    pending.append(arrived.get_nowait())
+                except queue.Empty:
+                    break
+            finished = pending[-1] is None
+            pending = [chunk for chunk in pending if chunk is not None]
+            if pending:
+                self.feed(np.concatenate(pending))
+        self.finish()
+        reader.join()
+        logging.info(
+            f"Live protocol finished with {len(self.protocol)} segments from "
+            f"{self.received:.0f}s of audio."
+        )
+        return self.protocol
+
+
+def run_live(
+    chunks, output_folder, name="live", profile=None, on_segment=None, **settings
+):
+    """
+    Diarizes and transcribes a stream into output_folder/name/protocol.json.
+
+    Finished segments are appended to protocol.journal.jsonl as they are
+    emitted, so other processes can follow the protocol while it grows.
+    """
+    from diarization import DIARIZATION_MODEL, hugging_face_token, pipeline_device
+    from src.compute_profiles import get_profile
+    from src.model_registry import load_pipeline
+    from src.protocol_index import index_protocol
+    from src.transcription import Transcriber
+
+    profile = get_profile(profile)
+    base_dir = os.path.join(output_folder, name)
+    os.makedirs(base_dir, exist_ok=True)
+    protocol_json_file = os.path.join(base_dir, "protocol.json")
+    journal = ProtocolJournal(journal_path_for(protocol_json_file), {"mode": "live"})
+    # A stream cannot be resumed, so an old journal is not continued
+    journal.remove()
+    live = LiveDiarization(
+        load_pipeline(DIARIZATION_MODEL, pipeline_device(), hugging_face_token()),
+        Transcriber(profile["whisper_model"], profile["whisper_dtype"]),
+        on_segment=on_segment,
+        journal=journal,
+        **settings,
+    )
+    try:
+        protocol = live.run(chunks)
+    finally:
+        journal.close()
+    journal.compact(protocol_json_file, protocol)
+    index_protocol(output_folder, protocol_json_file)
+    return protocol_json_file
+
+
+if __name__ == "__main__":
+    from src.protocol_index import format_timestamp
+
+    parser = argparse.ArgumentParser(
+        description="Diarize and transcribe a live audio stream incrementally"
+    )
+    parser.add_argument(
+        "source",
+        type=str,
+        help="A stream URL, an audio file, a growing file or - for stdin",
+    )
+    parser.add_argument(
+        "output_folder", type=str, help="The folder to save the output files"
+    )
+    parser.add_argument(
+        "--name",
+        type=str,
+        help="Subfolder for this stream's protocol, by default the source file name",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep reading the source file while it is being written",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="Replay a local recording as if it were live",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Replay speed relative to real time, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=LIVE_WINDOW_SECONDS,
+        help="Seconds of audio in each diarization run",
+    )
+    parser.add_argument(
+        "--step",
+        type=float,
+        default=STEP_SECONDS,
+        help="Seconds of new audio between two diarization runs",
+    )
+    parser.add_argument("--profile", type=str, help="Compute profile for Whisper")
+    parser.add_argument(
+        "--metrics-report",
+        type=str,
+        help="Write the window, transcription and latency timings to this JSON file",
+    )
+    args = parser.parse_args()
+
+    if args.replay:
+        source_chunks = replay_chunks(args.source, speed=args.speed)
+    elif args.follow and args.source.endswith((".f32", ".f32.part")):
+        source_chunks = tail_raw_file(args.source)
+    else:
+        source_chunks = ffmpeg_chunks(args.source, follow=args.follow)
+
+    name = args.name
+    if not name and args.source != "-":
+        name = os.path.splitext(os.path.basename(args.source.rstrip("/")))[0]
+    run_live(
+        source_chunks,
+        args.output_folder,
+        name=name or "live",
+        profile=args.profile,
+        on_segment=lambda segment: print(
+            f"[{format_timestamp(segment['start'])}] {segment['speaker']}: "
+            f"{segment['text'].strip()}",
+            flush=True,
+        ),
+        window_seconds=args.window,
+        step_seconds=args.step,
+    )
+    if args.metrics_report:
+        metrics.write_report(args.metrics_report)
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+# Individual spans kept for the run report; aggregates are always complete
+MAX_SPANS = 10000
+
+
+class _Span:
+    """
+    Times a block and records it on exit; a plain class keeps the overhead low.
+    """
+
+    __slots__ = ("metrics", "name", "attributes", "detail", "started")
+
+    def __init__(self, metrics, name, attributes, detail):
+        self.metrics = metrics
+        self.name = name
+        self.attributes = attributes
+        self.detail = detail
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.metrics.record(
+            self.name,
+            time.perf_counter() - self.started,
+            self.attributes,
+            detail=self.detail,
+            error=exc_type is not None,
+        )
+        return False
+
+
+class Metrics:
+    """
+    Collects timed spans of the pipeline stages in this process.
+
+    Every span updates a per-stage histogram, counters and the processed audio
+    duration. Stage-level spans are also kept individually for the JSON run
+    report; per-segment spans pass detail=False and only touch the aggregates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._spans = []
+            self._started = time.time()
+
+    def span(self, name, detail=True, **attributes):
+        """
+        Returns a context manager that times a block as a span of the stage.
+
+        An `audio_seconds` attribute is added to the processed audio counter.
+        """
+        return _Span(self, name, attributes, detail)
+
+    def record(self, name, seconds, attributes=None, detail=True, error=False):
+        """
+        Records a finished span.
+        """
+        attributes = attributes or {}
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "sum": 0.0,
+                    "max": 0.0,
+                    "audio_seconds": 0.0,
+                    "buckets": [0] * (len(BUCKETS) + 1),
+                }
+            stage["count"] += 1
+            stage["errors"] += error
+            stage["sum"] += seconds
+            stage["max"] = max(stage["max"], seconds)
+            stage["audio_seconds"] += attributes.get("audio_seconds", 0.0)
+            stage["buckets"][bisect_left(BUCKETS, seconds)] += 1
+            if detail and len(self._spans) < MAX_SPANS:
+                self._spans.append(
+                    {"stage": name, "seconds": seconds, "error": error, **attributes}
+                )
+
+    def drain(self):
+        """
+        Returns the raw aggregates and spans recorded so far and starts afresh.
+
+        Worker processes send this back with their result so the parent can
+        merge() it into its own report.
+        """
+        with self._lock:
+            snapshot = {"stages": self._stages, "spans": self._spans}
+            self._stages = {}
+            self._spans = []
+        return snapshot
+
+    def merge(self, snapshot):
+        """
+        Adds the aggregates and spans drained from another process.
+        """
+        with self._lock:
+            for name, other in snapshot["stages"].items():
+                stage = self._stages.get(name)
+                if stage is None:
+                    self._stages[name] = dict(other, buckets=list(other["buckets"]))
+                    continue
+                for field in ("count", "errors", "sum", "audio_seconds"):
+                    stage[field] += other[field]
+                stage["max"] = max(stage["max"], other["max"])
+                stage["buckets"] = [
+                    a + b for a, b in zip(stage["buckets"], other["buckets"])
+                ]
+            room = MAX_SPANS - len(self._spans)
+            self._spans.extend(snapshot["spans"][:room])
+
+    def report(self):
+        """
+        Returns the run report with per-stage aggregates and individual spans.
+        """
+        with self._lock:
+            stages = {
+                name: {
+                    "count": stage["count"],
+                    "errors": stage["errors"],
+                    "total_seconds": stage["sum"],
+                    "mean_seconds": stage["sum"] / stage["count"],
+                    "max_seconds": stage["max"],
+                    "audio_seconds": stage["audio_seconds"],
+                    "real_time_factor": stage["sum"] / stage["audio_seconds"]
+                    if stage["audio_seconds"]
+                    else None,
+                }
+                for name, stage in self._stages.items()
+            }
+            return {
+                "started": self._started,
+                "finished": time.time(),
+                "stages": stages,
+                "spans": list(self._spans),
+            }
+
+    def write_report(self, path):
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=4)
+        logging.info(f"Run report saved to {path}.")
+
+    def prometheus(self, labels=None):
+        """
+        Renders the aggregates in the Prometheus text exposition format.
+        """
+        extra = "".join(f',{key}="{value}"' for key, value in (labels or {}).items())
+        lines = [
+            "# HELP diarization_stage_seconds Time spent in a pipeline stage.",
+            "# TYPE diarization_stage_seconds histogram",
+        ]
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self._stages.items()}
+        for name, stage in sorted(stages.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), stage["buckets"]):
+                cumulative += count
+                lines.append(
+                    f'diarization_stage_seconds_bucket{{stage="{name}"{extra},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'diarization_stage_seconds_sum{{stage="{name}"{extra}}} {stage["sum"]}')
+            lines.append(f'diarization_stage_seconds_count{{stage="{name}"{extra}}} {stage["count"]}')
+
+        lines.append("# HELP diarization_stage_errors_total Spans that ended with an error.")
+        lines.append("# TYPE diarization_stage_errors_total counter")
+        for name, stage in sorted(stages.items()):
+            lines.append(f'diarization_stage_errors_total{{stage="{name}"{extra}}} {stage["errors"]}')
+
+        lines.append("# HELP diarization_audio_seconds_total Audio processed by a stage.")
+        lines.append("# TYPE diarization_audio_seconds_total counter")
+        for name, stage in sorted(stages.items()):
+            lines.append(
+                f'diarization_audio_seconds_total{{stage="{name}"{extra}}} {stage["audio_seconds"]}'
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, labels=None):
+        """
+        Writes the aggregates for the node exporter textfile collector.
+        """
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(self.prometheus(labels))
+        os.replace(temporary, path)
+
+    def serve_prometheus(self, port, labels=None):
+        """
+        Serves the aggregates on http://0.0.0.0:<port>/metrics from a daemon thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus(labels).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(f"Serving Prometheus metrics on port {port}.")
+        return server
+
+
+# Shared by every stage in this process
+metrics = Metrics()
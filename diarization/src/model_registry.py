@@ -0,0 +1,243 @@
+import gc
+import logging
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class ModelRegistry:
+    """
+    A process-wide cache of loaded models keyed by (model name, device, dtype).
+
+    Each model is loaded once per process and reused by every job. Models are
+    not safe for concurrent inference (Whisper installs per-call KV cache hooks
+    on the shared decoder), so every entry carries a lock that callers hold
+    while running the model.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        # One lock per key being loaded, so a slow load only blocks requests
+        # for the same model
+        self._loading = {}
+
+    def get(self, key, loader):
+        """
+        Returns the model for the key, calling loader() on the first request.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                load_lock = self._loading.setdefault(key, threading.Lock())
+        if entry is None:
+            with load_lock:
+                with self._lock:
+                    entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._load(key, loader)
+                    with self._lock:
+                        self._entries[key] = entry
+                        self._loading.pop(key, None)
+        with self._lock:
+            entry["hits"] += 1
+            entry["last_used"] = time.time()
+        return entry["model"]
+
+    def _load(self, key, loader):
+        logging.info(f"Loading model {key}.")
+        started = time.perf_counter()
+        model = loader()
+        entry = {
+            "model": model,
+            "lock": threading.RLock(),
+            "load_seconds": time.perf_counter() - started,
+            "bytes": model_bytes(model),
+            "hits": 0,
+        }
+        logging.info(
+            f"Model {key} loaded in {entry['load_seconds']:.1f}s "
+            f"({entry['bytes'] / 2**20:.0f} MiB)."
+        )
+        return entry
+
+    def register(self, key, model):
+        """
+        Installs an already built model under a key, such as a benchmark stand-in.
+        """
+        with self._lock:
+            self._entries[key] = {
+                "model": model,
+                "lock": threading.RLock(),
+                "load_seconds": 0.0,
+                "bytes": model_bytes(model),
+                "hits": 0,
+                "last_used": time.time(),
+            }
+
+    def lock(self, key):
+        """
+        Returns the inference lock of a loaded model.
+        """
+        with self._lock:
+            return self._entries[key]["lock"]
+
+    def evict(self, key):
+        """
+        Drops a model from the registry and releases its memory.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        # Wait for running inference before dropping the last reference
+        with entry["lock"]:
+            del entry["model"]
+        self._release_memory()
+        logging.info(f"Model {key} evicted.")
+        return True
+
+    def clear(self):
+        """
+        Drops every model from the registry.
+        """
+        for key in list(self.keys()):
+            self.evict(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def memory_usage(self):
+        """
+        Returns the parameter and buffer memory per model key in bytes.
+        """
+        with self._lock:
+            return {key: entry["bytes"] for key, entry in self._entries.items()}
+
+    def stats(self):
+        """
+        Returns memory accounting and usage counters for every loaded model.
+        """
+        with self._lock:
+            return [
+                {
+                    "model": key[0],
+                    "device": key[1],
+                    "dtype": key[2],
+                    "bytes": entry["bytes"],
+                    "load_seconds": entry["load_seconds"],
+                    "hits": entry["hits"],
+                    "last_used": entry["last_used"],
+                }
+                for key, entry in self._entries.items()
+            ]
+
+    def _release_memory(self):
+        gc.collect()
+        if cuda_available():
+            import torch
+
+            torch.cuda.empty_cache()
+
+
+def cuda_available():
+    """
+    Checks for a CUDA device; without torch only the benchmark's stand-in
+    models run, on the CPU.
+    """
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+def model_bytes(model, depth=2, seen=None):
+    """
+    Sums the parameter and buffer sizes of the torch modules inside a model.
+
+    Pipelines that wrap modules (such as pyannote's) are searched a few
+    attribute levels deep; shared tensors are counted once. Without torch
+    there are no modules, only the benchmark's stand-ins, which count as 0.
+    """
+    try:
+        import torch
+    except ImportError:
+        return 0
+
+    seen = set() if seen is None else seen
+    if isinstance(model, torch.nn.Module):
+        total = 0
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            if id(tensor) not in seen:
+                seen.add(id(tensor))
+                total += tensor.numel() * tensor.element_size()
+        return total
+    if depth == 0 or not hasattr(model, "__dict__"):
+        return 0
+    return sum(model_bytes(value, depth - 1, seen) for value in vars(model).values())
+
+
+# Shared by every Diarization and Transcriber in this process
+registry = ModelRegistry()
+
+
+def whisper_key(modelname, device=None, dtype="float32"):
+    """
+    Returns the registry key of a Whisper model on the resolved device.
+
+    Quantized int8 models only run on the CPU.
+    """
+    if dtype == "int8":
+        device = "cpu"
+    device = device or ("cuda" if cuda_available() else "cpu")
+    return (f"whisper/{modelname}", str(device), dtype)
+
+
+def load_whisper(modelname, device=None, dtype="float32"):
+    """
+    Returns the shared Whisper model, loading it on first use.
+
+    dtype "int8" loads the model with dynamically quantized linear layers.
+    """
+    key = whisper_key(modelname, device, dtype)
+
+    def loader():
+        import whisper
+
+        model = whisper.load_model(modelname, device=key[1])
+        if dtype == "int8":
+            from src.compute_profiles import quantize_whisper
+
+            model = quantize_whisper(model)
+        return model
+
+    return registry.get(key, loader)
+
+
+def pipeline_key(modelname, device, dtype="float32"):
+    """
+    Returns the registry key of a pyannote pipeline.
+    """
+    return (modelname, str(device), dtype)
+
+
+def load_pipeline(modelname, device, auth_token, dtype="float32"):
+    """
+    Returns the shared pyannote pipeline, loading it on first use.
+    """
+
+    def loader():
+        import torch
+        from pyannote.audio import Pipeline
+
+        pipeline = Pipeline.from_pretrained(modelname, use_auth_token=auth_token)
+        pipeline.to(torch.device(device))
+        return pipeline
+
+    return registry.get(pipeline_key(modelname, device, dtype), loader)
@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Progress events go to the Redis instance of the Celery broker by default
+PROGRESS_URL = os.getenv("DIARIZATION_PROGRESS_URL", "redis://localhost:6379/0")
+# A job publishes at most one event per interval, plus one per stage change
+PROGRESS_INTERVAL = float(os.getenv("DIARIZATION_PROGRESS_INTERVAL", "1.0"))
+# Buffered segments that trigger an event before the interval is over
+MAX_BUFFERED_SEGMENTS = 200
+# Streams are trimmed to about this many events and expire a day after the last one
+STREAM_MAXLEN = 10000
+STREAM_TTL_SECONDS = 24 * 3600
+STREAM_PREFIX = "diarization:progress:"
+# Stage of the last event of a job; its status is "success" or "failure"
+FINAL_STAGE = "done"
+
+
+def progress_stream(job_id):
+    """
+    Returns the Redis stream key of a job's progress events.
+    """
+    return f"{STREAM_PREFIX}{job_id}"
+
+
+def redis_client(url=PROGRESS_URL):
+    import redis
+
+    return redis.Redis.from_url(url)
+
+
+class ProgressPublisher:
+    """
+    Publishes throttled progress events of one job to a Redis stream.
+
+    An event carries the stage, the segments done and in total, an ETA from
+    the rate since the stage started, and the protocol segments finished
+    since the previous event. Segments are buffered and sent at most once
+    per interval, so a job with thousands of turns adds a few XADDs per
+    second at most. Chunk tasks of one job publish to the same stream with
+    their first turn as `part`. Publishing never fails a job: after a Redis
+    error the publisher logs once and goes quiet.
+    """
+
+    def __init__(
+        self, job_id, part=None, url=PROGRESS_URL, interval=PROGRESS_INTERVAL, client=None
+    ):
+        self.job_id = job_id
+        self.part = part
+        self.url = url
+        self.interval = interval
+        self._client = client
+        self._lock = threading.Lock()
+        self._broken = False
+        self._stage = None
+        self._total = 0
+        self._done = 0
+        self._stage_started = time.monotonic()
+        self._stage_done = 0
+        self._buffer = []
+        self._last_publish = 0.0
+        self._published = None
+        self._step = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis_client(self.url)
+        return self._client
+
+    def stage(self, stage, total=0, done=0):
+        """
+        Starts a stage; `done` counts segments that were finished before, e.g. resumed.
+        """
+        with self._lock:
+            self._flush()
+            self._stage = stage
+            self._total = total
+            self._done = done
+            self._stage_started = time.monotonic()
+            self._stage_done = done
+            self._publish(self._event())
+
+    def advance(self, segments=(), done=None):
+        """
+        Records finished segments, or sets the done count of the stage.
+        """
+        with self._lock:
+            self._buffer.extend(segments)
+            self._done = self._done + len(segments) if done is None else done
+            if (
+                time.monotonic() - self._last_publish >= self.interval
+                or len(self._buffer) >= MAX_BUFFERED_SEGMENTS
+            ):
+                self._flush()
+
+    def flush(self):
+        """
+        Publishes buffered segments and the current counts now.
+        """
+        with self._lock:
+            self._flush()
+
+    def finish(self, result):
+        """
+        Publishes the final event of the job with the status of its result.
+        """
+        with self._lock:
+            self._flush()
+            self._stage = FINAL_STAGE
+            self._publish(
+                dict(
+                    self._event(),
+                    status=result.get("status"),
+                    error=result.get("error"),
+                    protocol_file=result.get("protocol_file"),
+                )
+            )
+
+    def pyannote_hook(self, step_name, step_artifact, file=None, total=None, completed=None):
+        """
+        Reports the steps of the pyannote pipeline as diarization progress.
+
+        Each step counts from zero, so a new step restarts the ETA.
+        """
+        if total is None or completed is None:
+            return
+        if step_name != self._step:
+            self._step = step_name
+            self.stage(self._stage or "diarize", total=total, done=completed)
+        else:
+            self.advance(done=completed)
+
+    def _flush(self):
+        if self._stage is not None and (self._buffer or self._done != self._published):
+            self._publish(self._event())
+
+    def _eta(self):
+        elapsed = time.monotonic() - self._stage_started
+        progressed = self._done - self._stage_done
+        if not self._total or progressed <= 0:
+            return None
+        return max(0.0, (self._total - self._done) * elapsed / progressed)
+
+    def _event(self):
+        event = {
+            "job_id": self.job_id,
+            "part": self.part,
+            "stage": self._stage,
+            "done": self._done,
+            "total": self._total,
+            "eta": self._eta(),
+            "segments": self._buffer,
+            "time": time.time(),
+        }
+        self._buffer = []
+        return event
+
+    def _publish(self, event):
+        self._last_publish = time.monotonic()
+        self._published = event["done"]
+        if self._broken:
+            return
+        key = progress_stream(self.job_id)
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.xadd(
+                key, {"event": json.dumps(event)}, maxlen=STREAM_MAXLEN, approximate=True
+            )
+            pipeline.expire(key, STREAM_TTL_SECONDS)
+            pipeline.execute()
+        except Exception as e:
+            self._broken = True
+            logging.warning(f"Progress of job {self.job_id} is not published: {e}")
+
+
+class JobProgress:
+    """
+    The state of a job folded from its progress events.
+
+    Keeps the latest counts of every part of the current stage and the
+    finished segments in time order; segments published twice, e.g. by a
+    retried chunk, are kept once.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stage = None
+        self.status = None
+        self.error = None
+        self.protocol_file = None
+        self._parts = {}
+        self._segments = {}
+
+    def apply(self, event):
+        if event["stage"] != self.stage and event["stage"] != FINAL_STAGE:
+            self.stage = event["stage"]
+            self._parts = {}
+        if event["stage"] == FINAL_STAGE:
+            self.stage = FINAL_STAGE
+            self.status = event.get("status")
+            self.error = event.get("error")
+            self.protocol_file = event.get("protocol_file")
+        else:
+            self._parts[event["part"]] = event
+        for segment in event["segments"]:
+            key = (segment["start"], segment["end"], segment["speaker"])
+            self._segments[key] = segment
+
+    @property
+    def finished(self):
+        return self.status is not None
+
+    @property
+    def done(self):
+        return sum(event["done"] for event in self._parts.values())
+
+    @property
+    def total(self):
+        # The job-level event of a chunked stage knows the total of all chunks
+        if None in self._parts and self._parts[None]["total"]:
+            return self._parts[None]["total"]
+        return sum(event["total"] for event in self._parts.values())
+
+    @property
+    def eta(self):
+        etas = [
+            event["eta"]
+            for event in self._parts.values()
+            if event["eta"] is not None and event["done"] < event["total"]
+        ]
+        return max(etas) if etas else None
+
+    @property
+    def segments(self):
+        return [self._segments[key] for key in sorted(self._segments)]
+
+
+def read_events(job_id, last_id="0", block=None, count=1000, client=None):
+    """
+    Returns the events of a job after last_id and the ID to continue from.
+
+    With `block` in milliseconds, waits that long for the first new event.
+    """
+    client = client or redis_client()
+    response = client.xread({progress_stream(job_id): last_id}, count=count, block=block)
+    events = []
+    for _, entries in response or []:
+        for entry_id, fields in entries:
+            last_id = entry_id
+            events.append(json.loads(fields[b"event"]))
+    return events, last_id
+
+
+def follow_progress(job_id, block=5000, timeout=None, client=None):
+    """
+    Yields the JobProgress of a job whenever new events arrive, until it finishes.
+
+    Events already in the stream are replayed first, so a late subscriber
+    starts with the partial protocol. Stops after `timeout` seconds without
+    new events.
+    """
+    client = client or redis_client()
+    progress = JobProgress(job_id)
+    last_id = "0"
+    last_event = time.monotonic()
+    while not progress.finished:
+        events, last_id = read_events(job_id, last_id, block=block, client=client)
+        if not events:
+            if timeout is not None and time.monotonic() - last_event > timeout:
+                return
+            continue
+        last_event = time.monotonic()
+        for event in events:
+            progress.apply(event)
+        yield progress
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "unknown"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow the progress of a Celery job")
+    parser.add_argument("job_id", type=str, help="The ID of the download task")
+    parser.add_argument(
+        "--timeout", type=float, help="Stop after this many seconds without events"
+    )
+    args = parser.parse_args()
+
+    # Chunks finish out of order, so new segments are not always the last ones
+    printed = set()
+    progress = None
+    for progress in follow_progress(args.job_id, timeout=args.timeout):
+        for segment in progress.segments:
+            key = (segment["start"], segment["end"], segment["speaker"])
+            if key not in printed:
+                printed.add(key)
+                print(
+                    f"{segment['start']:.2f}-{segment['end']:.2f} "
+                    f"{segment['speaker']}: {segment['text']}"
+                )
+        print(
+            f"[{progress.stage}] {progress.done}/{progress.total}, "
+            f"ETA {format_eta(progress.eta)}"
+        )
+    if progress is not None and progress.finished:
+        print(f"Finished with status {progress.status}. {progress.error or ''}")
@@ -0,0 +1,395 @@
+import os
+import json
+import sqlite3
+import logging
+import argparse
+import time
+from urllib.parse import parse_qs, urlparse
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+INDEX_FILE_NAME = "protocol_index.sqlite"
+PROTOCOL_FILE_NAME = "protocol.json"
+META_FILE_NAME = "meta_info.json"
+
+
+class ProtocolIndex:
+    """
+    A SQLite full-text index over the protocols below an output folder.
+
+    Segments are stored with their speaker, timings and the URL and title of
+    their video; an FTS5 table over the segment text answers text queries.
+    Each protocol is re-ingested only when its size or modification time
+    changed. Like ArtifactCache, the index only holds a path and every call
+    opens its own connection, so it can be shared by threads and processes.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as connection:
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS protocols (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE,
+                    video_id TEXT,
+                    url TEXT,
+                    title TEXT,
+                    size INTEGER,
+                    mtime REAL,
+                    meta_mtime REAL,
+                    segments INTEGER,
+                    indexed REAL
+                );
+                CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY,
+                    protocol_id INTEGER,
+                    position INTEGER,
+                    start REAL,
+                    end REAL,
+                    speaker TEXT,
+                    text TEXT
+                );
+                CREATE INDEX IF NOT EXISTS segments_protocol
+                    ON segments (protocol_id, start);
+                CREATE INDEX IF NOT EXISTS segments_speaker
+                    ON segments (speaker);
+                CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+                    text, content='segments', content_rowid='id'
+                );
+                """
+            )
+
+    @classmethod
+    def for_output(cls, output_folder):
+        """
+        Returns the index of every protocol written below an output folder.
+        """
+        return cls(os.path.join(output_folder, INDEX_FILE_NAME))
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        # Readers do not block the writer that ingests a new protocol
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def ingest(self, protocol_file, video_id=None):
+        """
+        Indexes a protocol and the meta information next to it.
+
+        Returns False if the indexed copy is still up to date.
+        """
+        path = os.path.abspath(protocol_file)
+        stat = os.stat(path)
+        meta_file = os.path.join(os.path.dirname(path), META_FILE_NAME)
+        meta_mtime = os.path.getmtime(meta_file) if os.path.exists(meta_file) else 0.0
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT size, mtime, meta_mtime FROM protocols WHERE path = ?", (path,)
+            ).fetchone()
+        if row == (stat.st_size, stat.st_mtime, meta_mtime):
+            return False
+
+        with open(path, "r") as file:
+            protocol = json.load(file)
+        meta = {}
+        if meta_mtime:
+            with open(meta_file, "r") as file:
+                meta = json.load(file)
+        url = meta.get("URL", "")
+
+        with self._connect() as connection:
+            self._delete(connection, path)
+            protocol_id = connection.execute(
+                "INSERT INTO protocols "
+                "(path, video_id, url, title, size, mtime, meta_mtime, segments, indexed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    video_id or video_id_from_url(url),
+                    url,
+                    meta.get("Title", ""),
+                    stat.st_size,
+                    stat.st_mtime,
+                    meta_mtime,
+                    len(protocol),
+                    time.time(),
+                ),
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO segments (protocol_id, position, start, end, speaker, text) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        protocol_id,
+                        position,
+                        segment["start"],
+                        segment["end"],
+                        segment["speaker"],
+                        segment.get("text", ""),
+                    )
+                    for position, segment in enumerate(protocol)
+                ),
+            )
+            connection.execute(
+                "INSERT INTO segments_fts (rowid, text) "
+                "SELECT id, text FROM segments WHERE protocol_id = ?",
+                (protocol_id,),
+            )
+        logging.info(f"Indexed {len(protocol)} segments of {path}.")
+        return True
+
+    def remove(self, protocol_file):
+        """
+        Drops a protocol and its segments from the index.
+        """
+        with self._connect() as connection:
+            self._delete(connection, os.path.abspath(protocol_file))
+
+    def _delete(self, connection, path):
+        row = connection.execute(
+            "SELECT id FROM protocols WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None:
+            return
+        # External-content FTS tables need the old text to remove their entries
+        connection.execute(
+            "INSERT INTO segments_fts (segments_fts, rowid, text) "
+            "SELECT 'delete', id, text FROM segments WHERE protocol_id = ?",
+            row,
+        )
+        connection.execute("DELETE FROM segments WHERE protocol_id = ?", row)
+        connection.execute("DELETE FROM protocols WHERE id = ?", row)
+
+    def ingest_tree(self, root):
+        """
+        Indexes every changed protocol below root and drops deleted ones.
+
+        Returns the number of protocols that were (re)indexed.
+        """
+        from src.create_protocol import find_protocols
+
+        found = {os.path.abspath(path) for path in find_protocols(root)}
+        updated = sum(self.ingest(path) for path in sorted(found))
+        prefix = os.path.join(os.path.abspath(root), "")
+        with self._connect() as connection:
+            indexed = [
+                path
+                for (path,) in connection.execute("SELECT path FROM protocols")
+                if path.startswith(prefix)
+            ]
+        for path in indexed:
+            if path not in found:
+                logging.info(f"Removing deleted protocol {path} from the index.")
+                self.remove(path)
+        return updated
+
+    def search(self, query, speaker=None, video_id=None, limit=20, raw=False):
+        """
+        Returns the best matching segments of all indexed protocols.
+
+        Query words must all occur in a segment; pass raw=True to use the
+        FTS5 query syntax instead. Every hit carries its timings and a link to
+        the moment in the video.
+        """
+        sql = (
+            "SELECT protocols.path, protocols.video_id, protocols.url, protocols.title, "
+            "segments.start, segments.end, segments.speaker, segments.text, "
+            "snippet(segments_fts, 0, '[', ']', '...', 16) "
+            "FROM segments_fts "
+            "JOIN segments ON segments.id = segments_fts.rowid "
+            "JOIN protocols ON protocols.id = segments.protocol_id "
+            "WHERE segments_fts MATCH ?"
+        )
+        params = [query if raw else quote_query(query)]
+        if speaker:
+            sql += " AND segments.speaker = ?"
+            params.append(speaker)
+        if video_id:
+            sql += " AND protocols.video_id = ?"
+            params.append(video_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        with self._connect() as connection:
+            rows = connection.execute(sql, params).fetchall()
+        return [
+            {
+                "protocol_file": path,
+                "video_id": video,
+                "url": url,
+                "title": title,
+                "start": start,
+                "end": end,
+                "speaker": segment_speaker,
+                "text": text,
+                "snippet": snippet,
+                "link": timestamp_url(url, start),
+            }
+            for path, video, url, title, start, end, segment_speaker, text, snippet in rows
+        ]
+
+    def protocols(self):
+        """
+        Returns the indexed protocols, most recently indexed first.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT path, video_id, url, title, segments, indexed "
+                "FROM protocols ORDER BY indexed DESC"
+            ).fetchall()
+        return [
+            {
+                "protocol_file": path,
+                "video_id": video_id,
+                "url": url,
+                "title": title,
+                "segments": segments,
+                "indexed": indexed,
+            }
+            for path, video_id, url, title, segments, indexed in rows
+        ]
+
+    def segments(
+        self, protocol_file, start=None, end=None, speaker=None, offset=0, limit=100
+    ):
+        """
+        Returns a page of the segments of one protocol in time order.
+
+        start and end restrict the page to segments overlapping that window.
+        """
+        sql = (
+            "SELECT segments.start, segments.end, segments.speaker, segments.text "
+            "FROM segments JOIN protocols ON protocols.id = segments.protocol_id "
+            "WHERE protocols.path = ?"
+        )
+        params = [os.path.abspath(protocol_file)]
+        if start is not None:
+            sql += " AND segments.end > ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND segments.start < ?"
+            params.append(end)
+        if speaker:
+            sql += " AND segments.speaker = ?"
+            params.append(speaker)
+        sql += " ORDER BY segments.start LIMIT ? OFFSET ?"
+        params += [limit, offset]
+
+        with self._connect() as connection:
+            rows = connection.execute(sql, params).fetchall()
+        return [
+            {"start": start, "end": end, "speaker": speaker, "text": text}
+            for start, end, speaker, text in rows
+        ]
+
+    def duration(self, protocol_file):
+        """
+        Returns the end of the last segment of one protocol in seconds.
+        """
+        with self._connect() as connection:
+            (end,) = connection.execute(
+                "SELECT MAX(segments.end) FROM segments "
+                "JOIN protocols ON protocols.id = segments.protocol_id "
+                "WHERE protocols.path = ?",
+                (os.path.abspath(protocol_file),),
+            ).fetchone()
+        return end or 0.0
+
+    def speakers(self, protocol_file):
+        """
+        Returns the speakers of one protocol with their segment counts.
+        """
+        with self._connect() as connection:
+            return dict(
+                connection.execute(
+                    "SELECT segments.speaker, COUNT(*) FROM segments "
+                    "JOIN protocols ON protocols.id = segments.protocol_id "
+                    "WHERE protocols.path = ? GROUP BY segments.speaker "
+                    "ORDER BY segments.speaker",
+                    (os.path.abspath(protocol_file),),
+                ).fetchall()
+            )
+
+
+def index_protocol(output_folder, protocol_file, video_id=None):
+    """
+    Adds a finished protocol to the index of its output folder.
+
+    Indexing is a convenience; a failure is logged and does not fail the job.
+    """
+    try:
+        ProtocolIndex.for_output(output_folder).ingest(protocol_file, video_id)
+    except Exception as e:
+        logging.error(f"Failed to index {protocol_file}: {e}")
+
+
+def quote_query(query):
+    """
+    Turns free text into an FTS5 query that matches segments containing every word.
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def video_id_from_url(url):
+    """
+    Returns the video ID of a YouTube watch URL, or an empty string.
+    """
+    return parse_qs(urlparse(url).query).get("v", [""])[0]
+
+
+def timestamp_url(url, start):
+    """
+    Returns a link to the given second of a YouTube video.
+    """
+    if not url:
+        return ""
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}t={int(start)}s"
+
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Index the protocols of an output folder and search them"
+    )
+    parser.add_argument(
+        "output_folder", type=str, help="The output folder with the protocols"
+    )
+    parser.add_argument("--query", type=str, help="Search the indexed segment texts")
+    parser.add_argument("--speaker", type=str, help="Only return this speaker")
+    parser.add_argument("--video-id", type=str, help="Only search this video")
+    parser.add_argument("--limit", type=int, default=20, help="Maximum number of hits")
+    parser.add_argument(
+        "--raw", action="store_true", help="Pass the query as FTS5 query syntax"
+    )
+    args = parser.parse_args()
+
+    index = ProtocolIndex.for_output(args.output_folder)
+    if args.query:
+        started = time.perf_counter()
+        hits = index.search(
+            args.query,
+            speaker=args.speaker,
+            video_id=args.video_id,
+            limit=args.limit,
+            raw=args.raw,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+        for hit in hits:
+            print(
+                f"{hit['title']} [{format_timestamp(hit['start'])}] "
+                f"{hit['speaker']}: {hit['snippet']}\n    {hit['link']}"
+            )
+        print(f"{len(hits)} hits in {elapsed:.1f} ms.")
+    else:
+        updated = index.ingest_tree(args.output_folder)
+        logging.info(f"Indexed {updated} new or changed protocols.")
@@ -0,0 +1,127 @@
+import os
+import json
+import logging
+import threading
+from src.artifact_cache import write_json_atomic
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def journal_path_for(protocol_json_file):
+    """
+    Returns the journal path that belongs to a protocol file.
+    """
+    base, _ = os.path.splitext(protocol_json_file)
+    return f"{base}.journal.jsonl"
+
+
+def segment_key(segment):
+    """
+    Identifies a diarization turn by its timing and speaker.
+    """
+    return (segment["start"], segment["end"], segment["speaker"])
+
+
+class ProtocolJournal:
+    """
+    An append-only JSONL log of finished protocol segments.
+
+    Every segment is flushed to disk as soon as it is transcribed, so a run
+    that crashes or times out can resume with the turns that are still
+    missing. The first line records the settings the segments were produced
+    with; a journal written with different settings is discarded.
+    """
+
+    def __init__(self, path, params=None):
+        self.path = path
+        self.params = params or {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """
+        Returns the finished segments keyed by segment_key().
+        """
+        finished = {}
+        if not os.path.exists(self.path):
+            return finished
+
+        with open(self.path, "r") as file:
+            lines = file.read().splitlines()
+        if not lines or self._read_header(lines[0]) != self.params:
+            logging.warning(f"Discarding journal {self.path} with other settings.")
+            self.remove()
+            return finished
+
+        for line in lines[1:]:
+            try:
+                segment = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may be cut off by the crash we resume from
+                logging.warning(f"Skipping incomplete journal line in {self.path}.")
+                continue
+            finished[segment_key(segment)] = segment
+        logging.info(f"Resuming with {len(finished)} finished segments from {self.path}.")
+        return finished
+
+    def _read_header(self, line):
+        try:
+            return json.loads(line).get("params")
+        except (json.JSONDecodeError, AttributeError):
+            return None
+
+    def append(self, segment):
+        """
+        Appends a finished segment and flushes it to disk.
+        """
+        with self._lock:
+            if self._file is None:
+                new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                self._file = open(self.path, "a")
+                if new:
+                    self._write({"params": self.params})
+                elif not self._ends_with_newline():
+                    # Terminate a line cut off by a crash before appending
+                    self._file.write("\n")
+            self._write(segment)
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def compact(self, protocol_json_file, protocol=None):
+        """
+        Writes protocol.json from the journal and removes the journal.
+
+        `protocol` may carry the segments in their final order; otherwise the
+        journaled segments are ordered by time.
+        """
+        if protocol is None:
+            protocol = sorted(
+                self.load().values(),
+                key=lambda segment: (segment["start"], segment["end"]),
+            )
+        write_json_atomic(protocol_json_file, protocol, indent=4)
+        self.remove()
+        logging.info(f"Protocol compacted from journal to {protocol_json_file}.")
+        return protocol
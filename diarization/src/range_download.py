@@ -0,0 +1,528 @@
+import os
+import re
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlsplit
+from src.artifact_cache import write_json_atomic
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# YouTube throttles range requests above about 10 MB, so parts stay below that
+PART_BYTES = 8 * 1024 * 1024
+DOWNLOAD_WORKERS = 4
+MAX_RETRIES = 5
+# First retry delay; each further attempt waits twice as long, plus jitter
+BACKOFF_SECONDS = 0.5
+TIMEOUT_SECONDS = 30
+# Size of the reads from a response body
+READ_BYTES = 256 * 1024
+MAX_REDIRECTS = 5
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class DownloadError(Exception):
+    """
+    A transfer failed for good or produced a file of the wrong size.
+    """
+
+
+class PartialTransfer(DownloadError):
+    """
+    A range was cut off after some of its data arrived.
+    """
+
+
+class RangesNotSupported(DownloadError):
+    """
+    The server answered a range request with the whole file.
+    """
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections shared by the download threads.
+
+    A connection is handed to one request at a time and only returned once
+    its whole body was read, i.e. as many bytes as its Content-Length; cut
+    off and broken connections are closed. A request on an idle connection
+    that the server closed in the meantime is sent again on a new one.
+    """
+
+    def __init__(self, timeout=TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _new_connection(self, scheme, netloc):
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _release(self, scheme, netloc, connection):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(connection)
+
+    def _send(self, scheme, netloc, path, headers):
+        """
+        Sends a request and returns the connection and its response.
+        """
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            connection = idle.pop() if idle else None
+        if connection is not None:
+            try:
+                connection.request("GET", path, headers=headers)
+                return connection, connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                # The server closed the idle connection; this is not a failed attempt
+                connection.close()
+        connection = self._new_connection(scheme, netloc)
+        try:
+            connection.request("GET", path, headers=headers)
+            return connection, connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+
+    def _finish(self, scheme, netloc, connection, response, received):
+        length = response.getheader("Content-Length")
+        if response.will_close or length is None or received != int(length):
+            connection.close()
+        else:
+            self._release(scheme, netloc, connection)
+
+    def get(self, url, headers=None, on_data=None, on_headers=None):
+        """
+        Sends a GET request and returns (status, headers, body).
+
+        Redirects are followed. With on_data set, the body is passed to it in
+        pieces instead of being returned; on_headers(status, headers) is
+        called before that and may raise to reject the response. The body of a range request that is
+        not answered with 206 is not read, so a server that ignores ranges
+        does not send the whole file to every part.
+        """
+        headers = headers or {}
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path = f"{path}?{parts.query}"
+            connection, response = self._send(parts.scheme, parts.netloc, path, headers)
+            received = 0
+            try:
+                if response.status in (301, 302, 303, 307, 308):
+                    received = len(response.read())
+                    url = urljoin(url, response.getheader("Location"))
+                    self._finish(parts.scheme, parts.netloc, connection, response, received)
+                    continue
+                body = b""
+                if "Range" in headers and on_data is not None and response.status != 206:
+                    connection.close()
+                    return response.status, response.headers, body
+                if on_headers is not None:
+                    on_headers(response.status, response.headers)
+                if on_data is None or response.status >= 300:
+                    body = response.read()
+                    received = len(body)
+                else:
+                    while True:
+                        data = response.read(READ_BYTES)
+                        if not data:
+                            break
+                        received += len(data)
+                        on_data(data)
+            except Exception:
+                connection.close()
+                raise
+            self._finish(parts.scheme, parts.netloc, connection, response, received)
+            return response.status, response.headers, body
+        raise DownloadError(f"Too many redirects for {url}")
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle = {}
+
+
+def content_length(pool, url):
+    """
+    Returns the size of a remote file from the headers of a one-byte range request.
+    """
+    status, headers, _ = pool.get(url, {"Range": "bytes=0-0"}, on_data=lambda data: None)
+    if status == 206:
+        match = CONTENT_RANGE.match(headers.get("Content-Range", ""))
+        if match and match.group(3) != "*":
+            return int(match.group(3))
+    # A server without range support answers with the whole file, which is not read
+    if status == 200 and headers.get("Content-Length"):
+        return int(headers["Content-Length"])
+    raise DownloadError(f"Cannot determine the size of {url} (HTTP {status})")
+
+
+def plan_parts(size, part_bytes=PART_BYTES):
+    """
+    Splits a file into (start, end) byte ranges, end inclusive.
+    """
+    return [
+        (start, min(start + part_bytes, size) - 1)
+        for start in range(0, size, part_bytes)
+    ]
+
+
+def _progress_path(part_file):
+    return f"{part_file}.json"
+
+
+def _load_progress(part_file, size, part_bytes):
+    """
+    Returns the finished part indices of an interrupted download of the same file.
+    """
+    progress_file = _progress_path(part_file)
+    if not (os.path.exists(part_file) and os.path.exists(progress_file)):
+        return set()
+    try:
+        with open(progress_file, "r") as file:
+            progress = json.load(file)
+    except (OSError, ValueError):
+        return set()
+    if progress.get("size") != size or progress.get("part_bytes") != part_bytes:
+        return set()
+    return set(progress.get("done", []))
+
+
+def _retry(description, attempt_function, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    """
+    Calls attempt_function until it succeeds, with exponential backoff.
+
+    Transfers that were cut off after making progress continue at once and
+    do not count as attempts.
+    """
+    attempt = 0
+    while True:
+        try:
+            return attempt_function()
+        except RangesNotSupported:
+            raise
+        except PartialTransfer as e:
+            logging.info(f"{description} was cut off ({e}), continuing.")
+            continue
+        except Exception as e:
+            if attempt == retries:
+                raise DownloadError(
+                    f"{description} failed after {attempt + 1} attempts: {e}"
+                ) from e
+            delay = backoff * 2**attempt * (1 + random.random() / 2)
+            logging.warning(f"{description} failed ({e}), retrying in {delay:.1f}s.")
+            time.sleep(delay)
+            attempt += 1
+
+
+def _download_whole(pool, url, part_file, size, retries=MAX_RETRIES):
+    """
+    Streams the whole file in one GET, for servers without range support.
+    """
+
+    def attempt():
+        received = 0
+        with open(part_file, "wb") as file:
+
+            def write(data):
+                nonlocal received
+                file.write(data)
+                received += len(data)
+
+            status, _, _ = pool.get(url, on_data=write)
+        if status != 200:
+            raise DownloadError(f"HTTP {status} for {url}")
+        if received != size:
+            raise DownloadError(f"Got {received} of {size} bytes of {url}")
+
+    _retry(f"Download of {os.path.basename(part_file)}", attempt, retries)
+
+
+def download_file(
+    url,
+    path,
+    size=None,
+    workers=DOWNLOAD_WORKERS,
+    part_bytes=PART_BYTES,
+    retries=MAX_RETRIES,
+    pool=None,
+):
+    """
+    Downloads a URL to path with concurrent range requests.
+
+    The data goes to `path.part`; finished parts are recorded next to it in
+    `path.part.json`, so an interrupted download resumes with the missing
+    parts. Each part is retried with exponential backoff. A server that
+    ignores ranges and answers 200 is downloaded with a single streamed GET
+    instead. The file is only moved to path once its size matches `size` or
+    the server's size, so an existing path is always complete. Returns the
+    number of bytes.
+    """
+    pool = pool or ConnectionPool()
+    if size is None:
+        size = _retry(
+            f"Size request for {url}", lambda: content_length(pool, url), retries
+        )
+    part_file = f"{path}.part"
+    parts = plan_parts(size, part_bytes)
+    done = _load_progress(part_file, size, part_bytes)
+    if done:
+        logging.info(f"Resuming {path} with {len(done)} of {len(parts)} parts finished.")
+    else:
+        with open(part_file, "wb") as file:
+            file.truncate(size)
+    lock = threading.Lock()
+
+    def fetch(index):
+        start, end = parts[index]
+        # Bytes before offset arrived in earlier attempts and are not requested again
+        offset = start
+
+        def attempt():
+            nonlocal offset
+            requested = offset
+            fd = os.open(part_file, os.O_WRONLY)
+            try:
+
+                def check(status, response_headers):
+                    match = CONTENT_RANGE.match(response_headers.get("Content-Range", ""))
+                    if not match or (int(match.group(1)), int(match.group(2))) != (
+                        requested,
+                        end,
+                    ):
+                        raise DownloadError(f"Range {requested}-{end} got other bytes")
+
+                def write(data):
+                    nonlocal offset
+                    if offset + len(data) > end + 1:
+                        raise DownloadError(f"Range {start}-{end} got too much data")
+                    os.pwrite(fd, data, offset)
+                    offset += len(data)
+
+                headers = {"Range": f"bytes={requested}-{end}"}
+                status, _, _ = pool.get(url, headers, on_data=write, on_headers=check)
+            finally:
+                os.close(fd)
+            if status == 200:
+                raise RangesNotSupported(f"{url} ignores range requests")
+            if status != 206:
+                raise DownloadError(f"HTTP {status} for range {start}-{end}")
+            if offset > requested and offset != end + 1:
+                raise PartialTransfer(f"Range {start}-{end} ended at byte {offset}")
+            if offset != end + 1:
+                raise DownloadError(f"Range {start}-{end} ended at byte {offset}")
+
+        _retry(f"Range {start}-{end} of {os.path.basename(path)}", attempt, retries)
+        with lock:
+            done.add(index)
+            write_json_atomic(
+                _progress_path(part_file),
+                {"size": size, "part_bytes": part_bytes, "done": sorted(done)},
+            )
+
+    started = time.perf_counter()
+    missing = [index for index in range(len(parts)) if index not in done]
+    try:
+        with ThreadPoolExecutor(max(1, min(workers, len(missing) or 1))) as executor:
+            # list() re-raises the first failed part
+            list(executor.map(fetch, missing))
+    except RangesNotSupported:
+        logging.warning(f"{url} ignores range requests, downloading it in one piece.")
+        _download_whole(pool, url, part_file, size, retries)
+        done = set(range(len(parts)))
+
+    actual = os.path.getsize(part_file)
+    if actual != size or len(done) != len(parts):
+        raise DownloadError(f"Downloaded {actual} of {size} bytes for {path}")
+    os.replace(part_file, path)
+    if os.path.exists(_progress_path(part_file)):
+        os.remove(_progress_path(part_file))
+    elapsed = time.perf_counter() - started
+    logging.info(
+        f"Downloaded {size / 1e6:.1f} MB to {path} in {elapsed:.1f}s "
+        f"({size / 1e6 / max(elapsed, 1e-9):.1f} MB/s, {len(missing)} parts)."
+    )
+    return size
+
+
+def resolve_youtube_stream(yt):
+    """
+    Returns the URL and size of the audio-only stream of a pytubefix YouTube.
+    """
+    stream = yt.streams.get_audio_only()
+    return {"url": stream.url, "size": stream.filesize}
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves files with support for single byte-range requests.
+
+    `fail_rate` is the probability of cutting a response off half way, to
+    exercise the retries of the downloader. With `ranges` off, the Range
+    header is ignored like some servers do.
+    """
+
+    protocol_version = "HTTP/1.1"
+    fail_rate = 0.0
+    ranges = True
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return None
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if match and self.ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            if start > end:
+                self.send_error(416, "Requested range not satisfiable")
+                return None
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        file = open(path, "rb")
+        file.seek(start)
+        self._remaining = end - start + 1
+        return file
+
+    def copyfile(self, source, outputfile):
+        remaining = self._remaining
+        if random.random() < self.fail_rate:
+            remaining //= 2
+            self.close_connection = True
+        try:
+            while remaining > 0:
+                data = source.read(min(READ_BYTES, remaining))
+                if not data:
+                    break
+                outputfile.write(data)
+                remaining -= len(data)
+        except ConnectionError:
+            # Clients close connections whose bodies they do not want
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(directory, port=0, fail_rate=0.0, ranges=True):
+    """
+    Serves a directory over HTTP with range requests on a background thread.
+
+    Stands in for the YouTube stream servers in tests and benchmarks; the
+    returned server's `url` attribute points at the directory.
+    """
+    handler = type(
+        "LocalRangeRequestHandler",
+        (RangeRequestHandler,),
+        {"fail_rate": fail_rate, "ranges": ranges},
+    )
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", port), partial(handler, directory=directory)
+    )
+    server.daemon_threads = True
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def local_stream_resolver(url):
+    """
+    Returns a stream resolver that serves every video from the given URL.
+    """
+
+    def resolve(yt):
+        return {"url": url, "size": None}
+
+    return resolve
+
+
+def benchmark(size_mb=64, workers=(1, 2, 4, 8), fail_rate=0.0):
+    """
+    Measures download throughput from a local range server per worker count.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        source = os.path.join(directory, "audio.bin")
+        with open(source, "wb") as file:
+            file.write(os.urandom(size_mb * 1024 * 1024))
+        server = serve_directory(directory, fail_rate=fail_rate)
+        results = []
+        for count in workers:
+            target = os.path.join(directory, f"download_{count}.bin")
+            started = time.perf_counter()
+            download_file(
+                server.url + "audio.bin", target, workers=count, part_bytes=1 << 20
+            )
+            elapsed = time.perf_counter() - started
+            with open(source, "rb") as expected, open(target, "rb") as actual:
+                if expected.read() != actual.read():
+                    raise DownloadError(f"Download with {count} workers differs")
+            os.remove(target)
+            results.append(
+                {"workers": count, "seconds": elapsed, "mb_per_second": size_mb / elapsed}
+            )
+        server.shutdown()
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Download a file with parallel range requests or benchmark it locally"
+    )
+    parser.add_argument("url", type=str, nargs="?", help="The URL to download")
+    parser.add_argument("path", type=str, nargs="?", help="The file to write")
+    parser.add_argument(
+        "--workers", type=int, default=DOWNLOAD_WORKERS, help="Concurrent range requests"
+    )
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        metavar="MB",
+        help="Serve a random file of this size locally and time its download",
+    )
+    parser.add_argument(
+        "--fail-rate",
+        type=float,
+        default=0.0,
+        help="Share of local responses cut off half way in the benchmark",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for result in benchmark(args.benchmark, fail_rate=args.fail_rate):
+            print(
+                f"{result['workers']} workers: {result['seconds']:.2f}s "
+                f"({result['mb_per_second']:.1f} MB/s)"
+            )
+    elif args.url and args.path:
+        download_file(args.url, args.path, workers=args.workers)
+    else:
+        parser.error("Pass a URL and a path, or --benchmark")
@@ -0,0 +1,372 @@
+import os
+import re
+import json
+import wave
+import logging
+import argparse
+import threading
+import numpy as np
+from src.audio import SAMPLE_RATE, decode_audio, save_wav
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+SEGMENT_ARCHIVE_DIR_NAME = "speakers"
+TRANSCRIPTS_FILE_NAME = "transcripts.jsonl"
+# Audio is kept as 16-bit PCM, like the per-segment WAV files it replaces
+AUDIO_DTYPE = np.dtype("<i2")
+# One fixed-size record per segment; offset and samples count audio samples
+INDEX_DTYPE = np.dtype(
+    [("start", "<f8"), ("end", "<f8"), ("offset", "<i8"), ("samples", "<i8")]
+)
+# File names of the old layout, e.g. segment_12_34_56_78.wav for 12.34-56.78 s
+LEGACY_SEGMENT = re.compile(
+    r"^(segment|transcript)_(\d+)_(\d+)_(\d+)_(\d+)\.(wav|txt)$"
+)
+
+
+def archive_dir_for(audio_file):
+    """
+    Returns the segment archive directory of a job's audio file.
+    """
+    return os.path.join(os.path.dirname(audio_file), SEGMENT_ARCHIVE_DIR_NAME)
+
+
+def _audio_path(directory, speaker):
+    return os.path.join(directory, f"{speaker}.pcm")
+
+
+def _index_path(directory, speaker):
+    return os.path.join(directory, f"{speaker}.idx")
+
+
+def _to_pcm(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(AUDIO_DTYPE)
+
+
+def _repair(directory, speaker):
+    """
+    Drops records and audio past the last complete segment of a crashed run.
+
+    Returns the number of audio samples that remain.
+    """
+    audio_file = _audio_path(directory, speaker)
+    index_file = _index_path(directory, speaker)
+    samples = 0
+    if os.path.exists(audio_file):
+        samples = os.path.getsize(audio_file) // AUDIO_DTYPE.itemsize
+    records = np.zeros(0, dtype=INDEX_DTYPE)
+    if os.path.exists(index_file):
+        size = os.path.getsize(index_file)
+        records = np.fromfile(
+            index_file, dtype=INDEX_DTYPE, count=size // INDEX_DTYPE.itemsize
+        )
+        complete = int(np.sum(records["offset"] + records["samples"] <= samples))
+        if complete * INDEX_DTYPE.itemsize != size:
+            logging.warning(
+                f"Truncating the segment index of {speaker} to {complete} records."
+            )
+            records = records[:complete]
+            with open(index_file, "r+b") as file:
+                file.truncate(complete * INDEX_DTYPE.itemsize)
+    end = int((records["offset"] + records["samples"]).max()) if len(records) else 0
+    if samples > end:
+        with open(audio_file, "r+b") as file:
+            file.truncate(end * AUDIO_DTYPE.itemsize)
+    return end
+
+
+def _read_legacy_wav(path):
+    """
+    Returns the samples of a segment WAV of the old layout as 16 kHz mono float32.
+
+    The old segments were cut from the full-rate audio, usually 44.1 or 48 kHz
+    stereo; anything but 16 kHz mono 16-bit PCM is resampled through ffmpeg.
+    """
+    try:
+        with wave.open(path, "rb") as wav_file:
+            if (
+                wav_file.getnchannels() == 1
+                and wav_file.getframerate() == SAMPLE_RATE
+                and wav_file.getsampwidth() == AUDIO_DTYPE.itemsize
+            ):
+                frames = wav_file.readframes(wav_file.getnframes())
+                return np.frombuffer(frames, dtype=AUDIO_DTYPE).astype(np.float32) / 32767
+    except wave.Error:
+        pass
+    # Segments are short, so the decoded audio always stays in memory
+    return decode_audio(path, mmap_threshold=float("inf"))
+
+
+class SegmentArchiveWriter:
+    """
+    Appends segment audio and transcripts to a per-job archive.
+
+    Each speaker's segments are concatenated into one raw 16 kHz PCM file
+    with a fixed-size record per segment in an index file next to it, and all
+    transcripts go to one JSONL file. A job therefore writes 2 files per
+    speaker plus one, however many turns it has. Records are only trusted up
+    to the audio that reached the disk, so a crashed run is repaired when
+    the archive is opened again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._speakers = {}
+        self._transcripts = None
+
+    def _files(self, speaker):
+        if speaker not in self._speakers:
+            samples = _repair(self.directory, speaker)
+            self._speakers[speaker] = {
+                "audio": open(_audio_path(self.directory, speaker), "ab"),
+                "index": open(_index_path(self.directory, speaker), "ab"),
+                "samples": samples,
+            }
+        return self._speakers[speaker]
+
+    def add_audio(self, speaker, start, end, samples):
+        """
+        Appends the audio of a segment to its speaker's file.
+        """
+        pcm = _to_pcm(samples)
+        with self._lock:
+            files = self._files(speaker)
+            record = np.array(
+                [(start, end, files["samples"], len(pcm))], dtype=INDEX_DTYPE
+            )
+            files["audio"].write(pcm.tobytes())
+            files["index"].write(record.tobytes())
+            files["samples"] += len(pcm)
+
+    def add_transcript(self, speaker, start, end, text):
+        """
+        Appends the transcript of a segment.
+        """
+        line = json.dumps(
+            {"start": start, "end": end, "speaker": speaker, "text": text}
+        )
+        with self._lock:
+            if self._transcripts is None:
+                path = os.path.join(self.directory, TRANSCRIPTS_FILE_NAME)
+                self._transcripts = open(path, "a")
+            self._transcripts.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            for files in self._speakers.values():
+                files["audio"].close()
+                files["index"].close()
+            self._speakers = {}
+            if self._transcripts is not None:
+                self._transcripts.close()
+                self._transcripts = None
+
+
+class SegmentArchive:
+    """
+    Random access to the segments of an archive written by SegmentArchiveWriter.
+
+    Audio files are memory-mapped, so reading one segment touches only its
+    own samples. When a turn was written more than once, the last copy wins.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._audio = {}
+
+    @classmethod
+    def for_audio(cls, audio_file):
+        """
+        Opens the segment archive of a job's audio file.
+        """
+        return cls(archive_dir_for(audio_file))
+
+    def speakers(self):
+        """
+        Returns the speakers with archived audio.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[: -len(".idx")]
+            for name in os.listdir(self.directory)
+            if name.endswith(".idx")
+        )
+
+    def index(self, speaker):
+        """
+        Returns the index records of a speaker's segments in time order.
+        """
+        index_file = _index_path(self.directory, speaker)
+        count = os.path.getsize(index_file) // INDEX_DTYPE.itemsize
+        records = np.fromfile(index_file, dtype=INDEX_DTYPE, count=count)
+        records = records[
+            records["offset"] + records["samples"] <= self._samples(speaker)
+        ]
+        # Keep the last record of each turn, then order by time
+        _, last = np.unique(
+            np.stack([records["start"], records["end"]], axis=1)[::-1],
+            axis=0,
+            return_index=True,
+        )
+        return records[len(records) - 1 - last]
+
+    def _samples(self, speaker):
+        audio_file = _audio_path(self.directory, speaker)
+        return os.path.getsize(audio_file) // AUDIO_DTYPE.itemsize
+
+    def _memmap(self, speaker):
+        size = self._samples(speaker)
+        if size == 0:
+            return np.zeros(0, dtype=AUDIO_DTYPE)
+        cached = self._audio.get(speaker)
+        # The writer may still be appending; remap when the file has grown
+        if cached is None or len(cached) != size:
+            cached = np.memmap(
+                _audio_path(self.directory, speaker),
+                dtype=AUDIO_DTYPE,
+                mode="r",
+                shape=(size,),
+            )
+            self._audio[speaker] = cached
+        return cached
+
+    def read(self, speaker, record):
+        """
+        Returns the float32 samples of an index record.
+        """
+        offset, samples = int(record["offset"]), int(record["samples"])
+        pcm = self._memmap(speaker)[offset : offset + samples]
+        return pcm.astype(np.float32) / 32767
+
+    def audio(self, speaker, start, end):
+        """
+        Returns the float32 samples of the speaker's turn from start to end seconds.
+        """
+        records = self.index(speaker)
+        match = np.flatnonzero(
+            np.isclose(records["start"], start, atol=5e-3)
+            & np.isclose(records["end"], end, atol=5e-3)
+        )
+        if not len(match):
+            raise KeyError(f"No archived segment of {speaker} from {start} to {end}")
+        return self.read(speaker, records[match[0]])
+
+    def transcripts(self):
+        """
+        Returns the archived transcripts as segment dicts in time order.
+        """
+        path = os.path.join(self.directory, TRANSCRIPTS_FILE_NAME)
+        if not os.path.exists(path):
+            return []
+        segments = {}
+        with open(path, "r") as file:
+            for line in file:
+                try:
+                    segment = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut off by a crash
+                    continue
+                segments[(segment["start"], segment["end"], segment["speaker"])] = segment
+        return sorted(
+            segments.values(), key=lambda segment: (segment["start"], segment["end"])
+        )
+
+    def export_wav(self, speaker, start, end, filename):
+        """
+        Writes one archived segment to a WAV file.
+        """
+        save_wav(filename, self.audio(speaker, start, end), SAMPLE_RATE)
+
+
+def pack_legacy_segments(directory):
+    """
+    Moves per-segment WAV and TXT files of the old layout into the archive.
+
+    Segment audio is converted to 16 kHz mono like the rest of the archive.
+    The small files are deleted once their speaker is packed. Returns the
+    number of packed segments.
+    """
+    writer = SegmentArchiveWriter(directory)
+    packed = 0
+    try:
+        for speaker in sorted(os.listdir(directory)):
+            speaker_dir = os.path.join(directory, speaker)
+            if not os.path.isdir(speaker_dir):
+                continue
+            files = []
+            for name in os.listdir(speaker_dir):
+                match = LEGACY_SEGMENT.match(name)
+                if match:
+                    kind, *parts, _ = match.groups()
+                    start = float(f"{parts[0]}.{parts[1]}")
+                    end = float(f"{parts[2]}.{parts[3]}")
+                    files.append((start, end, kind, os.path.join(speaker_dir, name)))
+            for start, end, kind, path in sorted(files):
+                if kind == "segment":
+                    writer.add_audio(speaker, start, end, _read_legacy_wav(path))
+                    packed += 1
+                else:
+                    with open(path, "r") as file:
+                        writer.add_transcript(speaker, start, end, file.read())
+            writer.close()
+            for _, _, _, path in files:
+                os.remove(path)
+            if not os.listdir(speaker_dir):
+                os.rmdir(speaker_dir)
+    finally:
+        writer.close()
+    logging.info(f"Packed {packed} segments in {directory}.")
+    return packed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="List, export or pack the archived segments of a job"
+    )
+    parser.add_argument(
+        "directory", type=str, help="The job folder or its speakers folder"
+    )
+    parser.add_argument("--speaker", type=str, help="Only list this speaker")
+    parser.add_argument(
+        "--export", type=str, help="Write the listed segments as WAV files to this folder"
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Move per-segment WAV and TXT files of the old layout into the archive",
+    )
+    args = parser.parse_args()
+
+    directory = args.directory
+    if os.path.basename(os.path.normpath(directory)) != SEGMENT_ARCHIVE_DIR_NAME:
+        directory = os.path.join(directory, SEGMENT_ARCHIVE_DIR_NAME)
+    if args.pack:
+        pack_legacy_segments(directory)
+
+    archive = SegmentArchive(directory)
+    texts = {
+        (segment["start"], segment["end"], segment["speaker"]): segment["text"]
+        for segment in archive.transcripts()
+    }
+    if args.export:
+        os.makedirs(args.export, exist_ok=True)
+    for speaker in archive.speakers():
+        if args.speaker and speaker != args.speaker:
+            continue
+        for record in archive.index(speaker):
+            start, end = float(record["start"]), float(record["end"])
+            text = texts.get((start, end, speaker), "")
+            print(f"{start:.2f}-{end:.2f} {speaker}: {text}")
+            if args.export:
+                name = f"{speaker}_{start:.2f}_{end:.2f}".replace(".", "_")
+                save_wav(
+                    os.path.join(args.export, f"{name}.wav"),
+                    archive.read(speaker, record),
+                    SAMPLE_RATE,
+                )
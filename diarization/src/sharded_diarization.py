@@ -0,0 +1,265 @@
+import os
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from src.audio import SAMPLE_RATE, cache_path_for, load_audio, open_cache
+from src.model_registry import load_pipeline
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Recordings longer than this are diarized in shards when sharding is enabled
+LONG_AUDIO_SECONDS = 60 * 60
+SHARD_SECONDS = 15 * 60
+OVERLAP_SECONDS = 60
+# Local speakers whose embeddings are at least this similar are the same person
+SIMILARITY_THRESHOLD = 0.5
+# Largest DER of sharded output against single-pass output that is accepted
+DER_TOLERANCE = 0.02
+
+
+def plan_shards(duration, shard_seconds=SHARD_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    """
+    Splits a recording into overlapping windows.
+
+    Returns (window_start, window_end, own_start, own_end) tuples, where the
+    owned regions tile the recording and meet in the middle of each overlap.
+    """
+    if duration <= shard_seconds:
+        return [(0.0, float(duration), 0.0, float(duration))]
+
+    step = shard_seconds - overlap_seconds
+    starts = [float(start) for start in np.arange(0.0, duration - overlap_seconds, step)]
+    shards = []
+    for index, start in enumerate(starts):
+        end = float(min(start + shard_seconds, duration))
+        own_start = 0.0 if index == 0 else start + overlap_seconds / 2
+        own_end = duration if index == len(starts) - 1 else end - overlap_seconds / 2
+        shards.append((start, end, own_start, own_end))
+    return shards
+
+
+def _init_shard_worker(num_threads):
+    """
+    Limits the torch thread pool so shard processes do not oversubscribe.
+    """
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+def diarize_shard(pcm_file, shard, model_name, auth_token):
+    """
+    Diarizes one window of a raw PCM cache in a worker process.
+
+    Returns the turns owned by the shard in global time and one embedding
+    per local speaker.
+    """
+    import torch
+    from pyannote.core import Segment
+
+    window_start, window_end, own_start, own_end = shard
+    audio = open_cache(pcm_file)
+    samples = audio[int(window_start * SAMPLE_RATE) : int(window_end * SAMPLE_RATE)]
+    waveform = torch.from_numpy(np.ascontiguousarray(samples)).unsqueeze(0)
+
+    pipeline = load_pipeline(model_name, "cpu", auth_token)
+    diarization, embeddings = pipeline(
+        {"waveform": waveform, "sample_rate": SAMPLE_RATE}, return_embeddings=True
+    )
+    labels = diarization.labels()
+
+    owned = Segment(own_start - window_start, own_end - window_start)
+    turns = [
+        (turn.start + window_start, turn.end + window_start, speaker)
+        for turn, _, speaker in diarization.crop(owned).itertracks(yield_label=True)
+    ]
+    return {"turns": turns, "labels": labels, "embeddings": np.asarray(embeddings)}
+
+
+def cluster_speakers(embeddings, shard_ids, threshold=SIMILARITY_THRESHOLD):
+    """
+    Groups per-shard speaker embeddings into global speakers.
+
+    Average-linkage agglomerative clustering on cosine similarity, with the
+    constraint that two speakers of the same shard are never merged. Returns
+    one global cluster index per embedding.
+    """
+    embeddings = np.nan_to_num(np.asarray(embeddings, dtype=np.float64))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.where(norms == 0, 1.0, norms)
+    similarity = normalized @ normalized.T
+
+    clusters = [[index] for index in range(len(embeddings))]
+    shards = [{shard_ids[index]} for index in range(len(embeddings))]
+    while True:
+        best, best_score = None, threshold
+        for a in range(len(clusters)):
+            for b in range(a + 1, len(clusters)):
+                if shards[a] & shards[b]:
+                    continue
+                score = similarity[np.ix_(clusters[a], clusters[b])].mean()
+                if score >= best_score:
+                    best, best_score = (a, b), score
+        if best is None:
+            break
+        a, b = best
+        clusters[a] += clusters.pop(b)
+        shards[a] |= shards.pop(b)
+
+    assignment = np.zeros(len(embeddings), dtype=int)
+    for cluster_index, members in enumerate(clusters):
+        assignment[members] = cluster_index
+    return assignment
+
+
+def stitch_shards(results, return_embeddings=False):
+    """
+    Relabels the shard turns with global speakers and joins them into one Annotation.
+
+    With return_embeddings set, also returns one centroid per global speaker,
+    the mean of its normalized shard embeddings, in the order of labels().
+    """
+    from pyannote.core import Annotation, Segment
+
+    local = [
+        (shard_index, label)
+        for shard_index, result in enumerate(results)
+        for label in result["labels"]
+    ]
+    embeddings = [
+        result["embeddings"][label_index]
+        for result in results
+        for label_index in range(len(result["labels"]))
+    ]
+    if not local:
+        return (Annotation(), np.zeros((0, 0))) if return_embeddings else Annotation()
+
+    assignment = cluster_speakers(embeddings, [shard for shard, _ in local])
+    global_labels = {
+        key: f"SPEAKER_{cluster:02d}" for key, cluster in zip(local, assignment)
+    }
+
+    annotation = Annotation()
+    for shard_index, result in enumerate(results):
+        for start, end, label in result["turns"]:
+            annotation[Segment(start, end)] = global_labels[(shard_index, label)]
+    # Turns cut at a shard boundary touch exactly and are merged back together
+    annotation = annotation.support()
+    if not return_embeddings:
+        return annotation
+
+    vectors = np.nan_to_num(np.asarray(embeddings, dtype=np.float64))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1.0, norms)
+    centroids = [
+        vectors[assignment == int(label.rsplit("_", 1)[1])].mean(axis=0)
+        for label in annotation.labels()
+    ]
+    return annotation, np.asarray(centroids).reshape(-1, vectors.shape[1])
+
+
+def diarize_sharded(
+    audio,
+    audio_file,
+    model_name,
+    auth_token,
+    workers=2,
+    shard_seconds=SHARD_SECONDS,
+    overlap_seconds=OVERLAP_SECONDS,
+    return_embeddings=False,
+):
+    """
+    Diarizes a long recording as overlapping shards in parallel processes.
+
+    Each shard is diarized independently; local speakers are reconciled into
+    global ones by clustering their embeddings, and the overlaps are split
+    at their midpoints. With return_embeddings set, also returns the speaker
+    centroids like the pyannote pipeline does.
+    """
+    pcm_file = getattr(audio, "filename", None)
+    if pcm_file is None:
+        # Workers memory-map the samples instead of receiving them pickled
+        pcm_file = cache_path_for(audio_file)
+        np.asarray(audio, dtype=np.float32).tofile(pcm_file)
+
+    duration = len(audio) / SAMPLE_RATE
+    shards = plan_shards(duration, shard_seconds, overlap_seconds)
+    logging.info(
+        f"Diarizing {duration:.0f}s of audio in {len(shards)} shards on {workers} workers."
+    )
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_shard_worker,
+        initargs=(num_threads,),
+    ) as executor:
+        futures = [
+            executor.submit(diarize_shard, pcm_file, shard, model_name, auth_token)
+            for shard in shards
+        ]
+        results = [future.result() for future in futures]
+    return stitch_shards(results, return_embeddings)
+
+
+def measure_der(reference, hypothesis, collar=0.0):
+    """
+    Returns the diarization error rate of a hypothesis against a reference.
+    """
+    from pyannote.metrics.diarization import DiarizationErrorRate
+
+    return DiarizationErrorRate(collar=collar)(reference, hypothesis)
+
+
+def compare_with_single_pass(audio_file, model_name, auth_token, workers):
+    """
+    Diarizes a file in one pass and in shards and reports time and DER.
+    """
+    import torch
+
+    audio = load_audio(audio_file)
+    waveform = torch.from_numpy(np.ascontiguousarray(audio)).unsqueeze(0)
+
+    started = time.perf_counter()
+    reference = load_pipeline(model_name, "cpu", auth_token)(
+        {"waveform": waveform, "sample_rate": SAMPLE_RATE}
+    )
+    single_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    hypothesis = diarize_sharded(audio, audio_file, model_name, auth_token, workers)
+    sharded_seconds = time.perf_counter() - started
+
+    der = measure_der(reference, hypothesis)
+    logging.info(
+        f"Single pass {single_seconds:.1f}s, sharded {sharded_seconds:.1f}s, "
+        f"DER {der:.3f} ({'within' if der <= DER_TOLERANCE else 'above'} "
+        f"tolerance {DER_TOLERANCE})."
+    )
+    return {
+        "single_seconds": single_seconds,
+        "sharded_seconds": sharded_seconds,
+        "der": der,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare sharded and single-pass diarization of an audio file"
+    )
+    parser.add_argument("audio_file", type=str, help="The audio file to diarize")
+    parser.add_argument("--workers", type=int, default=2, help="Shard worker processes")
+    args = parser.parse_args()
+
+    compare_with_single_pass(
+        args.audio_file,
+        "pyannote/speaker-diarization-3.1",
+        os.getenv("HUGGING_FACE_TOKEN"),
+        args.workers,
+    )
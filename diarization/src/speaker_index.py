@@ -0,0 +1,260 @@
+import os
+import json
+import fcntl
+import logging
+import argparse
+from contextlib import contextmanager
+import numpy as np
+from src.artifact_cache import write_json_atomic
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+SPEAKER_INDEX_DIR_NAME = "speaker_index"
+EMBEDDINGS_FILE_NAME = "speaker_embeddings.npz"
+# Speakers whose centroids are at least this similar are the same person
+MATCH_THRESHOLD = 0.5
+
+
+def embeddings_path_for(diarization_file):
+    """
+    Returns the path of the per-speaker centroids saved next to a diarization.
+    """
+    return os.path.join(os.path.dirname(diarization_file), EMBEDDINGS_FILE_NAME)
+
+
+def save_speaker_embeddings(path, labels, embeddings):
+    """
+    Saves one centroid embedding per speaker label through a temporary file.
+    """
+    temporary = f"{path}.tmp{os.getpid()}"
+    with open(temporary, "wb") as file:
+        np.savez(
+            file,
+            labels=np.asarray(labels, dtype=str),
+            embeddings=np.asarray(embeddings, dtype=np.float32),
+        )
+    os.replace(temporary, path)
+
+
+def load_speaker_embeddings(path):
+    """
+    Returns {label: centroid} from a saved embeddings file.
+    """
+    with np.load(path) as data:
+        return dict(zip(data["labels"].tolist(), data["embeddings"]))
+
+
+def _file_version(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class SpeakerIndex:
+    """
+    Speaker centroids of every video below an output folder, with global identities.
+
+    The centroids are kept as one normalized float32 matrix in
+    `embeddings.npy` and described row by row in `entries.json` (video id,
+    local label, output directory and global speaker ID). Matching a speaker
+    against the whole corpus is a single matrix-vector product. Writers hold
+    an exclusive lock on the index directory, so Celery workers and the CLI
+    can add videos concurrently.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.embeddings_file = os.path.join(root, "embeddings.npy")
+        self.entries_file = os.path.join(root, "entries.json")
+        os.makedirs(root, exist_ok=True)
+        self._loaded_version = None
+        self._embeddings = np.zeros((0, 0), dtype=np.float32)
+        self._entries = []
+
+    @classmethod
+    def for_output(cls, output_folder):
+        """
+        Returns the speaker index shared by every video below an output folder.
+        """
+        return cls(os.path.join(output_folder, SPEAKER_INDEX_DIR_NAME))
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        """
+        Reloads the store when another process changed it since the last read.
+        """
+        if not os.path.exists(self.entries_file):
+            return
+        version = _file_version(self.entries_file)
+        if version == self._loaded_version:
+            return
+        with open(self.entries_file, "r") as file:
+            self._entries = json.load(file)
+        self._embeddings = np.load(self.embeddings_file)
+        self._loaded_version = version
+
+    def _save(self):
+        temporary = f"{self.embeddings_file}.tmp{os.getpid()}"
+        with open(temporary, "wb") as file:
+            np.save(file, self._embeddings)
+        os.replace(temporary, self.embeddings_file)
+        # The entries are written last and mark the store as changed
+        write_json_atomic(self.entries_file, self._entries)
+        self._loaded_version = _file_version(self.entries_file)
+
+    def __len__(self):
+        self._load()
+        return len(self._entries)
+
+    def add_video(self, video_id, centroids, base_dir="", threshold=MATCH_THRESHOLD):
+        """
+        Stores the speaker centroids of a video and assigns global speaker IDs.
+
+        Each local speaker takes the global ID of its most similar known
+        speaker from another video, if that is at least `threshold` similar;
+        two speakers of one video never share an ID. Speakers without a match
+        get a new ID. Re-adding a video replaces its entries. Returns
+        {label: global_id}.
+        """
+        labels = [
+            label
+            for label, vector in centroids.items()
+            if np.all(np.isfinite(vector)) and np.any(vector)
+        ]
+        if not labels:
+            return {}
+        vectors = _normalize([centroids[label] for label in labels])
+
+        with self._locked():
+            self._load()
+            keep = [
+                index
+                for index, entry in enumerate(self._entries)
+                if entry["video_id"] != video_id
+            ]
+            entries = [self._entries[index] for index in keep]
+            known = self._embeddings[keep] if self._entries else vectors[:0]
+
+            mapping = {}
+            if entries:
+                similarity = vectors @ known.T
+                taken = set()
+                # Best pairs first, so the clearest matches claim their IDs
+                for flat in np.argsort(-similarity, axis=None):
+                    local, row = divmod(int(flat), similarity.shape[1])
+                    if similarity[local, row] < threshold:
+                        break
+                    label, global_id = labels[local], entries[row]["global_id"]
+                    if label in mapping or global_id in taken:
+                        continue
+                    mapping[label] = global_id
+                    taken.add(global_id)
+
+            next_id = 1 + max(
+                (int(entry["global_id"].rsplit("_", 1)[1]) for entry in entries),
+                default=0,
+            )
+            for label in labels:
+                if label not in mapping:
+                    mapping[label] = f"PERSON_{next_id:05d}"
+                    next_id += 1
+
+            self._entries = entries + [
+                {
+                    "video_id": video_id,
+                    "label": label,
+                    "base_dir": base_dir,
+                    "global_id": mapping[label],
+                }
+                for label in labels
+            ]
+            self._embeddings = np.concatenate([known, vectors]).astype(np.float32)
+            self._save()
+        logging.info(
+            f"Registered {len(labels)} speakers of {video_id} in the speaker index."
+        )
+        return mapping
+
+    def find_videos(self, embedding, threshold=MATCH_THRESHOLD, limit=50):
+        """
+        Returns the video speakers most similar to an embedding, best first.
+        """
+        self._load()
+        if not self._entries:
+            return []
+        similarity = self._embeddings @ _normalize(embedding)[0]
+        order = np.argsort(-similarity)[:limit]
+        return [
+            dict(self._entries[index], similarity=float(similarity[index]))
+            for index in order
+            if similarity[index] >= threshold
+        ]
+
+    def speaker(self, video_id, label):
+        """
+        Returns the index entry and centroid of a speaker of a video.
+        """
+        self._load()
+        for index, entry in enumerate(self._entries):
+            if entry["video_id"] == video_id and entry["label"] == label:
+                return entry, self._embeddings[index]
+        raise KeyError(f"Speaker {label} of video {video_id} is not indexed")
+
+    def videos_of(self, global_id):
+        """
+        Returns the videos a global speaker appears in.
+        """
+        self._load()
+        return [entry for entry in self._entries if entry["global_id"] == global_id]
+
+
+def apply_global_speakers(protocol_json_file, mapping):
+    """
+    Adds the global speaker ID of each segment to a protocol as "global_speaker".
+    """
+    with open(protocol_json_file, "r") as file:
+        protocol = json.load(file)
+    for segment in protocol:
+        segment["global_speaker"] = mapping.get(segment["speaker"])
+    write_json_atomic(protocol_json_file, protocol, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find the videos in which a speaker appears"
+    )
+    parser.add_argument(
+        "output_folder", type=str, help="The output folder with the speaker index"
+    )
+    parser.add_argument("video_id", type=str, help="The video of the speaker")
+    parser.add_argument("label", type=str, help="The speaker label, e.g. SPEAKER_00")
+    parser.add_argument(
+        "--threshold", type=float, default=MATCH_THRESHOLD, help="Minimum similarity"
+    )
+    parser.add_argument("--limit", type=int, default=50, help="Maximum number of hits")
+    args = parser.parse_args()
+
+    index = SpeakerIndex.for_output(args.output_folder)
+    entry, embedding = index.speaker(args.video_id, args.label)
+    print(f"{args.label} of {args.video_id} is {entry['global_id']}.")
+    for hit in index.find_videos(embedding, args.threshold, args.limit):
+        print(
+            f"{hit['similarity']:.3f} {hit['video_id']} {hit['label']} "
+            f"({hit['global_id']}) {hit['base_dir']}"
+        )
@@ -1,9 +1,10 @@
 import os
 import logging
 import argparse
-from src.youtube_downloader import YouTubeDownloader
-import torch
-import whisper
+import time
+from src.audio import SAMPLE_RATE
+from src.model_registry import load_whisper, registry, whisper_key
+from src.metrics import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -16,26 +17,117 @@ class Transcriber:
     A class to handle transcription of audio files using Whisper.
     """
 
-    def __init__(self, modelname="turbo"):
+    def __init__(self, modelname="turbo", dtype="float32"):
         """
         Initializes the Transcriber with a specified model.
+
+        dtype "float16" decodes in half precision on CUDA; "int8" uses a
+        dynamically quantized model on the CPU.
         """
-        self.device = torch.device(
-            "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
-        )
+        # Weights are shared with every other Transcriber in this process
+        self.model_key = whisper_key(modelname, dtype=dtype)
+        self.model = load_whisper(modelname, dtype=dtype)
+        self.device = self.model.device
         logging.info(f"Using device: {self.device}")
-        self.model = whisper.load_model(modelname)
+        self.fp16 = dtype == "float16" and str(self.device).startswith("cuda")
+        self.model_lock = registry.lock(self.model_key)
+        self.last_batch_stats = None
 
-    def transcribe(self, filename, language="en"):
+    def transcribe(self, audio, language="en"):
         """
-        Transcribes the given audio file.
+        Transcribes the given audio file or 16 kHz mono float32 sample array.
         """
+        if not isinstance(audio, str) and len(audio) == 0:
+            return ""
         logging.info("Starting transcription...")
-        result = self.model.transcribe(filename, fp16=False, language=language)
+        with self.model_lock:
+            result = self.model.transcribe(audio, fp16=self.fp16, language=language)
         transcription_text = result["text"]
         logging.info("Transcription completed.")
         return transcription_text
 
+    def transcribe_batch(self, segments, language="en", batch_size=8, on_result=None):
+        """
+        Transcribes many 16 kHz sample arrays with batched encoder and decoder passes.
+
+        Segments are sorted by length so each batch decodes texts of similar
+        size; segments longer than one 30 s Whisper window fall back to
+        transcribe(). on_result(index, text) is called as soon as a segment
+        is done. Returns the texts in input order.
+        """
+        import torch
+        import whisper
+
+        texts = [""] * len(segments)
+        batchable = []
+        for index, segment in enumerate(segments):
+            if len(segment) == 0:
+                pass
+            elif len(segment) > whisper.audio.N_SAMPLES:
+                texts[index] = self.transcribe(segment, language=language)
+            else:
+                batchable.append(index)
+                continue
+            if on_result:
+                on_result(index, texts[index])
+        batchable.sort(key=lambda index: len(segments[index]))
+
+        options = whisper.DecodingOptions(
+            language=language, fp16=self.fp16, without_timestamps=True
+        )
+        started = time.perf_counter()
+        for offset in range(0, len(batchable), batch_size):
+            batch = batchable[offset : offset + batch_size]
+            audio_seconds = sum(len(segments[index]) for index in batch) / SAMPLE_RATE
+            with metrics.span(
+                "batch_transcribe", detail=False, audio_seconds=audio_seconds
+            ):
+                mel = torch.stack(
+                    [
+                        whisper.log_mel_spectrogram(
+                            whisper.pad_or_trim(segments[index]),
+                            n_mels=self.model.dims.n_mels,
+                        )
+                        for index in batch
+                    ]
+                ).to(self.model.device)
+                with self.model_lock:
+                    results = self.model.decode(mel, options)
+            for index, result in zip(batch, results):
+                texts[index] = result.text
+                if on_result:
+                    on_result(index, result.text)
+        elapsed = time.perf_counter() - started
+
+        self.last_batch_stats = {
+            "segments": len(batchable),
+            "batch_size": batch_size,
+            "seconds": elapsed,
+            "segments_per_second": len(batchable) / elapsed if elapsed > 0 else 0.0,
+        }
+        logging.info(
+            f"Batched transcription of {len(batchable)} segments took {elapsed:.2f}s "
+            f"({self.last_batch_stats['segments_per_second']:.2f} segments/s)."
+        )
+        return texts
+
+    def transcribe_words(self, audio, language="en"):
+        """
+        Transcribes the given audio in one pass and returns timed words.
+        """
+        logging.info("Starting word-level transcription...")
+        with self.model_lock:
+            result = self.model.transcribe(
+                audio, fp16=self.fp16, language=language, word_timestamps=True
+            )
+        words = [
+            {"start": word["start"], "end": word["end"], "word": word["word"]}
+            for segment in result["segments"]
+            for word in segment.get("words", [])
+        ]
+        logging.info(f"Word-level transcription completed with {len(words)} words.")
+        return words
+
     def save(self, output_file, transcription_text):
         """
         Saves the transcription text to a file.
@@ -49,6 +141,8 @@ def main(url, output_folder):
     """
     Main function to handle downloading and transcribing YouTube audio.
     """
+    from src.youtube_downloader import YouTubeDownloader
+
     logging.info("Starting YouTube download process.")
     downloader = YouTubeDownloader(url, output_folder)
     audio_file, _ = downloader.download()
@@ -0,0 +1,97 @@
+# Every Whisper call decodes a full 30 s window however short its audio is,
+# so short turns are packed into shared windows and the words are split back
+# to the turns by their timestamps
+
+# Length of one Whisper input window
+WINDOW_SECONDS = 30.0
+# Turns of one speaker separated by at most this much silence are kept together
+MERGE_GAP_SECONDS = 1.0
+# A window is closed at its widest silence gap once it holds this much audio
+MIN_FILL_SECONDS = 15.0
+
+
+def merge_turns(turns, max_gap=MERGE_GAP_SECONDS, window_seconds=WINDOW_SECONDS):
+    """
+    Groups consecutive turns of the same speaker into scheduling units.
+
+    `turns` are (start, end, speaker) tuples in time order. Returns units
+    with "start", "end" and the indices of their "turns"; a unit never grows
+    beyond one window, so it is not split by the packing.
+    """
+    units = []
+    for index, (start, end, speaker) in enumerate(turns):
+        if units:
+            unit = units[-1]
+            if (
+                unit["speaker"] == speaker
+                and start - unit["end"] <= max_gap
+                and max(end, unit["end"]) - unit["start"] <= window_seconds
+            ):
+                unit["end"] = max(unit["end"], end)
+                unit["turns"].append(index)
+                continue
+        units.append({"start": start, "end": end, "speaker": speaker, "turns": [index]})
+    return units
+
+
+def pack_windows(units, window_seconds=WINDOW_SECONDS, min_fill=MIN_FILL_SECONDS):
+    """
+    Packs consecutive units into windows spanning at most window_seconds.
+
+    A window takes as many units as fit. If more units follow, it is closed at
+    the widest silence gap after min_fill seconds, so words near the cut are
+    not split between two windows. Units longer than a window get their own.
+    """
+    windows = []
+    first = 0
+    while first < len(units):
+        start = units[first]["start"]
+        last = first
+        while (
+            last + 1 < len(units)
+            and max(units[last + 1]["end"], units[last]["end"]) - start <= window_seconds
+        ):
+            last += 1
+
+        cut = last + 1
+        if cut < len(units):
+            gaps = [
+                (units[k]["start"] - units[k - 1]["end"], k)
+                for k in range(first + 1, last + 1)
+                if units[k - 1]["end"] - start >= min_fill
+            ]
+            if gaps:
+                cut = max(gaps)[1]
+
+        members = units[first:cut]
+        windows.append(
+            {
+                "start": start,
+                "end": max(unit["end"] for unit in members),
+                "turns": [index for unit in members for index in unit["turns"]],
+            }
+        )
+        first = cut
+    return windows
+
+
+def plan_windows(turns, window_seconds=WINDOW_SECONDS):
+    """
+    Returns the Whisper windows for (start, end, speaker) turns in time order.
+    """
+    return pack_windows(merge_turns(turns, window_seconds=window_seconds), window_seconds)
+
+
+def packing_stats(turns, windows):
+    """
+    Summarizes how many model invocations a packing saves over one call per turn.
+    """
+    speech = sum(end - start for start, end, _ in turns)
+    audio = sum(window["end"] - window["start"] for window in windows)
+    return {
+        "turns": len(turns),
+        "windows": len(windows),
+        "invocations_saved": len(turns) - len(windows),
+        "speech_seconds": speech,
+        "window_seconds": audio,
+    }
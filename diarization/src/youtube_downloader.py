@@ -1,9 +1,14 @@
 import os
 import logging
+import subprocess
 from datetime import datetime
 from pytubefix import YouTube
-from pytubefix.cli import on_progress
 import json
+from src.audio import SAMPLE_RATE, cache_path_for, decode_audio, is_cache_fresh
+from src.artifact_cache import ArtifactCache
+from src.artifact_lifecycle import ArtifactLifecycle
+from src.metrics import metrics
+from src.range_download import DOWNLOAD_WORKERS, download_file, resolve_youtube_stream
 
 # Configure logging
 logging.basicConfig(
@@ -13,15 +18,35 @@ logging.basicConfig(
 
 class YouTubeDownloader:
     """
-    A class to download audio from YouTube videos and convert it to WAV format.
+    A class to download audio from YouTube videos and decode it for the models.
     """
 
-    def __init__(self, url, output_folder):
+    def __init__(
+        self,
+        url,
+        output_folder,
+        keep_wav=False,
+        use_cache=True,
+        download_workers=DOWNLOAD_WORKERS,
+        stream_resolver=None,
+    ):
         """
         Initializes the YouTubeDownloader with a URL and output folder.
+
+        The models read a 16 kHz mono PCM cache; set keep_wav to also write a
+        full-rate WAV copy of the audio. Downloads and decodes are shared
+        through the artifact cache of the output folder unless use_cache is off.
+        The audio is fetched with download_workers concurrent range requests
+        from the stream that stream_resolver(yt) returns as {"url", "size"};
+        tests pass a resolver that points at a local server.
         """
         self.output_folder = output_folder
-        self.yt = YouTube(url, on_progress_callback=on_progress)
+        self.keep_wav = keep_wav
+        self.download_workers = download_workers
+        self.stream_resolver = stream_resolver or resolve_youtube_stream
+        self.cache = ArtifactCache.for_output(output_folder) if use_cache else None
+        self.yt = YouTube(url)
+        self.video_id = self.yt.video_id
         self.date_str = datetime.now().strftime("%Y%m%d")
         sanitized_title = self._sanitize_title(self.yt.title)
         self.base_dir = os.path.join(
@@ -53,34 +78,85 @@ class YouTubeDownloader:
             json.dump(meta_info, file, indent=4)
         logging.info(f"Meta information saved to {meta_file}")
 
+    def audio_paths(self):
+        """
+        Returns the paths of the downloaded audio, its decoded 16 kHz PCM cache
+        and the optional WAV file.
+        """
+        file_title = self._sanitize_title(self.yt.title)
+        audio_path = os.path.join(self.base_dir, f"{file_title}_audio.m4a")
+        wav_audio_path = os.path.join(self.base_dir, f"{file_title}_audio.wav")
+        return audio_path, cache_path_for(audio_path), wav_audio_path
+
+    def download_audio(self):
+        """
+        Downloads the audio stream of the YouTube video without converting it.
+        """
+        logging.info(f"Video title: {self.yt.title}")
+        logging.info(f"Video Descriptions: {self.yt.description}")
+        audio_path, pcm_audio_path, _ = self.audio_paths()
+        # Reused audio moves to the back of the eviction order
+        ArtifactLifecycle.for_output(self.output_folder).record_access(
+            audio_path, pcm_audio_path
+        )
+
+        # Downloads are written to a .part file first, so this file is complete
+        if os.path.exists(audio_path):
+            logging.warning("Audio file already exists.")
+            return audio_path
+
+        def download():
+            with metrics.span(
+                "download", video_id=self.video_id, audio_seconds=self.yt.length
+            ) as span:
+                stream = self.stream_resolver(self.yt)
+                span.attributes["bytes"] = download_file(
+                    stream["url"],
+                    audio_path,
+                    size=stream.get("size"),
+                    workers=self.download_workers,
+                )
+            logging.info("Audio downloaded successfully.")
+
+        if self.cache is None:
+            download()
+        else:
+            self.cache.ensure(
+                audio_path,
+                download,
+                self.video_id,
+                "",
+                "download",
+                "pytubefix/audio_only",
+            )
+        return audio_path
+
+    def convert_audio(self):
+        """
+        Decodes the downloaded audio to the PCM cache unless already decoded.
+        """
+        audio_path, pcm_audio_path, wav_audio_path = self.audio_paths()
+        if not is_cache_fresh(audio_path, pcm_audio_path):
+            logging.info(f"Decoding {audio_path} to {pcm_audio_path}")
+            decode_to_cache(audio_path, pcm_audio_path, self.cache, self.video_id)
+        else:
+            logging.warning("Decoded audio file already exists.")
+
+        if self.keep_wav and not os.path.exists(wav_audio_path):
+            logging.info(f"Converting {audio_path} to {wav_audio_path}")
+            self._convert_to_wav(audio_path, wav_audio_path)
+        return pcm_audio_path
+
     def download(self):
         """
-        Downloads the audio from the YouTube video and converts it to WAV format.
+        Downloads the audio from the YouTube video and decodes it to 16 kHz PCM.
+
+        Returns the paths of the downloaded audio and of the decoded PCM cache.
         """
         try:
-            logging.info(f"Video title: {self.yt.title}")
-            logging.info(f"Video Descriptions: {self.yt.description}")
-            ys = self.yt.streams.get_audio_only()
-
-            file_title = self._sanitize_title(self.yt.title)
-            
-            audio_path = os.path.join(self.base_dir, f"{file_title}_audio.m4a")
-            wav_audio_path = os.path.join(self.base_dir, f"{file_title}_audio.wav")
-
-            if not os.path.exists(audio_path):
-                ys.download(
-                    output_path=self.base_dir, filename=f"{file_title}_audio.m4a"
-                )
-                logging.info("Audio downloaded successfully.")
-            else:
-                logging.warning("Audio file already exists.")
-
-            if not os.path.exists(wav_audio_path):
-                logging.info(f"Converting {audio_path} to {wav_audio_path}")
-                self._convert_to_wav(audio_path, wav_audio_path)
-            else:
-                logging.warning("WAV audio file already exists.")
-            return audio_path, wav_audio_path
+            audio_path = self.download_audio()
+            pcm_audio_path = self.convert_audio()
+            return audio_path, pcm_audio_path
         except Exception as e:
             logging.error(f"An error occurred: {e}")
             return None, None
@@ -89,11 +165,43 @@ class YouTubeDownloader:
         """
         Converts the downloaded audio file to WAV format.
         """
-        try:
-            os.system(f"ffmpeg -i {audio_path} {wav_audio_path}")
-            logging.info("Audio converted to WAV format successfully.")
-        except Exception as e:
-            logging.error(f"Failed to convert audio to WAV format: {e}")
+        convert_to_wav(audio_path, wav_audio_path)
+
+
+def decode_to_cache(audio_path, pcm_audio_path, cache=None, video_id=""):
+    """
+    Decodes audio to its PCM file, reusing a cached decode of identical audio.
+    """
+
+    def decode():
+        decode_audio(audio_path, pcm_audio_path, mmap_threshold=0)
+
+    if cache is None:
+        decode()
+        return
+    cache.ensure(
+        pcm_audio_path,
+        decode,
+        video_id,
+        cache.file_hash(audio_path),
+        "decode",
+        "ffmpeg",
+        {"sample_rate": SAMPLE_RATE, "format": "f32le"},
+    )
+
+
+def convert_to_wav(audio_path, wav_audio_path):
+    """
+    Converts an audio file to WAV format with ffmpeg.
+    """
+    try:
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", audio_path, wav_audio_path],
+            check=True,
+        )
+        logging.info("Audio converted to WAV format successfully.")
+    except Exception as e:
+        logging.error(f"Failed to convert audio to WAV format: {e}")
 
 
 # Example usage
@@ -105,7 +213,21 @@ if __name__ == "__main__":
     parser.add_argument(
         "output_folder", type=str, help="The folder to save the output files"
     )
+    parser.add_argument(
+        "--keep-wav", action="store_true", help="Also keep a full-rate WAV copy"
+    )
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        default=DOWNLOAD_WORKERS,
+        help="Concurrent range requests per download",
+    )
     args = parser.parse_args()
 
-    downloader = YouTubeDownloader(args.url, args.output_folder)
+    downloader = YouTubeDownloader(
+        args.url,
+        args.output_folder,
+        keep_wav=args.keep_wav,
+        download_workers=args.download_workers,
+    )
     downloader.download()
@@ -1,34 +1,189 @@
 import streamlit as st
-import requests
-import json
 import os
-from celery_task import download_diarize_transcribe
+from datetime import datetime
+from celery.result import AsyncResult
+from celery_task import app, download_diarize_transcribe
+from src.job_index import FINISHED_STATES, JobIndex
+from src.protocol_index import ProtocolIndex, format_timestamp
+from src.artifact_lifecycle import ArtifactLifecycle, format_size
+from src.progress import follow_progress, format_eta
+
+# Segments shown per page of the protocol viewer
+PAGE_SIZE = 50
+# Tasks shown per page of the task history
+JOBS_PAGE_SIZE = 20
+# Latest segments shown while following a task
+LIVE_SEGMENTS = 50
+# Seconds without progress events after which following a task stops
+FOLLOW_TIMEOUT = 600
+
+
+@st.cache_resource
+def get_job_index(output_folder):
+    return JobIndex.for_output(output_folder)
+
+
+@st.cache_resource
+def get_protocol_index(output_folder):
+    return ProtocolIndex.for_output(output_folder)
 
 
 # Function to start a new task
 def start_task(url, output_folder):
     task = download_diarize_transcribe.delay(url, output_folder)
+    get_job_index(output_folder).add(task.id, url, output_folder)
+    load_jobs.clear()
     return task.id
 
-# Function to check the status of a task using Flower API
+
+# Function to check the status of a task in the Celery result backend
 def check_task_status(task_id):
-    flower_url = f"http://localhost:5555/api/task/info/{task_id}"
-    response = requests.get(flower_url)
-    if response.status_code == 200:
-        task_info = response.json()
-        return task_info.get("state"), task_info.get("result")
-    else:
-        return "UNKNOWN", None
+    result = AsyncResult(task_id, app=app)
+    state = result.state
+    value = result.result if result.ready() else result.info
+    if isinstance(value, Exception):
+        value = str(value)
+    return state, value
+
+
+def refresh_jobs(output_folder):
+    """
+    Copies the state of unfinished tasks from the result backend to the job index.
+    """
+    job_index = get_job_index(output_folder)
+    for job in job_index.jobs(limit=1000, unfinished_only=True):
+        state, result = check_task_status(job["task_id"])
+        if state != job["state"] or state in FINISHED_STATES:
+            job_index.update(job["task_id"], state, result)
+
 
 # Function to load previous task results
-def load_previous_tasks():
-    # This function should load the previous task results from a persistent storage
-    # For demonstration purposes, we will use a static list
-    previous_tasks = [
-        {'status': 'success', 'protocol_file': 'test1/20250111_How_To_Build_The_Future__Parker_Conrad/protocol.json'},
-        # Add more task results here
-    ]
-    return previous_tasks
+@st.cache_data(ttl=5)
+def load_jobs(output_folder, page):
+    refresh_jobs(output_folder)
+    job_index = get_job_index(output_folder)
+    return job_index.jobs(offset=page * JOBS_PAGE_SIZE, limit=JOBS_PAGE_SIZE), job_index.count()
+
+
+@st.cache_data(ttl=30)
+def load_protocols(output_folder):
+    index = get_protocol_index(output_folder)
+    # Picks up protocols written before the index existed; unchanged ones are skipped
+    index.ingest_tree(output_folder)
+    return index.protocols()
+
+
+@st.cache_data(ttl=30)
+def load_protocol_info(output_folder, protocol_file):
+    index = get_protocol_index(output_folder)
+    return index.duration(protocol_file), index.speakers(protocol_file)
+
+
+@st.cache_data(ttl=30)
+def load_segments(output_folder, protocol_file, start, end, speaker, page):
+    return get_protocol_index(output_folder).segments(
+        protocol_file,
+        start=start,
+        end=end,
+        speaker=speaker,
+        offset=page * PAGE_SIZE,
+        limit=PAGE_SIZE,
+    )
+
+
+@st.cache_data(ttl=60)
+def load_disk_usage(output_folder):
+    return ArtifactLifecycle.for_output(output_folder).report()
+
+
+def follow_task(task_id):
+    """
+    Renders the progress events of a task as they arrive until it finishes.
+    """
+    status = st.empty()
+    bar = st.progress(0.0)
+    live_protocol = st.empty()
+    progress = None
+    for progress in follow_progress(task_id, timeout=FOLLOW_TIMEOUT):
+        bar.progress(min(progress.done / progress.total, 1.0) if progress.total else 0.0)
+        status.write(
+            f"Stage: {progress.stage}, {progress.done}/{progress.total} done, "
+            f"ETA {format_eta(progress.eta)}"
+        )
+        segments = progress.segments
+        with live_protocol.container():
+            st.caption(f"{len(segments)} segments transcribed so far.")
+            for segment in segments[-LIVE_SEGMENTS:]:
+                st.markdown(
+                    f"**{format_timestamp(segment['start'])} {segment['speaker']}:** "
+                    f"{segment['text']}"
+                )
+    if progress is None or not progress.finished:
+        st.warning(f"No progress from task {task_id} for {FOLLOW_TIMEOUT} seconds.")
+    elif progress.status == "success":
+        st.success(f"Protocol saved to {progress.protocol_file}.")
+        load_protocols.clear()
+        load_jobs.clear()
+    else:
+        st.error(f"Task failed: {progress.error}")
+
+
+def job_status(job):
+    # Tasks report their own failures as a result with status "failure"
+    if job["state"] == "SUCCESS" and (job["result"] or {}).get("status") == "failure":
+        return "FAILURE"
+    return job["state"]
+
+
+def show_protocols(output_folder):
+    """
+    Browses the indexed protocols, loaded one page at a time.
+    """
+    st.header("Protocols")
+    protocols = load_protocols(output_folder)
+    if not protocols:
+        st.info(f"No protocols found in {output_folder}.")
+        return
+
+    protocol_options = {
+        f"{protocol['title'] or os.path.basename(os.path.dirname(protocol['protocol_file']))} "
+        f"({protocol['segments']} segments)": protocol["protocol_file"]
+        for protocol in protocols
+    }
+    selected_task = st.selectbox("Select a protocol", list(protocol_options))
+    selected_protocol_file = protocol_options[selected_task]
+    duration, speakers = load_protocol_info(output_folder, selected_protocol_file)
+
+    speaker = st.selectbox(
+        "Speaker",
+        ["All speakers"] + list(speakers),
+        format_func=lambda name: name if name not in speakers else f"{name} ({speakers[name]} segments)",
+    )
+    window = st.slider(
+        "Time window (minutes)",
+        min_value=0.0,
+        max_value=max(duration / 60, 1.0),
+        value=(0.0, max(duration / 60, 1.0)),
+        step=0.5,
+    )
+    page = st.number_input("Segment page", min_value=0, value=0, step=1)
+
+    segments = load_segments(
+        output_folder,
+        selected_protocol_file,
+        window[0] * 60,
+        window[1] * 60,
+        None if speaker == "All speakers" else speaker,
+        page,
+    )
+    st.write(f"Displaying protocol: {selected_protocol_file}")
+    if not segments:
+        st.write("No segments in this window.")
+    for segment in segments:
+        st.markdown(
+            f"**{format_timestamp(segment['start'])} {segment['speaker']}:** {segment['text']}"
+        )
+
 
 # Streamlit UI
 st.title("YouTube Video Diarization")
@@ -40,6 +195,7 @@ if st.button("Start Task"):
     if url and output_folder:
         task_id = start_task(url, output_folder)
         st.write(f"Task started with ID: {task_id}")
+        follow_task(task_id)
     else:
         st.error("Please provide both YouTube URL and Output Folder.")
 
@@ -55,28 +211,51 @@ if st.button("Check Status"):
             st.write("Task failed.")
             st.write(result)
         elif status == 'PENDING':
-            st.write("Task is pending.")
+            st.write("Task is pending or unknown.")
         elif status == 'STARTED':
             st.write("Task has started.")
         elif status == 'RETRY':
             st.write("Task is being retried.")
         else:
-            st.write("Task status is unknown.")
+            st.write(f"Task is in state {status}.")
+    else:
+        st.error("Please provide a task ID.")
+if st.button("Follow Progress"):
+    if task_id:
+        follow_task(task_id)
     else:
         st.error("Please provide a task ID.")
 
-# Load previous task results
-previous_tasks = load_previous_tasks()
-task_options = [f"{task['protocol_file']} ({task['status']})" for task in previous_tasks]
+if not output_folder:
+    st.stop()
 
-selected_task = st.selectbox("Select a previous task to view the protocol", task_options)
+# Task history from the job index
+st.header("Tasks")
+jobs_page = st.number_input("Task page", min_value=0, value=0, step=1)
+jobs, total_jobs = load_jobs(output_folder, jobs_page)
+st.caption(f"{total_jobs} tasks started from this dashboard.")
+if jobs:
+    st.dataframe(
+        [
+            {
+                "submitted": datetime.fromtimestamp(job["submitted"]).strftime("%Y-%m-%d %H:%M"),
+                "url": job["url"],
+                "status": job_status(job),
+                "protocol": (job["result"] or {}).get("protocol_file", ""),
+                "task_id": job["task_id"],
+            }
+            for job in jobs
+        ],
+        use_container_width=True,
+    )
 
-if selected_task:
-    selected_protocol_file = "diarization/"+next(task['protocol_file'] for task in previous_tasks if f"{task['protocol_file']} ({task['status']})" == selected_task)
-    st.write(f"Displaying protocol: {selected_protocol_file}")
-    if os.path.exists(selected_protocol_file):
-        with open(selected_protocol_file, 'r') as file:
-            protocol_content = json.load(file)
-            st.json(protocol_content)
-    else:
-        st.error(f"Protocol file not found: {selected_protocol_file}")
+# Disk usage and budget of the output folder
+usage = load_disk_usage(output_folder)
+budget = format_size(usage["budget"]) if usage["budget"] is not None else "no budget"
+st.caption(
+    f"Disk: {format_size(usage['total_bytes'])} used of {budget}, "
+    f"{format_size(usage['evictable_bytes'])} of it evictable intermediates."
+)
+
+# Protocols from the protocol index, loaded one page at a time
+show_protocols(output_folder)
@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+
+# The folder of diarization.py and src, which the scripts run from
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def diarization_script():
+    """
+    Makes `import diarization` load diarization.py, as it does in the scripts.
+
+    The folder is also a package, which pytest imports as `diarization`
+    while it sets up the tests below it.
+    """
+    sys.modules.pop("diarization", None)
+    sys.path.insert(0, SCRIPT_DIR)
+    yield
+    sys.path.remove(SCRIPT_DIR)
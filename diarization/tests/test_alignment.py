@@ -0,0 +1,53 @@
+from src.alignment import assign_words_to_turns, words_to_text
+
+
+def word(start, end, text):
+    return {"start": start, "end": end, "word": text}
+
+
+def test_words_go_to_the_turn_they_overlap_most():
+    turns = [(0.0, 2.0), (1.5, 4.0)]
+    words = [word(0.2, 0.8, " a"), word(1.6, 1.9, " b"), word(1.9, 3.0, " c")]
+
+    assigned = assign_words_to_turns(words, turns)
+
+    assert [[w["word"] for w in turn] for turn in assigned] == [[" a", " b"], [" c"]]
+
+
+def test_words_in_a_gap_go_to_the_nearest_turn():
+    turns = [(0.0, 1.0), (5.0, 6.0)]
+    words = [word(1.2, 1.4, " near_first"), word(4.5, 4.8, " near_second")]
+
+    assigned = assign_words_to_turns(words, turns)
+
+    assert [w["word"] for w in assigned[0]] == [" near_first"]
+    assert [w["word"] for w in assigned[1]] == [" near_second"]
+
+
+def test_words_before_and_after_all_turns():
+    turns = [(2.0, 3.0), (4.0, 5.0)]
+    words = [word(0.0, 0.5, " early"), word(6.0, 6.5, " late")]
+
+    assigned = assign_words_to_turns(words, turns)
+
+    assert [w["word"] for w in assigned[0]] == [" early"]
+    assert [w["word"] for w in assigned[1]] == [" late"]
+
+
+def test_turns_keep_their_given_order():
+    turns = [(3.0, 4.0), (0.0, 1.0)]
+    words = [word(0.1, 0.5, " first"), word(3.1, 3.5, " second")]
+
+    assigned = assign_words_to_turns(words, turns)
+
+    assert [w["word"] for w in assigned[0]] == [" second"]
+    assert [w["word"] for w in assigned[1]] == [" first"]
+
+
+def test_no_turns_or_words():
+    assert assign_words_to_turns([word(0.0, 1.0, " a")], []) == []
+    assert assign_words_to_turns([], [(0.0, 1.0)]) == [[]]
+
+
+def test_words_to_text_joins_tokens():
+    assert words_to_text([word(0, 1, " Hello"), word(1, 2, ","), word(2, 3, " world")]) == "Hello, world"
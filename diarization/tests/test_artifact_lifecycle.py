@@ -0,0 +1,53 @@
+import os
+from src.artifact_lifecycle import ArtifactLifecycle
+
+
+def write(path, size):
+    with open(path, "wb") as file:
+        file.write(os.urandom(size))
+
+
+def test_running_total_counts_tracked_files_and_hard_links_once(tmp_path):
+    lifecycle = ArtifactLifecycle.for_output(str(tmp_path))
+    assert lifecycle.usage() is None
+
+    # The lifecycle database itself lives in the output folder
+    lifecycle.scan()
+    empty = lifecycle.usage()
+
+    job = tmp_path / "video"
+    job.mkdir()
+    write(job / "video_audio.wav", 100_000)
+    os.link(job / "video_audio.wav", job / "linked.wav")
+    lifecycle.track(str(job))
+    tracked = lifecycle.usage()
+
+    assert 100_000 <= tracked - empty < 200_000
+
+    os.remove(job / "linked.wav")
+    os.remove(job / "video_audio.wav")
+    lifecycle.track(str(job))
+    assert lifecycle.usage() == empty
+
+
+def test_enforce_only_scans_when_over_budget(tmp_path):
+    lifecycle = ArtifactLifecycle.for_output(str(tmp_path))
+    job = tmp_path / "video"
+    job.mkdir()
+    write(job / "video_audio.wav", 200_000)
+    write(job / "protocol.json", 1_000)
+    lifecycle.set_budget(10_000_000)
+    lifecycle.enforce()
+
+    scans = []
+    scan = lifecycle.scan
+    lifecycle.scan = lambda: scans.append(1) or scan()
+    lifecycle.enforce()
+    assert scans == []
+
+    lifecycle.set_budget(50_000)
+    assert lifecycle.enforce() >= 200_000
+    assert scans == [1]
+    assert not (job / "video_audio.wav").exists()
+    assert (job / "protocol.json").exists()
+    assert lifecycle.usage() < 50_000
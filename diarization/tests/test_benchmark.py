@@ -0,0 +1,41 @@
+import os
+import importlib
+import pytest
+import src.benchmark
+from src.benchmark import run_benchmark
+
+
+@pytest.fixture
+def no_token(monkeypatch):
+    # install_stub_models sets a placeholder; monkeypatch removes it afterwards
+    monkeypatch.delenv("HUGGING_FACE_TOKEN", raising=False)
+
+
+@pytest.mark.parametrize("mode", ["segment", "packed", "single_pass"])
+def test_stub_benchmark(no_token, mode):
+    report = run_benchmark(duration=30.0, turns=10, mode=mode, batch_size=1)
+
+    assert report["segments"] == 10
+    assert set(report["stages"]) == {
+        "decode",
+        "diarize",
+        "segment_extraction",
+        "transcription",
+        "postprocess",
+    }
+    assert len(report["transcript"]) == 10
+
+
+def test_stub_benchmark_batched(no_token):
+    # Batched decoding computes real log-mel features
+    pytest.importorskip("whisper")
+
+    report = run_benchmark(duration=30.0, turns=10, mode="segment", batch_size=8)
+
+    assert len(report["transcript"]) == 10
+
+
+def test_importing_sets_no_token(no_token):
+    importlib.reload(src.benchmark)
+
+    assert "HUGGING_FACE_TOKEN" not in os.environ
@@ -0,0 +1,54 @@
+import copy
+from src.create_protocol import (
+    clean_protocol,
+    filter_protocol,
+    prepare_protocol,
+    prepare_segments,
+    squash_consecutive_segments,
+)
+
+PROTOCOL = [
+    {"start": 0.0, "end": 2.0, "speaker": "SPEAKER_00", "text": "  Hello   there "},
+    {"start": 2.0, "end": 2.5, "speaker": "SPEAKER_01", "text": "uh"},
+    {"start": 2.5, "end": 4.0, "speaker": "SPEAKER_00", "text": "how\nare you"},
+    {"start": 4.0, "end": 6.0, "speaker": "SPEAKER_01", "text": "fine"},
+    {"start": 6.0, "end": 8.0, "speaker": "SPEAKER_01", "text": " thanks "},
+    {"start": 8.0, "end": 8.2, "speaker": "SPEAKER_00", "text": "ok"},
+]
+
+
+def test_matches_clean_filter_and_squash():
+    expected = squash_consecutive_segments(
+        filter_protocol(clean_protocol(copy.deepcopy(PROTOCOL)))
+    )
+
+    assert prepare_protocol(PROTOCOL) == expected
+    assert [segment["text"] for segment in expected] == [
+        "Hello there how are you",
+        "fine thanks",
+    ]
+
+
+def test_does_not_modify_the_input():
+    protocol = copy.deepcopy(PROTOCOL)
+
+    prepare_protocol(protocol)
+
+    assert protocol == PROTOCOL
+
+
+def test_keeps_extra_fields_of_the_first_segment():
+    protocol = [
+        {"start": 0.0, "end": 2.0, "speaker": "SPEAKER_00", "text": "a", "global_speaker": "G1"},
+        {"start": 2.0, "end": 4.0, "speaker": "SPEAKER_00", "text": "b", "global_speaker": "G1"},
+    ]
+
+    assert prepare_protocol(protocol) == [
+        {"start": 0.0, "end": 4.0, "speaker": "SPEAKER_00", "text": "a b", "global_speaker": "G1"}
+    ]
+
+
+def test_is_lazy_and_handles_empty_input():
+    assert list(prepare_segments(iter([]))) == []
+    segments = prepare_segments(iter(PROTOCOL))
+    assert next(segments)["end"] == 4.0
@@ -0,0 +1,22 @@
+import pytest
+from src.import_check import HEAVY_MODULES, check_imports
+
+
+def test_heavy_modules_are_checked():
+    assert {"torch", "whisper", "pyannote", "pytubefix"} <= set(HEAVY_MODULES)
+
+
+@pytest.mark.parametrize(
+    "module, framework",
+    [("diarization", None), ("celery_task", "celery"), ("streamlit_app", "streamlit")],
+)
+def test_entry_point_imports_without_heavy_modules(module, framework):
+    if framework:
+        pytest.importorskip(framework)
+
+    # Import time depends on the machine; only the heavy imports are asserted
+    (result,), problems = check_imports([module], budget=float("inf"))
+
+    assert "error" not in result, result["error"]
+    assert result["heavy"] == []
+    assert problems == []
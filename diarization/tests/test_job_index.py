@@ -0,0 +1,27 @@
+from src.job_index import JobIndex, task_result
+
+
+def test_task_result_keeps_dicts_and_wraps_other_results():
+    assert task_result(None) is None
+    assert task_result({"status": "success"}) == {"status": "success"}
+    assert task_result(RuntimeError("worker lost")) == {
+        "status": "error",
+        "message": "worker lost",
+    }
+    assert task_result("terminated") == {"status": "error", "message": "terminated"}
+
+
+def test_string_results_are_read_back_as_dicts(tmp_path):
+    index = JobIndex.for_output(str(tmp_path))
+    index.add("task-1", "https://youtu.be/x", str(tmp_path))
+    index.add("task-2", "https://youtu.be/y", str(tmp_path))
+    index.update("task-1", "REVOKED", "terminated")
+    index.update("task-2", "SUCCESS", {"status": "success", "protocol_file": "p.json"})
+
+    results = {job["task_id"]: job["result"] for job in index.jobs()}
+
+    # The dashboard calls .get on every stored result
+    assert results["task-1"].get("status") == "error"
+    assert results["task-1"].get("message") == "terminated"
+    assert results["task-2"].get("protocol_file") == "p.json"
+    assert [job["task_id"] for job in index.jobs(unfinished_only=True)] == []
@@ -0,0 +1,182 @@
+import time
+import shutil
+import numpy as np
+import pytest
+from src.annotation import Annotation, Segment
+from src.audio import SAMPLE_RATE, save_wav
+from src.live_diarization import (
+    LiveDiarization,
+    OnlineSpeakerClusters,
+    paced,
+    replay_chunks,
+)
+
+# Each speaker is a pure tone, so the stub pipeline can tell them apart
+FREQUENCIES = {"alice": 220.0, "bob": 550.0}
+FRAME_SECONDS = 0.1
+WINDOW_SECONDS = 10.0
+STEP_SECONDS = 2.0
+CHUNK_SECONDS = 0.5
+
+
+def conversation(duration=40.0, seed=0):
+    """
+    Returns two-speaker audio without pauses and its (start, end, speaker) turns.
+    """
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(duration * SAMPLE_RATE), dtype=np.float32)
+    turns, start, speaker = [], 0.0, "alice"
+    while start < duration:
+        end = min(duration, start + 0.5 * rng.integers(2, 9))
+        first, last = int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        t = np.arange(first, last) / SAMPLE_RATE
+        audio[first:last] = 0.3 * np.sin(2 * np.pi * FREQUENCIES[speaker] * t)
+        turns.append((start, end, speaker))
+        start, speaker = end, "bob" if speaker == "alice" else "alice"
+    return audio, turns
+
+
+class ToneDiarization:
+    """
+    Names the speakers of a window in the order they appear, like a pipeline
+    that sees each window on its own, so the local labels swap between windows.
+    """
+
+    def __init__(self):
+        self.windows = 0
+
+    def __call__(self, file, return_embeddings=False):
+        samples = np.asarray(file["waveform"])[0]
+        frame = int(FRAME_SECONDS * SAMPLE_RATE)
+        speakers = []
+        for index in range(len(samples) // frame):
+            spectrum = np.abs(np.fft.rfft(samples[index * frame : (index + 1) * frame]))
+            peak = np.argmax(spectrum) / FRAME_SECONDS
+            speakers.append(min(FREQUENCIES, key=lambda name: abs(FREQUENCIES[name] - peak)))
+        self.windows += 1
+
+        local = {}
+        annotation = Annotation()
+        start = 0
+        for index in range(1, len(speakers) + 1):
+            if index == len(speakers) or speakers[index] != speakers[start]:
+                label = local.setdefault(speakers[start], f"LOCAL_{len(local)}")
+                annotation[Segment(start * FRAME_SECONDS, index * FRAME_SECONDS)] = label
+                start = index
+        noise = np.random.default_rng(self.windows).normal(0, 0.05, (len(local), 2))
+        true_speaker = {label: name for name, label in local.items()}
+        embeddings = np.array(
+            [
+                [1.0, 0.0] if true_speaker[label] == "alice" else [0.0, 1.0]
+                for label in annotation.labels()
+            ]
+        )
+        return annotation, embeddings + noise
+
+
+class LengthTranscriber:
+    def transcribe(self, audio):
+        return f"{len(audio) / SAMPLE_RATE:.1f}s"
+
+
+def chunks_of(audio):
+    step = int(CHUNK_SECONDS * SAMPLE_RATE)
+    return (audio[start : start + step] for start in range(0, len(audio), step))
+
+
+def lockstep(live, chunks):
+    """
+    Hands over each chunk once the previous one has been fed, so the stream
+    never runs ahead of the processing however slow the machine is.
+    """
+    sent = 0.0
+    for chunk in chunks:
+        while live.received < sent - 1e-9:
+            time.sleep(0.001)
+        yield chunk
+        sent += len(chunk) / SAMPLE_RATE
+
+
+def true_speaker(turns, start, end):
+    overlap = {}
+    for turn_start, turn_end, speaker in turns:
+        overlap[speaker] = overlap.get(speaker, 0.0) + max(
+            0.0, min(end, turn_end) - max(start, turn_start)
+        )
+    return max(overlap, key=overlap.get)
+
+
+def test_live_replay_emits_stable_gapless_turns_in_time():
+    audio, turns = conversation()
+    latencies = []
+    live = LiveDiarization(
+        ToneDiarization(),
+        LengthTranscriber(),
+        window_seconds=WINDOW_SECONDS,
+        step_seconds=STEP_SECONDS,
+        lookahead_seconds=1.0,
+        max_turn_seconds=8.0,
+        on_segment=lambda segment: latencies.append(live.received - segment["end"]),
+    )
+
+    protocol = live.run(lockstep(live, paced(chunks_of(audio), speed=0)))
+
+    # Stream seconds between the end of a turn and its emission
+    assert max(latencies) <= WINDOW_SECONDS + STEP_SECONDS
+    # Each global label stays with one person across all windows
+    people = {}
+    for segment in protocol:
+        people.setdefault(segment["speaker"], set()).add(
+            true_speaker(turns, segment["start"], segment["end"])
+        )
+    assert len(people) == 2
+    assert all(len(names) == 1 for names in people.values())
+    # The turns tile the stream without gaps or duplicates
+    ordered = sorted(protocol, key=lambda segment: segment["start"])
+    assert ordered == protocol
+    assert protocol[0]["start"] == pytest.approx(0.0, abs=1e-6)
+    assert protocol[-1]["end"] == pytest.approx(len(audio) / SAMPLE_RATE, abs=1e-6)
+    for previous, segment in zip(protocol, protocol[1:]):
+        assert segment["start"] == pytest.approx(previous["end"], abs=1e-6)
+    # Speaker changes match the conversation up to one frame
+    boundaries = [
+        segment["start"]
+        for previous, segment in zip(protocol, protocol[1:])
+        if segment["speaker"] != previous["speaker"]
+    ]
+    expected = [start for start, _, _ in turns[1:]]
+    assert np.allclose(boundaries, expected, atol=FRAME_SECONDS)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_replay_chunks_streams_a_local_recording(tmp_path):
+    audio, _ = conversation(duration=12.0)
+    path = str(tmp_path / "recording.wav")
+    save_wav(path, audio)
+    live = LiveDiarization(
+        ToneDiarization(),
+        LengthTranscriber(),
+        window_seconds=WINDOW_SECONDS,
+        step_seconds=STEP_SECONDS,
+        lookahead_seconds=1.0,
+    )
+
+    protocol = live.run(replay_chunks(path, chunk_seconds=CHUNK_SECONDS, speed=0))
+
+    assert live.received == pytest.approx(12.0, abs=1e-3)
+    assert protocol[-1]["end"] == pytest.approx(12.0, abs=1e-3)
+    assert {segment["speaker"] for segment in protocol} == {"SPEAKER_00", "SPEAKER_01"}
+
+
+def test_online_clusters_keep_labels_and_never_share_one_in_a_window():
+    clusters = OnlineSpeakerClusters(threshold=0.5)
+
+    first = clusters.assign([[1.0, 0.0], [0.0, 1.0]], [3.0, 2.0])
+    swapped = clusters.assign([[0.0, 1.0], [0.9, 0.1]], [1.0, 1.0])
+    same = clusters.assign([[1.0, 0.0], [0.95, 0.05]], [1.0, 1.0])
+
+    assert swapped == first[::-1]
+    # Two similar speakers of one window: one keeps the label, one is new
+    assert first[0] in same and len(set(same)) == 2
+    assert set(same) - {first[0]} == {"SPEAKER_02"}
+    assert clusters.assign([[0.0, 0.0]], [1.0]) == [None]
@@ -0,0 +1,100 @@
+import json
+from src.progress import FINAL_STAGE, JobProgress, ProgressPublisher
+
+
+class FakeRedis:
+    """
+    Records the events a ProgressPublisher sends.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def xadd(self, key, fields, **kwargs):
+        self.events.append(json.loads(fields["event"]))
+
+    def expire(self, key, seconds):
+        pass
+
+    def execute(self):
+        pass
+
+
+def segment(start, text="text"):
+    return {"start": start, "end": start + 1.0, "speaker": "SPEAKER_00", "text": text}
+
+
+def test_segments_are_buffered_until_the_interval_is_over():
+    client = FakeRedis()
+    progress = ProgressPublisher("job-1", interval=3600.0, client=client)
+
+    progress.stage("transcribe", total=3)
+    progress.advance([segment(0.0)])
+    progress.advance([segment(1.0)])
+    assert len(client.events) == 1
+
+    progress.flush()
+    assert len(client.events) == 2
+    assert client.events[-1]["done"] == 2
+    assert len(client.events[-1]["segments"]) == 2
+
+
+def test_job_progress_folds_parts_and_keeps_segments_once():
+    job = JobProgress("job-1")
+    job.apply(
+        {"part": None, "stage": "transcribe", "done": 0, "total": 4, "eta": None, "segments": []}
+    )
+    for part in (0, 2):
+        event = {
+            "part": part,
+            "stage": "transcribe",
+            "done": 2,
+            "total": 2,
+            "eta": 0.0,
+            "segments": [segment(float(part)), segment(part + 1.0)],
+        }
+        job.apply(event)
+        # A retried chunk publishes its segments again
+        job.apply(event)
+    job.apply({"part": None, "stage": FINAL_STAGE, "done": 0, "total": 0, "eta": None,
+               "segments": [], "status": "success"})
+
+    assert job.finished and job.status == "success"
+    assert job.total == 4 and job.done == 4
+    assert [entry["start"] for entry in job.segments] == [0.0, 1.0, 2.0, 3.0]
+
+
+def test_a_failing_client_never_fails_the_job():
+    class BrokenRedis(FakeRedis):
+        def execute(self):
+            raise ConnectionError("no redis")
+
+    progress = ProgressPublisher("job-1", interval=0.0, client=BrokenRedis())
+    progress.stage("transcribe", total=1)
+    progress.advance([segment(0.0)])
+    progress.finish({"status": "success"})
+
+
+def test_pipeline_hook_reports_progress(tmp_path, monkeypatch):
+    monkeypatch.delenv("HUGGING_FACE_TOKEN", raising=False)
+    from diarization import Diarization
+    from src.benchmark import FakeDownloader, install_stub_models, synthesize_conversation
+
+    audio, ground_truth = synthesize_conversation(duration=20.0, turns=6)
+    install_stub_models(ground_truth)
+    _, audio_file = FakeDownloader(str(tmp_path), audio).download()
+    client = FakeRedis()
+    progress = ProgressPublisher("job-1", interval=0.0, client=client)
+
+    diarization = Diarization(audio_file, progress=progress)
+    annotation = diarization.diarize()
+    protocol = diarization.create_protocol(annotation, batch_size=1)
+    progress.flush()
+
+    diarize = [event for event in client.events if event["stage"] == "diarize"]
+    assert diarize and diarize[-1]["done"] == diarize[-1]["total"] > 0
+    segments = [entry for event in client.events for entry in event["segments"]]
+    assert len(segments) == len(protocol) == 6
@@ -0,0 +1,78 @@
+import json
+from src.protocol_journal import ProtocolJournal, journal_path_for, segment_key
+
+
+def segment(start, end, speaker="SPEAKER_00", text="text"):
+    return {"start": start, "end": end, "speaker": speaker, "text": text}
+
+
+def test_journal_path_for():
+    assert journal_path_for("/out/video/protocol.json") == "/out/video/protocol.journal.jsonl"
+
+
+def test_replay_returns_the_appended_segments(tmp_path):
+    path = str(tmp_path / "protocol.journal.jsonl")
+    journal = ProtocolJournal(path, {"mode": "segment"})
+    segments = [segment(0.0, 1.0), segment(1.0, 2.5, "SPEAKER_01")]
+    for entry in segments:
+        journal.append(entry)
+    journal.close()
+
+    finished = ProtocolJournal(path, {"mode": "segment"}).load()
+
+    assert finished == {segment_key(entry): entry for entry in segments}
+
+
+def test_replay_skips_a_truncated_last_line(tmp_path):
+    path = tmp_path / "protocol.journal.jsonl"
+    journal = ProtocolJournal(str(path), {"mode": "segment"})
+    journal.append(segment(0.0, 1.0))
+    journal.close()
+    with open(path, "a") as file:
+        file.write(json.dumps(segment(1.0, 2.0))[:20])
+
+    finished = ProtocolJournal(str(path), {"mode": "segment"}).load()
+
+    assert list(finished) == [(0.0, 1.0, "SPEAKER_00")]
+
+
+def test_append_after_a_truncated_line_starts_a_new_line(tmp_path):
+    path = tmp_path / "protocol.journal.jsonl"
+    journal = ProtocolJournal(str(path))
+    journal.append(segment(0.0, 1.0))
+    journal.close()
+    with open(path, "a") as file:
+        file.write('{"start": 1.0, "en')
+
+    resumed = ProtocolJournal(str(path))
+    resumed.append(segment(2.0, 3.0))
+    resumed.close()
+
+    assert list(ProtocolJournal(str(path)).load()) == [
+        (0.0, 1.0, "SPEAKER_00"),
+        (2.0, 3.0, "SPEAKER_00"),
+    ]
+
+
+def test_journal_with_other_settings_is_discarded(tmp_path):
+    path = tmp_path / "protocol.journal.jsonl"
+    journal = ProtocolJournal(str(path), {"mode": "segment"})
+    journal.append(segment(0.0, 1.0))
+    journal.close()
+
+    assert ProtocolJournal(str(path), {"mode": "packed"}).load() == {}
+    assert not path.exists()
+
+
+def test_compact_writes_the_protocol_in_time_order(tmp_path):
+    path = tmp_path / "protocol.journal.jsonl"
+    protocol_file = tmp_path / "protocol.json"
+    journal = ProtocolJournal(str(path))
+    journal.append(segment(5.0, 6.0))
+    journal.append(segment(0.0, 1.0))
+
+    journal.compact(str(protocol_file))
+
+    with open(protocol_file) as file:
+        assert [entry["start"] for entry in json.load(file)] == [0.0, 5.0]
+    assert not path.exists()
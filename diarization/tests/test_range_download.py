@@ -0,0 +1,44 @@
+import os
+import pytest
+from src.range_download import ConnectionPool, download_file, plan_parts, serve_directory
+
+
+def test_plan_parts_splits_into_inclusive_ranges():
+    assert plan_parts(10, part_bytes=4) == [(0, 3), (4, 7), (8, 9)]
+    assert plan_parts(8, part_bytes=4) == [(0, 3), (4, 7)]
+    assert plan_parts(3, part_bytes=4) == [(0, 2)]
+    assert plan_parts(0, part_bytes=4) == []
+
+
+@pytest.fixture
+def source(tmp_path):
+    directory = tmp_path / "served"
+    directory.mkdir()
+    data = os.urandom(300_000)
+    (directory / "audio.m4a").write_bytes(data)
+    return str(directory), data
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"fail_rate": 0.3}, {"ranges": False}],
+    ids=["ranges", "failures", "no_ranges"],
+)
+def test_download_file(source, tmp_path, options):
+    directory, data = source
+    server = serve_directory(directory, **options)
+    path = str(tmp_path / "audio.m4a")
+    pool = ConnectionPool()
+    try:
+        size = download_file(
+            server.url + "audio.m4a", path, workers=4, part_bytes=32_768, pool=pool
+        )
+    finally:
+        pool.close()
+        server.shutdown()
+
+    assert size == len(data)
+    with open(path, "rb") as file:
+        assert file.read() == data
+    assert not os.path.exists(f"{path}.part")
+    assert not os.path.exists(f"{path}.part.json")
@@ -0,0 +1,133 @@
+import os
+import wave
+import shutil
+import numpy as np
+import pytest
+from src.audio import SAMPLE_RATE
+from src.segment_archive import (
+    INDEX_DTYPE,
+    SegmentArchive,
+    SegmentArchiveWriter,
+    _audio_path,
+    _index_path,
+    pack_legacy_segments,
+)
+
+
+def tone(samples, value):
+    return np.full(samples, value, dtype=np.float32)
+
+
+def test_index_lists_segments_in_time_order(tmp_path):
+    writer = SegmentArchiveWriter(str(tmp_path))
+    writer.add_audio("SPEAKER_00", 5.0, 6.0, tone(100, 0.5))
+    writer.add_audio("SPEAKER_00", 1.0, 2.0, tone(50, 0.25))
+    writer.add_audio("SPEAKER_01", 2.0, 3.0, tone(10, -0.5))
+    writer.close()
+
+    archive = SegmentArchive(str(tmp_path))
+    records = archive.index("SPEAKER_00")
+
+    assert archive.speakers() == ["SPEAKER_00", "SPEAKER_01"]
+    assert records["start"].tolist() == [1.0, 5.0]
+    assert records["offset"].tolist() == [100, 0]
+    assert records["samples"].tolist() == [50, 100]
+    np.testing.assert_allclose(archive.audio("SPEAKER_00", 5.0, 6.0), 0.5, atol=1e-4)
+
+
+def test_the_last_copy_of_a_turn_wins(tmp_path):
+    writer = SegmentArchiveWriter(str(tmp_path))
+    writer.add_audio("SPEAKER_00", 1.0, 2.0, tone(20, 0.1))
+    writer.add_audio("SPEAKER_00", 1.0, 2.0, tone(30, 0.2))
+    writer.close()
+
+    archive = SegmentArchive(str(tmp_path))
+
+    assert len(archive.index("SPEAKER_00")) == 1
+    assert len(archive.audio("SPEAKER_00", 1.0, 2.0)) == 30
+
+
+def test_records_past_the_written_audio_are_ignored_and_repaired(tmp_path):
+    writer = SegmentArchiveWriter(str(tmp_path))
+    writer.add_audio("SPEAKER_00", 0.0, 1.0, tone(40, 0.1))
+    writer.add_audio("SPEAKER_00", 1.0, 2.0, tone(40, 0.2))
+    writer.close()
+    # A crash lost the end of the audio and half of the next index record
+    audio_file = _audio_path(str(tmp_path), "SPEAKER_00")
+    index_file = _index_path(str(tmp_path), "SPEAKER_00")
+    with open(audio_file, "r+b") as file:
+        file.truncate(60 * 2)
+    with open(index_file, "ab") as file:
+        file.write(b"\0" * (INDEX_DTYPE.itemsize // 2))
+
+    assert SegmentArchive(str(tmp_path)).index("SPEAKER_00")["start"].tolist() == [0.0]
+
+    writer = SegmentArchiveWriter(str(tmp_path))
+    writer.add_audio("SPEAKER_00", 2.0, 3.0, tone(10, 0.3))
+    writer.close()
+
+    records = SegmentArchive(str(tmp_path)).index("SPEAKER_00")
+    assert records["start"].tolist() == [0.0, 2.0]
+    assert records["offset"].tolist() == [0, 40]
+    assert os.path.getsize(index_file) == 2 * INDEX_DTYPE.itemsize
+
+
+def test_missing_segment_raises_key_error(tmp_path):
+    writer = SegmentArchiveWriter(str(tmp_path))
+    writer.add_audio("SPEAKER_00", 0.0, 1.0, tone(10, 0.1))
+    writer.close()
+
+    with pytest.raises(KeyError):
+        SegmentArchive(str(tmp_path)).audio("SPEAKER_00", 4.0, 5.0)
+
+
+def test_transcripts_skip_a_truncated_line(tmp_path):
+    writer = SegmentArchiveWriter(str(tmp_path))
+    writer.add_transcript("SPEAKER_01", 3.0, 4.0, "later")
+    writer.add_transcript("SPEAKER_00", 0.0, 1.0, "first")
+    writer.close()
+    with open(tmp_path / "transcripts.jsonl", "a") as file:
+        file.write('{"start": 5.0, "end"')
+
+    texts = [segment["text"] for segment in SegmentArchive(str(tmp_path)).transcripts()]
+
+    assert texts == ["first", "later"]
+
+
+def write_legacy_wav(path, seconds, rate, channels):
+    frames = int(seconds * rate)
+    samples = (0.3 * np.sin(np.linspace(0, 200 * np.pi, frames))).repeat(channels)
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes((samples * 32767).astype("<i2").tobytes())
+
+
+@pytest.mark.parametrize(
+    "rate, channels",
+    [
+        (SAMPLE_RATE, 1),
+        pytest.param(
+            44100,
+            2,
+            marks=pytest.mark.skipif(
+                shutil.which("ffmpeg") is None, reason="ffmpeg is not installed"
+            ),
+        ),
+    ],
+)
+def test_legacy_segments_are_packed_at_16_khz_mono(tmp_path, rate, channels):
+    speaker_dir = tmp_path / "SPEAKER_00"
+    speaker_dir.mkdir()
+    write_legacy_wav(speaker_dir / "segment_1_00_2_50.wav", 1.5, rate, channels)
+    (speaker_dir / "transcript_1_00_2_50.txt").write_text("hello")
+
+    assert pack_legacy_segments(str(tmp_path)) == 1
+
+    archive = SegmentArchive(str(tmp_path))
+    audio = archive.audio("SPEAKER_00", 1.0, 2.5)
+    assert abs(len(audio) - 1.5 * SAMPLE_RATE) <= SAMPLE_RATE * 0.01
+    assert 0.2 < np.abs(audio).max() < 0.5
+    assert archive.transcripts()[0]["text"] == "hello"
+    assert not speaker_dir.exists()
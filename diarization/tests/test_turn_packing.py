@@ -0,0 +1,63 @@
+from src.turn_packing import merge_turns, pack_windows, packing_stats, plan_windows
+
+
+def test_merge_keeps_close_turns_of_one_speaker_together():
+    turns = [(0.0, 1.0, "A"), (1.5, 2.0, "A"), (4.0, 5.0, "A"), (5.2, 6.0, "B")]
+
+    units = merge_turns(turns, max_gap=1.0)
+
+    assert [unit["turns"] for unit in units] == [[0, 1], [2], [3]]
+    assert (units[0]["start"], units[0]["end"]) == (0.0, 2.0)
+
+
+def test_merge_never_grows_beyond_a_window():
+    turns = [(float(i), i + 0.9, "A") for i in range(40)]
+
+    units = merge_turns(turns, window_seconds=30.0)
+
+    assert all(unit["end"] - unit["start"] <= 30.0 for unit in units)
+    assert [index for unit in units for index in unit["turns"]] == list(range(40))
+
+
+def test_windows_cover_every_turn_once_in_order():
+    turns = [(i * 2.0, i * 2.0 + 1.5, "AB"[i % 2]) for i in range(60)]
+
+    windows = plan_windows(turns)
+
+    assert [index for window in windows for index in window["turns"]] == list(range(60))
+    assert all(window["end"] - window["start"] <= 30.0 for window in windows)
+
+
+def test_windows_are_cut_at_the_widest_gap():
+    units = [
+        {"start": 0.0, "end": 10.0, "turns": [0]},
+        {"start": 10.5, "end": 16.0, "turns": [1]},
+        {"start": 20.0, "end": 22.0, "turns": [2]},
+        {"start": 22.2, "end": 29.0, "turns": [3]},
+        {"start": 29.1, "end": 35.0, "turns": [4]},
+    ]
+
+    windows = pack_windows(units, window_seconds=30.0, min_fill=15.0)
+
+    assert [window["turns"] for window in windows] == [[0, 1], [2, 3, 4]]
+
+
+def test_long_units_get_their_own_window():
+    units = [
+        {"start": 0.0, "end": 45.0, "turns": [0]},
+        {"start": 46.0, "end": 47.0, "turns": [1]},
+    ]
+
+    windows = pack_windows(units)
+
+    assert [window["turns"] for window in windows] == [[0], [1]]
+
+
+def test_packing_stats_counts_saved_invocations():
+    turns = [(0.0, 1.0, "A"), (2.0, 3.0, "B"), (4.0, 5.0, "A")]
+
+    stats = packing_stats(turns, plan_windows(turns))
+
+    assert stats["windows"] == 1
+    assert stats["invocations_saved"] == 2
+    assert stats["speech_seconds"] == 3.0